@@ -22,12 +22,158 @@ class Settings(BaseSettings):
         "offline_access"
     ]
 
+    # Microsoft Graph HTTP client settings
+    GRAPH_API_URL: str = "https://graph.microsoft.com/v1.0"
+    GRAPH_MAX_CONNECTIONS: int = 100
+    GRAPH_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    GRAPH_KEEPALIVE_EXPIRY: float = 30.0
+    GRAPH_TIMEOUT: float = 30.0
+    GRAPH_HTTP2: bool = True
+    GRAPH_BATCH_SIZE: int = 20
+    GRAPH_BATCH_MAX_RETRIES: int = 3
+
+    # Microsoft Graph throttling settings
+    GRAPH_MAX_RETRIES: int = 5
+    GRAPH_BACKOFF_BASE: float = 0.5
+    GRAPH_BACKOFF_MAX: float = 60.0
+    GRAPH_MAILBOX_RATE: float = 15.0  # requests per second per mailbox
+    GRAPH_MAILBOX_BURST: float = 30.0
+    GRAPH_MAX_TRACKED_MAILBOXES: int = 1024
+    GRAPH_INITIAL_CONCURRENCY: int = 8
+    GRAPH_MIN_CONCURRENCY: int = 1
+    GRAPH_MAX_CONCURRENCY: int = 32
+
+    # Mailbox crawl settings
+    MAX_PREVIEW_EMAILS: int = 50
+    GRAPH_PAGE_SIZE: int = 100
+    CRAWL_CONCURRENCY: int = 4
+    CRAWL_QUEUE_SIZE: int = 500
+
+    # Attachment download settings
+    ATTACHMENT_MAX_BYTES: int = 25 * 1024 * 1024
+    ATTACHMENT_SPOOL_BYTES: int = 1024 * 1024
+    ATTACHMENT_CHUNK_BYTES: int = 64 * 1024
+
+    # Attachment parser pool settings
+    PARSER_WORKERS: int = 2
+    PARSER_QUEUE_SIZE: int = 32
+    PARSER_JOB_TIMEOUT: float = 60.0
+    PARSER_WORKER_MEMORY_MB: int = 1024
+
+    # Vector store settings
+    VECTOR_STORE_BACKEND: str = "qdrant"  # "qdrant" or "embedded"
+    QDRANT_URL: str = "http://localhost:6333"
+    QDRANT_API_KEY: Optional[str] = None
+    QDRANT_LOCATION: Optional[str] = None  # e.g. ":memory:" for local mode
+    QDRANT_COLLECTION: str = "email_knowledge"
+    VECTOR_UPSERT_BATCH_SIZE: int = 256
+    VECTOR_UPSERT_CONCURRENCY: int = 4
+    EMBEDDED_INDEX_DIR: str = "data/vector_index"
+    EMBEDDED_INDEX_MODE: str = "auto"  # "exact", "ivf" or "auto"
+    EMBEDDED_IVF_MIN_VECTORS: int = 1000000
+    EMBEDDED_IVF_LISTS: Optional[int] = None  # defaults to 4 * sqrt(n)
+    EMBEDDED_IVF_PROBES: int = 32
+    VECTOR_QUANTIZATION: str = "none"  # "none", "int8" or "pq"
+    VECTOR_PQ_COMPRESSION: int = 32  # float32 bytes per PQ code byte: 4, 8, 16, 32 or 64
+    VECTOR_RESCORE_OVERSAMPLING: float = 4.0  # candidates re-ranked in float32 per requested result
+    EMBEDDED_QUANTIZATION_MIN_VECTORS: int = 10000
+    EMBEDDED_COMPACT_MIN_DEAD_ROWS: int = 10000
+    EMBEDDED_COMPACT_DEAD_RATIO: float = 0.25  # deleted share of rows that triggers compaction
+
+    # Hybrid (BM25 + vector) search settings
+    LEXICAL_INDEX_DB: str = "data/lexical_index.db"
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    BM25_SKIP_COMMON_TERMS: bool = False  # approximate: ignore terms in over half the documents if rarer ones match
+    HYBRID_CANDIDATES: int = 50  # results fetched per leg before fusion
+    HYBRID_RRF_K: int = 60
+    SEARCH_COLLAPSE_OVERSAMPLING: int = 4  # chunk hits fetched per email result
+
+    # Chunking settings (tokens of the embedding model's tokenizer)
+    CHUNK_TOKENS: int = 512
+    CHUNK_OVERLAP_TOKENS: int = 64
+
+    # Bounded extraction limits for large attachments
+    ATTACHMENT_MAX_CHARS: Optional[int] = 20000
+    EXCEL_SAMPLE_ROWS: Optional[int] = 500
+    PDF_SAMPLE_PAGES: Optional[int] = 50
+
+    # Parsed attachment text cache settings
+    PARSE_CACHE_DB: str = "data/parse_cache.db"
+    PARSE_CACHE_MEMORY_BYTES: int = 64 * 1024 * 1024
+    PARSE_CACHE_DISK_BYTES: int = 1024 * 1024 * 1024
+
+    # Local state storage
+    DATA_DIR: str = "data"
+    SYNC_STATE_DB: str = "data/sync_state.db"
+
+    # Review store settings
+    REVIEW_DB: str = "data/reviews.db"
+    REVIEW_PAGE_SIZE: int = 100
+    REVIEW_MAX_PAGE_SIZE: int = 1000
+
+    # Indexing of approved reviews
+    INDEXING_BATCH_EMAILS: int = 100
+    INDEXING_CONCURRENCY: int = 2
+    INDEXING_JOB_HISTORY: int = 100  # finished jobs kept for progress queries
+
+    # Audit log settings
+    AUDIT_DIR: str = "data/audit"
+    AUDIT_COMPRESS_AFTER_MONTHS: int = 3  # monthly segments at least this old are gzipped
+    AUDIT_RETENTION_MONTHS: int = 0  # delete older segments; 0 keeps them forever
+    AUDIT_OPEN_ARCHIVES: int = 2  # decompressed archives kept open for queries
+
+    # Near-duplicate detection settings
+    DEDUP_ENABLED: bool = True
+    DEDUP_DB: str = "data/dedup.db"
+    DEDUP_THRESHOLD: float = 0.9  # estimated Jaccard similarity of word shingles
+    DEDUP_NUM_PERM: int = 128
+    DEDUP_SHINGLE_SIZE: int = 5
+
     # URLs
     FRONTEND_URL: str
     BACKEND_URL: str
 
     # OpenAI settings
     OPENAI_API_KEY: Optional[str] = None
+    LLM_MODEL: str = "gpt-4o-mini"
+    LLM_TEMPERATURE: float = 0.1
+    LLM_TOKENS_PER_MINUTE: int = 200000  # per model, shared by every caller
+    LLM_OUTPUT_TOKEN_ESTIMATE: int = 500  # reserved per email until actual usage is known
+    LLM_BATCHING_ENABLED: bool = True
+    LLM_BATCH_MAX_EMAIL_TOKENS: int = 300  # emails at most this long are batched
+    LLM_BATCH_MAX_EMAILS: int = 10
+    LLM_BATCH_MAX_PROMPT_TOKENS: int = 4000
+    LLM_BATCH_WINDOW_MS: float = 50.0
+    LLM_PROMPT_TOKEN_BUDGET: int = 6000  # email content per analysis, excluding instructions
+    LLM_PROMPT_REPLY_SHARE: float = 0.5  # guaranteed to the latest reply
+    LLM_PROMPT_SAMPLE_EXCERPTS: int = 4  # excerpts taken from an oversized attachment
+    LLM_INPUT_COST_PER_MTOK: float = 0.15  # USD, for forecasts
+    LLM_OUTPUT_COST_PER_MTOK: float = 0.60
+
+    # Analysis job queue settings
+    ANALYSIS_JOBS_DB: str = "data/analysis_jobs.db"
+    ANALYSIS_WORKERS: int = 8
+    ANALYSIS_LEASE_SECONDS: float = 300.0  # claimed items are retried elsewhere if not renewed in time
+
+    # Embedding settings
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_DIMENSION: int = 1536
+    EMBEDDING_BATCH_SIZE: int = 256  # inputs per request (API max 2048)
+    EMBEDDING_MAX_BATCH_TOKENS: int = 250000
+    EMBEDDING_MAX_INPUT_TOKENS: int = 8191
+    EMBEDDING_CONCURRENCY: int = 4
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0
+    EMBEDDING_CACHE_DB: str = "data/embedding_cache.db"
+    EMBEDDING_CACHE_MEMORY_BYTES: int = 128 * 1024 * 1024
+    EMBEDDING_CACHE_DISK_BYTES: int = 2 * 1024 * 1024 * 1024
+    EMBEDDING_CACHE_TTL: Optional[float] = 30 * 24 * 3600  # seconds
+
+    # LLM analysis cache settings
+    ANALYSIS_CACHE_DB: str = "data/analysis_cache.db"
+    ANALYSIS_CACHE_MEMORY_BYTES: int = 32 * 1024 * 1024
+    ANALYSIS_CACHE_DISK_BYTES: int = 512 * 1024 * 1024
+    ANALYSIS_CACHE_TTL: Optional[float] = 90 * 24 * 3600  # seconds
 
     # Deployment settings
     IS_KOYEB: bool = False
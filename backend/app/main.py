@@ -1,13 +1,41 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from .config import settings
-from .routes import auth, emails
+from .routes import auth, email, emails, review, vector
+from .services.analysis_jobs import analysis_queue
+from .services.audit import audit_log
+from .services.graph_client import graph_client
+from .services.parser import parsing_engine
+from .services.vector_store import get_vector_store
+from .utils.metrics import collect_metrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared Microsoft Graph connection pool
+    await graph_client.start()
+    # Start attachment parser worker processes
+    await parsing_engine.start()
+    # Start the LLM analysis worker pool
+    await analysis_queue.start()
+    # Archive audit segments that aged out while the app was down
+    await asyncio.to_thread(audit_log.rotate)
+    yield
+    await analysis_queue.close()
+    # Drain pooled connections on shutdown
+    await graph_client.close()
+    await parsing_engine.close()
+    await get_vector_store().close()
+
 
 app = FastAPI(
     title="Email Knowledge Base API",
     description="API for building and managing email knowledge base",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -22,6 +50,9 @@ app.add_middleware(
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(emails.router, prefix="/emails", tags=["emails"])
+app.include_router(email.router, prefix="/email", tags=["email"])
+app.include_router(review.router, prefix="/review", tags=["review"])
+app.include_router(vector.router, prefix="/vector", tags=["vector"])
 
 # OAuth2 scheme for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -32,4 +63,8 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
\ No newline at end of file
@@ -54,12 +54,21 @@ class EmailPreview(BaseModel):
 
 class EmailFilter(BaseModel):
     folder_id: Optional[str] = None
+    folder_ids: Optional[List[str]] = None
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     keywords: Optional[List[str]] = None
     sender: Optional[str] = None
 
 
+class EmailChangeSet(BaseModel):
+    folder_id: str
+    full_sync: bool = False
+    changed: List[EmailPreview] = Field(default_factory=list)
+    removed: List[str] = Field(default_factory=list)
+    analysis_job_id: Optional[str] = None  # job queued for the messages not analyzed yet
+
+
 class EmailAttachment(BaseModel):
     id: str
     name: str
@@ -104,6 +113,25 @@ class EmailReview(BaseModel):
     reviewed_at: Optional[datetime] = None
     reviewer_id: Optional[str] = None
     review_notes: Optional[str] = None
+    duplicate_of: Optional[str] = None  # email whose analysis was reused
+
+
+class ReviewSummary(BaseModel):
+    """Lightweight projection of an EmailReview for review lists"""
+    email_id: str
+    subject: str
+    sender: str
+    received_date: datetime
+    sensitivity: SensitivityLevel
+    department: Department
+    is_private: bool
+    summary: str
+    duplicate_of: Optional[str] = None
+
+
+class ReviewPage(BaseModel):
+    items: List[ReviewSummary]
+    next_cursor: Optional[str] = None  # pass back as `cursor` for the next page
 
 
 class EmailApproval(BaseModel):
@@ -1,15 +1,38 @@
+import json
+import httpx
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, AsyncIterator, Dict, Any
 from datetime import datetime
 
 from app.models.email import EmailPreview, EmailFilter, EmailContent
-from app.services.outlook import get_email_folders, get_email_preview, get_email_content
+from app.services.outlook import get_email_folders, get_email_preview, get_email_content, get_email_contents, crawl_email_previews
+from app.services.llm import estimate_analysis
+from app.services.sync import sync_mailbox
+from app.services.analysis_jobs import analysis_queue
 from app.routes.auth import get_current_user
 from app.models.user import User
 
 router = APIRouter()
 
 
+def _graph_error(e: Exception, message: str) -> HTTPException:
+    """Map a Graph failure to an HTTP error, passing throttling through as 503"""
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in (429, 503):
+        headers = {}
+        if "Retry-After" in e.response.headers:
+            headers["Retry-After"] = e.response.headers["Retry-After"]
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{message}: Microsoft Graph is throttling requests",
+            headers=headers or None
+        )
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"{message}: {str(e)}"
+    )
+
+
 @router.get("/folders", response_model=List[dict])
 async def list_folders(current_user: User = Depends(get_current_user)):
     """Get list of email folders from Outlook"""
@@ -23,10 +46,7 @@ async def list_folders(current_user: User = Depends(get_current_user)):
         folders = await get_email_folders(current_user.ms_token_data.access_token)
         return folders
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch folders: {str(e)}"
-        )
+        raise _graph_error(e, "Failed to fetch folders")
 
 
 @router.post("/preview", response_model=List[EmailPreview])
@@ -52,10 +72,41 @@ async def preview_emails(
         )
         return previews
     except Exception as e:
+        raise _graph_error(e, "Failed to fetch email previews")
+
+
+@router.post("/preview/stream")
+async def stream_preview_emails(
+    filter_params: EmailFilter,
+    max_results: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream previews of all matching emails as NDJSON while the mailbox is crawled"""
+    if not current_user.ms_token_data or not current_user.ms_token_data.access_token:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch email previews: {str(e)}"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Microsoft access token not available"
         )
+    
+    folder_ids = filter_params.folder_ids or ([filter_params.folder_id] if filter_params.folder_id else None)
+    
+    async def generate() -> AsyncIterator[str]:
+        try:
+            async for preview in crawl_email_previews(
+                access_token=current_user.ms_token_data.access_token,
+                folder_ids=folder_ids,
+                start_date=filter_params.start_date,
+                end_date=filter_params.end_date,
+                keywords=filter_params.keywords,
+                sender=filter_params.sender,
+                max_results=max_results
+            ):
+                yield preview.model_dump_json() + "\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band as the last line
+            yield json.dumps({"error": f"Failed to fetch email previews: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 
 @router.get("/content/{email_id}", response_model=EmailContent)
@@ -77,24 +128,122 @@ async def get_email(
         )
         return content
     except Exception as e:
+        raise _graph_error(e, "Failed to fetch email content")
+
+
+@router.post("/analyze", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
+async def analyze_emails(
+    email_ids: List[str],
+    current_user: User = Depends(get_current_user)
+):
+    """Queue emails for LLM analysis and return the job to poll"""
+    if not current_user.ms_token_data or not current_user.ms_token_data.access_token:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch email content: {str(e)}"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Microsoft access token not available"
         )
+    
+    # Persist the job; the worker pool fetches and analyzes the emails
+    job_id = await analysis_queue.submit(
+        current_user.id,
+        current_user.ms_token_data.access_token,
+        email_ids
+    )
+    return await analysis_queue.status(job_id)
 
 
-@router.post("/analyze", response_model=List[str])
-async def analyze_emails(
+@router.post("/analyze/estimate", response_model=Dict[str, Any])
+async def estimate_email_analysis(
     email_ids: List[str],
     current_user: User = Depends(get_current_user)
 ):
-    """Queue emails for LLM analysis"""
+    """Forecast per-email prompt tokens, cost and duration of analyzing emails, without calling the LLM"""
+    if not current_user.ms_token_data or not current_user.ms_token_data.access_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Microsoft access token not available"
+        )
+    
+    try:
+        contents = await get_email_contents(current_user.ms_token_data.access_token, email_ids)
+    except Exception as e:
+        raise _graph_error(e, "Failed to fetch email content")
+    estimate = estimate_analysis(list(contents.values()))
+    estimate["missing"] = [email_id for email_id in email_ids if email_id not in contents]
+    return estimate
+
+
+async def _get_owned_job(job_id: str, current_user: User) -> Dict[str, Any]:
+    job = await analysis_queue.status(job_id)
+    if job is None or job["user_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Analysis job not found"
+        )
+    return job
+
+
+@router.get("/analyze/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_analysis_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Get progress of an analysis job"""
+    return await _get_owned_job(job_id, current_user)
+
+
+@router.post("/analyze/jobs/{job_id}/resume", response_model=Dict[str, Any])
+async def resume_analysis_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Resume an unfinished job (e.g. after a restart) with the caller's current token"""
+    await _get_owned_job(job_id, current_user)
     if not current_user.ms_token_data or not current_user.ms_token_data.access_token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Microsoft access token not available"
         )
+    analysis_queue.resume(job_id, current_user.ms_token_data.access_token)
+    return await analysis_queue.status(job_id)
+
+
+@router.post("/sync", response_model=List[Dict[str, Any]])
+async def sync_emails(
+    filter_params: EmailFilter,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Incrementally sync folders and queue only new mail for analysis
+    Each folder's new messages become an analysis job; poll
+    /email/analyze/jobs/{job_id} for its progress.
+    """
+    if not current_user.ms_token_data or not current_user.ms_token_data.access_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Microsoft access token not available"
+        )
+    
+    access_token = current_user.ms_token_data.access_token
+    folder_ids = filter_params.folder_ids or ([filter_params.folder_id] if filter_params.folder_id else None)
+    
+    try:
+        change_sets = await sync_mailbox(
+            access_token=access_token,
+            user_id=current_user.id,
+            folder_ids=folder_ids,
+            start_date=filter_params.start_date
+        )
+    except Exception as e:
+        raise _graph_error(e, "Failed to sync emails")
     
-    # In a real implementation, this would add emails to a processing queue
-    # For now, we'll just return the IDs that were submitted for analysis
-    return email_ids
+    return [
+        {
+            "folder_id": changes.folder_id,
+            "full_sync": changes.full_sync,
+            "changed": len(changes.changed),
+            "removed": len(changes.removed),
+            "analysis_job": changes.analysis_job_id
+        }
+        for changes in change_sets
+    ]
@@ -1,52 +1,106 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Optional
-from datetime import datetime
+import asyncio
+import hashlib
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from typing import Any, Dict, List, Optional, Tuple
 
-from app.models.email import EmailReview, EmailApproval, ReviewStatus
+from app.config import settings
+from app.models.email import EmailReview, EmailApproval, ReviewStatus, ReviewPage
 from app.models.user import User
 from app.routes.auth import get_current_user
-from app.services.llm import analyze_email_content
+from app.services.indexing import indexing_pipeline, remove_from_index
+from app.services.review_store import review_store
 
 router = APIRouter()
 
-# In-memory storage for email reviews (replace with database in production)
-email_reviews = {}
 
+def _conditional_json(request: Request, payload: str) -> Response:
+    """
+    JSON response with an ETag of its body; 304 Not Modified when the
+    client's If-None-Match already holds that ETag
+    """
+    etag = f'"{hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
 
-@router.get("/pending", response_model=List[EmailReview])
+
+@router.get("/pending", response_model=ReviewPage)
 async def get_pending_reviews(
+    request: Request,
     department: Optional[str] = None,
     sensitivity: Optional[str] = None,
     is_private: Optional[bool] = None,
+    limit: int = Query(settings.REVIEW_PAGE_SIZE, ge=1, le=settings.REVIEW_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get list of emails pending review with optional filters"""
-    # Filter reviews based on query parameters
-    filtered_reviews = [
-        review for review in email_reviews.values()
-        if review.status == ReviewStatus.PENDING
-        and (department is None or review.analysis.department == department)
-        and (sensitivity is None or review.analysis.sensitivity == sensitivity)
-        and (is_private is None or review.analysis.is_private == is_private)
-    ]
+    """
+    Get a page of review summaries pending review with optional filters, newest first
+    Summaries leave out email bodies and attachments; fetch /review/{email_id}
+    for the full review. Pass next_cursor back as cursor for the next page.
+    """
+    try:
+        items, next_cursor = await asyncio.to_thread(
+            review_store.list_summaries,
+            status=ReviewStatus.PENDING,
+            department=department,
+            sensitivity=sensitivity,
+            is_private=is_private,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
-    return filtered_reviews
+    page = ReviewPage(items=items, next_cursor=next_cursor)
+    return _conditional_json(request, page.model_dump_json())
 
 
 @router.get("/{email_id}", response_model=EmailReview)
 async def get_review(
     email_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
-    """Get a specific email review by ID"""
-    review = email_reviews.get(email_id)
+    """Get a specific email review by ID, with its full content"""
+    review = await asyncio.to_thread(review_store.get, email_id)
     if not review:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Email review not found"
         )
     
-    return review
+    return _conditional_json(request, review.model_dump_json())
+
+
+async def _apply_decision(email_ids: List[str], approval: EmailApproval, current_user: User) -> Tuple[List[EmailReview], Optional[Dict[str, Any]]]:
+    """
+    Record a decision in one transaction, then update the knowledge base:
+    approved emails are queued for indexing, rejected ones are removed
+    from the index in bulk (and approved duplicates that relied on them are
+    indexed in their place)
+    """
+    decision = ReviewStatus.APPROVED if approval.approved else ReviewStatus.REJECTED
+    reviews = await asyncio.to_thread(review_store.set_status, email_ids, decision, current_user.id, approval.notes)
+    updated_ids = [review.email_id for review in reviews]
+    
+    if decision == ReviewStatus.APPROVED:
+        to_index = updated_ids
+    else:
+        try:
+            await remove_from_index(updated_ids)
+        except Exception as e:
+            print(f"Error removing rejected emails from the index: {str(e)}")
+        to_index = await asyncio.to_thread(review_store.duplicates_of, updated_ids, status=ReviewStatus.APPROVED)
+    
+    job = indexing_pipeline.submit(current_user.id, to_index) if to_index else None
+    return reviews, job
 
 
 @router.post("/{email_id}/approve", response_model=EmailReview)
@@ -56,45 +110,48 @@ async def approve_review(
     current_user: User = Depends(get_current_user)
 ):
     """Approve or reject an email for knowledge base inclusion"""
-    review = email_reviews.get(email_id)
-    if not review:
+    reviews, _ = await _apply_decision([email_id], approval, current_user)
+    if not reviews:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Email review not found"
         )
     
-    # Update review status
-    review.status = ReviewStatus.APPROVED if approval.approved else ReviewStatus.REJECTED
-    review.reviewed_at = datetime.now()
-    review.reviewer_id = current_user.id
-    review.review_notes = approval.notes
-    
-    # Save updated review
-    email_reviews[email_id] = review
-    
-    return review
+    return reviews[0]
 
 
-@router.post("/bulk-approve", response_model=List[EmailReview])
+@router.post("/bulk-approve", response_model=Dict[str, Any])
 async def bulk_approve(
     email_ids: List[str],
     approval: EmailApproval,
     current_user: User = Depends(get_current_user)
 ):
-    """Approve or reject multiple emails at once"""
-    updated_reviews = []
+    """
+    Approve or reject multiple emails at once
+    The decision is applied in a single transaction. Approved emails are
+    indexed by a background job; poll /review/indexing/{job_id} for progress.
+    """
+    reviews, job = await _apply_decision(email_ids, approval, current_user)
+    updated_ids = {review.email_id for review in reviews}
     
-    for email_id in email_ids:
-        review = email_reviews.get(email_id)
-        if review:
-            # Update review status
-            review.status = ReviewStatus.APPROVED if approval.approved else ReviewStatus.REJECTED
-            review.reviewed_at = datetime.now()
-            review.reviewer_id = current_user.id
-            review.review_notes = approval.notes
-            
-            # Save updated review
-            email_reviews[email_id] = review
-            updated_reviews.append(review)
+    return {
+        "updated": len(updated_ids),
+        "not_found": [email_id for email_id in dict.fromkeys(email_ids) if email_id not in updated_ids],
+        "indexing_job": job
+    }
+
+
+@router.get("/indexing/{job_id}", response_model=Dict[str, Any])
+async def get_indexing_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Get progress of a background indexing job"""
+    job = indexing_pipeline.status(job_id)
+    if job is None or job["user_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Indexing job not found"
+        )
     
-    return updated_reviews
+    return job
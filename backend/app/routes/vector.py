@@ -1,41 +1,54 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 from datetime import datetime
 
 from app.models.email import EmailVectorData, ReviewStatus
 from app.models.user import User
 from app.routes.auth import get_current_user
-from app.services.embedder import create_embedding, search_similar
+from app.services.chunker import build_chunk_records, clean_email_body
+from app.services.embedder import embed_records
+from app.services.lexical_index import lexical_index
+from app.services.search import hybrid_search
+from app.services.vector_store import get_vector_store
 from app.config import settings
 
 router = APIRouter()
 
 
-@router.post("/embed", response_model=EmailVectorData)
+@router.post("/embed", response_model=List[EmailVectorData])
 async def embed_email(
     email_id: str,
     content: str,
     metadata: Dict[str, Any],
     current_user: User = Depends(get_current_user)
 ):
-    """Create embedding for approved email content and store in vector database"""
-    # Generate embedding
+    """
+    Create embeddings for approved email content and store in vector database
+    The content is cleaned (HTML, quoted replies, signatures) and split into
+    overlapping token windows; each chunk gets its own vector linked to the email.
+    """
     try:
-        embedding = await create_embedding(content)
+        # Chunk the cleaned content and embed all chunks in batched calls
+        text = clean_email_body(content, is_html=bool(metadata.get("is_html")))
+        chunks = await embed_records(build_chunk_records(email_id, [("body", text)], metadata))
+        failed = sum(1 for chunk in chunks if chunk.embedding is None)
+        if failed:
+            raise RuntimeError(f"{failed} of {len(chunks)} chunks could not be embedded")
         
-        # Create vector data object
-        vector_data = EmailVectorData(
-            id=f"vec_{email_id}",
-            email_id=email_id,
-            content=content,
-            metadata=metadata,
-            embedding=embedding,
-            created_at=datetime.now()
+        # Replace any earlier chunks of this email, then store the vectors in
+        # the knowledge base and index their text for lexical search
+        store = get_vector_store()
+        await asyncio.gather(
+            store.delete_by_email_ids([email_id]),
+            lexical_index.delete_by_email_ids([email_id])
+        )
+        await asyncio.gather(
+            store.upsert(chunks),
+            lexical_index.add(chunks)
         )
         
-        # In a real implementation, this would store the vector in Qdrant
-        # For now, we'll just return the vector data object
-        return vector_data
+        return chunks
     
     except Exception as e:
         raise HTTPException(
@@ -50,31 +63,32 @@ async def search_vectors(
     limit: int = Query(10, ge=1, le=100),
     department: Optional[str] = None,
     sensitivity: Optional[str] = None,
+    tags: Optional[List[str]] = Query(None),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    mode: Literal["hybrid", "vector", "lexical"] = "hybrid",
     current_user: User = Depends(get_current_user)
 ):
-    """Search for similar vectors using semantic search"""
+    """
+    Search the knowledge base
+    Hybrid mode (the default) fuses semantic and BM25 keyword results, so
+    exact terms like invoice numbers, codenames and addresses still match.
+    """
     try:
-        # Generate embedding for the query
-        query_embedding = await create_embedding(query)
-        
-        # Search for similar vectors
-        # In a real implementation, this would search in Qdrant
-        # For now, we'll return a placeholder result
-        results = [
-            {
-                "id": f"result_{i}",
-                "email_id": f"email_{i}",
-                "content": f"Sample content for result {i}",
-                "metadata": {
-                    "department": department or "general",
-                    "sensitivity": sensitivity or "low",
-                    "tags": ["sample", "placeholder"],
-                    "created_at": datetime.now().isoformat()
-                },
-                "score": 0.9 - (i * 0.1)
-            }
-            for i in range(min(5, limit))
-        ]
+        # Search both legs, filtering on the server
+        filters = {
+            "department": department,
+            "sensitivity": sensitivity,
+            "tags": tags,
+            "start_date": start_date,
+            "end_date": end_date
+        }
+        results = await hybrid_search(
+            query,
+            limit=limit,
+            filters={key: value for key, value in filters.items() if value is not None},
+            mode=mode
+        )
         
         return results
     
@@ -91,6 +105,14 @@ async def delete_vector(
     current_user: User = Depends(get_current_user)
 ):
     """Delete a vector from the database"""
-    # In a real implementation, this would delete the vector from Qdrant
-    # For now, we'll just return a success response
+    try:
+        await asyncio.gather(
+            get_vector_store().delete([vector_id]),
+            lexical_index.delete([vector_id])
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete vector: {str(e)}"
+        )
     return None
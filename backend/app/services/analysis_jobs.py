@@ -0,0 +1,344 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models.email import EmailContent
+from app.services.outlook import get_email_contents
+from app.services.sync import analyze_and_store, match_duplicates
+from app.utils.metrics import register_collector
+
+# Item states; "running" items are leased to one queue and retried once the lease expires
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+class AnalysisJobStore:
+    """Persists analysis jobs and their per-email items in a local SQLite file"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.ANALYSIS_JOBS_DB
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                email_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                outcome TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (job_id, email_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (job_id, status, position);
+            """
+        )
+        # Items of files written before leases: running items without a lease count as expired
+        columns = [column for (_, column, *_) in self._conn.execute("PRAGMA table_info(job_items)")]
+        if "lease_owner" not in columns:
+            self._conn.execute("ALTER TABLE job_items ADD COLUMN lease_owner TEXT")
+            self._conn.execute("ALTER TABLE job_items ADD COLUMN lease_expires REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_job_items_lease ON job_items (status, lease_expires)")
+        self._conn.commit()
+
+    def create_job(self, user_id: str, email_ids: List[str]) -> str:
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, user_id, created_at) VALUES (?, ?, ?)",
+                (job_id, user_id, now)
+            )
+            self._conn.executemany(
+                """
+                INSERT OR IGNORE INTO job_items (job_id, email_id, position, status, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [(job_id, email_id, position, PENDING, now) for position, email_id in enumerate(email_ids)]
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim(self, job_id: str, limit: int, owner: str) -> List[str]:
+        """
+        Lease up to `limit` pending items of a job to `owner`, marking them
+        running, and return their email IDs
+        """
+        with self._lock:
+            email_ids = [
+                email_id for (email_id,) in self._conn.execute(
+                    "SELECT email_id FROM job_items WHERE job_id = ? AND status = ? ORDER BY position LIMIT ?",
+                    (job_id, PENDING, limit)
+                )
+            ]
+            self._conn.executemany(
+                """
+                UPDATE job_items
+                SET status = ?, attempts = attempts + 1, updated_at = ?, lease_owner = ?, lease_expires = ?
+                WHERE job_id = ? AND email_id = ?
+                """,
+                [
+                    (RUNNING, datetime.now().isoformat(), owner, time.time() + settings.ANALYSIS_LEASE_SECONDS, job_id, email_id)
+                    for email_id in email_ids
+                ]
+            )
+            self._conn.commit()
+        return email_ids
+
+    def complete(self, job_id: str, email_id: str, status: str, outcome: Optional[str] = None, error: Optional[str] = None) -> None:
+        self.complete_many(job_id, [email_id], status, outcome=outcome, error=error)
+
+    def complete_many(
+        self,
+        job_id: str,
+        email_ids: List[str],
+        status: str,
+        outcome: Optional[str] = None,
+        error: Optional[str] = None
+    ) -> None:
+        """Settle several items of a job with the same result in one transaction"""
+        updated_at = datetime.now().isoformat()
+        with self._lock:
+            self._conn.executemany(
+                """
+                UPDATE job_items
+                SET status = ?, outcome = ?, error = ?, updated_at = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE job_id = ? AND email_id = ?
+                """,
+                [(status, outcome, error, updated_at, job_id, email_id) for email_id in email_ids]
+            )
+            self._conn.commit()
+
+    def renew_leases(self, owner: str) -> None:
+        """Extend the leases of the items `owner` is still working on"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET lease_expires = ? WHERE status = ? AND lease_owner = ?",
+                (time.time() + settings.ANALYSIS_LEASE_SECONDS, RUNNING, owner)
+            )
+            self._conn.commit()
+
+    def requeue_expired(self) -> int:
+        """
+        Return running items whose lease has expired (their process stopped
+        or crashed) to the queue; items leased by live processes are left
+        alone. Returns how many were requeued.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                UPDATE job_items SET status = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?)
+                """,
+                (PENDING, RUNNING, time.time())
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT user_id, created_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            counts.update(dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall()))
+            outcomes = dict(self._conn.execute(
+                "SELECT outcome, COUNT(*) FROM job_items WHERE job_id = ? AND outcome IS NOT NULL GROUP BY outcome",
+                (job_id,)
+            ).fetchall())
+            errors = self._conn.execute(
+                "SELECT email_id, error FROM job_items WHERE job_id = ? AND status = ? LIMIT 20",
+                (job_id, FAILED)
+            ).fetchall()
+        return {
+            "job_id": job_id,
+            "user_id": job[0],
+            "created_at": job[1],
+            "total": sum(counts.values()),
+            **counts,
+            "outcomes": outcomes,
+            "errors": [{"email_id": email_id, "error": error} for email_id, error in errors]
+        }
+
+    def job_owner(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT user_id FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def is_finished(self, job_id: str) -> bool:
+        """Whether every item of the job is done or failed"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM job_items WHERE job_id = ? AND status IN (?, ?) LIMIT 1",
+                (job_id, PENDING, RUNNING)
+            ).fetchone()
+        return row is None
+
+
+class AnalysisQueue:
+    """
+    Asyncio worker pool draining the persistent analysis job queue
+    A dispatcher claims pending items in GRAPH_BATCH_SIZE groups, fetches
+    their content through Graph $batch and matches near-duplicates; up to
+    ANALYSIS_WORKERS workers then analyze emails concurrently, each LLM call
+    paced by the model's tokens-per-minute budget. Graph access tokens are
+    only held in memory: after a restart, unfinished jobs wait until their
+    owner resumes them with a fresh token.
+
+    Claimed items are leased to this queue for ANALYSIS_LEASE_SECONDS and
+    the lease is renewed while they are processed, so several app processes
+    can share the job file: only items whose lease ran out are retried.
+    """
+
+    def __init__(self, store: Optional[AnalysisJobStore] = None, workers: Optional[int] = None):
+        self.store = store or AnalysisJobStore()
+        self.workers = workers or settings.ANALYSIS_WORKERS
+        # Lease holder name of this queue's claims
+        self.owner = uuid.uuid4().hex
+        self._tokens: Dict[str, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        # Originals currently being analyzed; their duplicates wait on these
+        self._in_flight: Dict[str, asyncio.Event] = {}
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        await asyncio.to_thread(self.store.requeue_expired)
+        self._queue = asyncio.Queue(maxsize=self.workers * 2)
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._tasks = [asyncio.create_task(self._dispatch()), asyncio.create_task(self._keep_leases())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, user_id: str, access_token: str, email_ids: List[str]) -> str:
+        """Persist a job for the given emails and start processing it"""
+        job_id = await asyncio.to_thread(self.store.create_job, user_id, list(dict.fromkeys(email_ids)))
+        self.resume(job_id, access_token)
+        return job_id
+
+    def resume(self, job_id: str, access_token: str) -> None:
+        """
+        Attach a (fresh) access token to a job so its remaining items are
+        processed; only wakes the dispatcher, the store is not touched
+        """
+        self._tokens[job_id] = access_token
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await asyncio.to_thread(self.store.get_job, job_id)
+        if job is not None:
+            job["needs_resume"] = job[PENDING] > 0 and job_id not in self._tokens
+        return job
+
+    async def _dispatch(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                # Round-robin over active jobs so one large job doesn't starve the rest
+                claimed = True
+                while claimed:
+                    claimed = False
+                    for job_id, access_token in list(self._tokens.items()):
+                        email_ids = await asyncio.to_thread(self.store.claim, job_id, settings.GRAPH_BATCH_SIZE, self.owner)
+                        if not email_ids:
+                            if await asyncio.to_thread(self.store.is_finished, job_id):
+                                self._tokens.pop(job_id, None)
+                            continue
+                        claimed = True
+                        await self._enqueue(job_id, access_token, email_ids)
+            except Exception as e:
+                print(f"Error dispatching analysis jobs: {str(e)}")
+
+    async def _keep_leases(self) -> None:
+        """Renew this queue's leases and pick up items whose holder went away"""
+        while True:
+            await asyncio.sleep(settings.ANALYSIS_LEASE_SECONDS / 3)
+            try:
+                await asyncio.to_thread(self.store.renew_leases, self.owner)
+                if await asyncio.to_thread(self.store.requeue_expired):
+                    self._wakeup.set()
+            except Exception as e:
+                print(f"Error renewing analysis leases: {str(e)}")
+
+    async def _enqueue(self, job_id: str, access_token: str, email_ids: List[str]) -> None:
+        """Fetch a claimed group and hand its emails to the workers, originals first"""
+        try:
+            contents = await get_email_contents(access_token, email_ids)
+        except Exception as e:
+            await asyncio.to_thread(self.store.complete_many, job_id, email_ids, FAILED, error=str(e))
+            return
+        not_found = [email_id for email_id in email_ids if email_id not in contents]
+        if not_found:
+            await asyncio.to_thread(self.store.complete_many, job_id, not_found, FAILED, error="Email not found")
+
+        duplicates = await asyncio.to_thread(self._match_duplicates, job_id, contents)
+        items: List[Tuple[str, EmailContent]] = sorted(contents.items(), key=lambda item: item[0] in duplicates)
+        for email_id, content in items:
+            if email_id not in duplicates:
+                self._in_flight[email_id] = asyncio.Event()
+            await self._queue.put((job_id, access_token, email_id, content, duplicates.get(email_id)))
+
+    def _match_duplicates(self, job_id: str, contents: Dict[str, EmailContent]) -> Dict[str, str]:
+        """Duplicate matches within the job owner's mail (runs in a thread)"""
+        return match_duplicates(self.store.job_owner(job_id), contents)
+
+    async def _work(self) -> None:
+        while True:
+            job_id, access_token, email_id, content, original_id = await self._queue.get()
+            try:
+                if original_id in self._in_flight:
+                    await self._in_flight[original_id].wait()
+                outcome = await analyze_and_store(access_token, email_id, content, original_id)
+                await asyncio.to_thread(
+                    self.store.complete, job_id, email_id, DONE, outcome="duplicate" if "duplicates" in outcome else "analyzed"
+                )
+            except Exception as e:
+                print(f"Error analyzing email {email_id}: {str(e)}")
+                await asyncio.to_thread(self.store.complete, job_id, email_id, FAILED, error=str(e))
+            finally:
+                event = self._in_flight.pop(email_id, None)
+                if event is not None:
+                    event.set()
+                self._queue.task_done()
+                self._wakeup.set()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "active_jobs": len(self._tokens),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight_originals": len(self._in_flight)
+        }
+
+
+# Shared analysis queue, started with the app
+analysis_queue = AnalysisQueue()
+register_collector("analysis_queue", analysis_queue.metrics)
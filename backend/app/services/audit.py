@@ -1,8 +1,382 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 
-# In-memory storage for audit logs (replace with database in production)
-audit_logs = []
+import numpy as np
+
+from app.config import settings
+from app.utils.metrics import register_collector
+
+# One SQLite segment per month of log time; older ones are gzipped in place
+SEGMENT_PATTERN = re.compile(r"^audit-(\d{4}-\d{2})\.db(\.gz)?$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    action_type TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    resource_id TEXT,
+    details TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp);
+CREATE INDEX IF NOT EXISTS idx_logs_user ON logs (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_logs_action ON logs (action_type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_logs_resource ON logs (resource_id, timestamp);
+"""
+
+
+# False-positive rate of the per-archive filters on user and resource IDs
+FILTER_ERROR_RATE = 0.01
+
+
+def _month_number(month: str) -> int:
+    year, number = month.split("-")
+    return int(year) * 12 + int(number) - 1
+
+
+class SegmentFilter:
+    """
+    What an archived segment may contain: a Bloom filter over its user and
+    resource IDs plus the exact set of its action types, so queries skip
+    archives without decompressing them
+    """
+
+    def __init__(self, bits: np.ndarray, hashes: int, action_types: List[str]):
+        self.bits = bits
+        self.hashes = hashes
+        self.action_types = set(action_types)
+
+    @staticmethod
+    def _positions(key: str, size: int, hashes: int) -> List[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + index * second) % size for index in range(hashes)]
+
+    @classmethod
+    def build(cls, keys: Iterable[str], count: int, action_types: List[str]) -> "SegmentFilter":
+        size = max(64, int(-max(count, 1) * math.log(FILTER_ERROR_RATE) / math.log(2) ** 2))
+        hashes = max(1, round(size / max(count, 1) * math.log(2)))
+        bits = np.zeros(size, dtype=bool)
+        for key in keys:
+            bits[cls._positions(key, size, hashes)] = True
+        return cls(bits, hashes, action_types)
+
+    def may_contain(self, user_id: Optional[str], action_type: Optional[str], resource_id: Optional[str]) -> bool:
+        if action_type and action_type not in self.action_types:
+            return False
+        for key in (f"u:{user_id}" if user_id else None, f"r:{resource_id}" if resource_id else None):
+            if key and not self.bits[self._positions(key, len(self.bits), self.hashes)].all():
+                return False
+        return True
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as file:
+            np.savez_compressed(
+                file,
+                bits=np.packbits(self.bits),
+                size=len(self.bits),
+                hashes=self.hashes,
+                action_types=np.array(sorted(self.action_types), dtype=str)
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentFilter":
+        data = np.load(path)
+        bits = np.unpackbits(data["bits"])[:int(data["size"])].astype(bool)
+        return cls(bits, int(data["hashes"]), data["action_types"].tolist())
+
+
+class AuditLog:
+    """
+    Append-only audit log in monthly SQLite segments
+    Every filterable column is indexed together with the timestamp, so a
+    query reads its newest matching rows straight off an index and stops at
+    `limit`. Segments cover disjoint months and are visited newest first, so
+    older segments are only opened while the limit is not yet filled. Log
+    IDs are random UUIDs, unique across worker processes sharing the
+    directory. Segments older than AUDIT_COMPRESS_AFTER_MONTHS are gzipped
+    next to a SegmentFilter; a query only decompresses an archive (to a
+    temporary file) when its filter says it may hold matching rows.
+    Decompression holds only that month's lock, so appends and queries of
+    other segments carry on meanwhile.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.AUDIT_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segments: Dict[str, sqlite3.Connection] = {}
+        # Decompressed archives: month -> (temporary path, connection), guarded by _archive_lock
+        self._archive_lock = threading.Lock()
+        self._archives: "OrderedDict[str, Tuple[str, sqlite3.Connection]]" = OrderedDict()
+        # Held while a month is being decompressed, so it only happens once
+        self._decompressing: Dict[str, threading.Lock] = {}
+        self._filters: Dict[str, Optional[SegmentFilter]] = {}
+        self._current_month: Optional[str] = None
+
+    def _path(self, month: str) -> str:
+        return os.path.join(self.directory, f"audit-{month}.db")
+
+    def _list_segments(self) -> List[Tuple[str, bool]]:
+        """(month, compressed) of every segment, newest first"""
+        segments = {}
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                # An uncompressed copy wins while compression is in progress
+                segments[match.group(1)] = segments.get(match.group(1), True) and bool(match.group(2))
+        return sorted(segments.items(), reverse=True)
+
+    def _segment(self, month: str, create: bool = False) -> Optional[sqlite3.Connection]:
+        """Connection to a live segment; None if it doesn't exist and create is False"""
+        path = self._path(month)
+        conn = self._segments.get(month)
+        if conn is not None:
+            if os.path.exists(path):
+                return conn
+            # Compressed by another worker since it was opened
+            conn.close()
+            del self._segments[month]
+        if not create and not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+        self._segments[month] = conn
+        return conn
+
+    def _filter(self, month: str) -> Optional[SegmentFilter]:
+        """An archive's filter (None if missing, e.g. written by an older version)"""
+        if month not in self._filters:
+            path = self._path(month) + ".filter"
+            try:
+                self._filters[month] = SegmentFilter.load(path) if os.path.exists(path) else None
+            except Exception as e:
+                print(f"Error loading audit segment filter {month}: {str(e)}")
+                self._filters[month] = None
+        return self._filters[month]
+
+    def _decompress(self, month: str) -> str:
+        """Path of a temporary, decompressed copy of an archived segment"""
+        fd, path = tempfile.mkstemp(prefix=f"audit-{month}-", suffix=".db")
+        with os.fdopen(fd, "wb") as target, gzip.open(self._path(month) + ".gz", "rb") as source:
+            shutil.copyfileobj(source, target)
+        return path
+
+    def _query_archive(self, month: str, sql: str, params: List[Any]) -> List[Tuple]:
+        """Run a query on an archived segment, decompressing it first if it isn't open"""
+        with self._archive_lock:
+            if month in self._archives:
+                self._archives.move_to_end(month)
+                return self._archives[month][1].execute(sql, params).fetchall()
+            month_lock = self._decompressing.setdefault(month, threading.Lock())
+        with month_lock:
+            with self._archive_lock:
+                entry = self._archives.get(month)
+            path = None
+            if entry is None:
+                path = self._decompress(month)
+                entry = (path, sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False))
+            with self._archive_lock:
+                self._archives.setdefault(month, entry)
+                self._archives.move_to_end(month)
+                rows = self._archives[month][1].execute(sql, params).fetchall()
+                while len(self._archives) > max(1, settings.AUDIT_OPEN_ARCHIVES):
+                    _, (old_path, old_conn) = self._archives.popitem(last=False)
+                    old_conn.close()
+                    os.remove(old_path)
+        return rows
+
+    def append(
+        self,
+        action_type: str,
+        user_id: str,
+        resource_id: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        log_entry = {
+            "id": f"log_{uuid.uuid4().hex}",
+            "timestamp": datetime.now().isoformat(),
+            "action_type": action_type,
+            "user_id": user_id,
+            "resource_id": resource_id,
+            "details": details or {}
+        }
+        month = log_entry["timestamp"][:7]
+        with self._lock:
+            conn = self._segment(month, create=True)
+            conn.execute(
+                """
+                INSERT INTO logs (id, timestamp, action_type, user_id, resource_id, details)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    log_entry["id"], log_entry["timestamp"], action_type, user_id, resource_id,
+                    json.dumps(log_entry["details"])
+                )
+            )
+            conn.commit()
+            new_month = self._current_month is not None and month != self._current_month
+            self._current_month = month
+
+        # The first entry of a month closes the previous one; archive what aged out
+        if new_month:
+            self.rotate()
+        return log_entry
+
+    def query(
+        self,
+        user_id: Optional[str] = None,
+        action_type: Optional[str] = None,
+        resource_id: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """The newest `limit` entries matching every given filter"""
+        clauses, params = [], []
+        for column, value in (("user_id", user_id), ("action_type", action_type), ("resource_id", resource_id)):
+            if value:
+                # A handful of action types match far more rows than one user or
+                # resource; "+" keeps the planner off the action index then
+                selective = column == "action_type" and (user_id or resource_id)
+                clauses.append(f"{'+' if selective else ''}{column} = ?")
+                params.append(value)
+        start = start_time.isoformat() if start_time else None
+        end = end_time.isoformat() if end_time else None
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            clauses.append("timestamp <= ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        sql = f"""
+            SELECT id, timestamp, action_type, user_id, resource_id, details FROM logs {where}
+            ORDER BY timestamp DESC, seq DESC
+            LIMIT ?
+        """
+        rows = []
+        for month, compressed in self._list_segments():
+            if len(rows) >= limit or (start and month < start[:7]):
+                break
+            if end and month > end[:7]:
+                continue
+            if compressed:
+                segment_filter = self._filter(month)
+                if segment_filter and not segment_filter.may_contain(user_id, action_type, resource_id):
+                    continue
+                rows += self._query_archive(month, sql, params + [limit - len(rows)])
+                continue
+            with self._lock:
+                conn = self._segment(month)
+                if conn is not None:
+                    rows += conn.execute(sql, params + [limit - len(rows)]).fetchall()
+
+        return [
+            {
+                "id": log_id,
+                "timestamp": timestamp,
+                "action_type": row_action_type,
+                "user_id": row_user_id,
+                "resource_id": row_resource_id,
+                "details": json.loads(details)
+            }
+            for log_id, timestamp, row_action_type, row_user_id, row_resource_id, details in rows
+        ]
+
+    def _compress(self, month: str) -> None:
+        """Checkpoint a closed segment into a single file and replace it with a gzip archive"""
+        path = self._path(month)
+        with self._lock:
+            conn = self._segments.pop(month, None)
+            if conn is not None:
+                conn.close()
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA journal_mode=DELETE")
+        # Distinct values come straight off the indexes
+        users = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM logs")]
+        resources = [row[0] for row in conn.execute("SELECT DISTINCT resource_id FROM logs WHERE resource_id IS NOT NULL")]
+        action_types = [row[0] for row in conn.execute("SELECT DISTINCT action_type FROM logs")]
+        conn.close()
+        SegmentFilter.build(
+            [f"u:{user_id}" for user_id in users] + [f"r:{resource_id}" for resource_id in resources],
+            len(users) + len(resources),
+            action_types
+        ).save(path + ".filter")
+
+        temp_path = f"{path}.gz.tmp-{uuid.uuid4().hex}"
+        with open(path, "rb") as source, gzip.open(temp_path, "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.replace(temp_path, path + ".gz")
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def rotate(self) -> Dict[str, int]:
+        """
+        Compress segments at least AUDIT_COMPRESS_AFTER_MONTHS old and
+        delete those past AUDIT_RETENTION_MONTHS (0 keeps them forever)
+        """
+        stats = {"compressed": 0, "deleted": 0}
+        current = _month_number(datetime.now().strftime("%Y-%m"))
+        # The current month's segment is always live
+        compress_after = max(1, settings.AUDIT_COMPRESS_AFTER_MONTHS)
+        for month, compressed in self._list_segments():
+            age = current - _month_number(month)
+            try:
+                if settings.AUDIT_RETENTION_MONTHS and age >= settings.AUDIT_RETENTION_MONTHS:
+                    with self._lock:
+                        conn = self._segments.pop(month, None)
+                        if conn is not None:
+                            conn.close()
+                    self._filters.pop(month, None)
+                    for suffix in (".gz", ".filter", "", "-wal", "-shm"):
+                        try:
+                            os.remove(self._path(month) + suffix)
+                        except FileNotFoundError:
+                            pass
+                    stats["deleted"] += 1
+                elif not compressed and age >= compress_after:
+                    self._compress(month)
+                    stats["compressed"] += 1
+            except Exception as e:
+                # Another worker may be rotating the same segment
+                print(f"Error rotating audit segment {month}: {str(e)}")
+        return stats
+
+    def metrics(self) -> Dict[str, Any]:
+        segments = self._list_segments()
+        return {
+            "segments": len(segments),
+            "compressed_segments": sum(1 for _, compressed in segments if compressed),
+            "open_archives": len(self._archives)
+        }
+
+
+# Shared audit log
+audit_log = AuditLog()
+register_collector("audit", audit_log.metrics)
 
 
 async def log_action(
@@ -13,26 +387,14 @@ async def log_action(
 ) -> Dict[str, Any]:
     """
     Log an action performed by a user
-    
+
     Parameters:
     - action_type: Type of action (e.g., "login", "approve_email", "reject_email")
     - user_id: ID of the user performing the action
     - resource_id: Optional ID of the resource being acted upon
     - details: Optional additional details about the action
     """
-    log_entry = {
-        "id": f"log_{len(audit_logs) + 1}",
-        "timestamp": datetime.now().isoformat(),
-        "action_type": action_type,
-        "user_id": user_id,
-        "resource_id": resource_id,
-        "details": details or {}
-    }
-    
-    # Store log entry
-    audit_logs.append(log_entry)
-    
-    return log_entry
+    return await asyncio.to_thread(audit_log.append, action_type, user_id, resource_id, details)
 
 
 async def get_logs(
@@ -44,30 +406,8 @@ async def get_logs(
     limit: int = 100
 ) -> List[Dict[str, Any]]:
     """
-    Get audit logs with optional filtering
+    Get audit logs with optional filtering, newest first
     """
-    filtered_logs = audit_logs
-    
-    # Apply filters
-    if user_id:
-        filtered_logs = [log for log in filtered_logs if log["user_id"] == user_id]
-    
-    if action_type:
-        filtered_logs = [log for log in filtered_logs if log["action_type"] == action_type]
-    
-    if resource_id:
-        filtered_logs = [log for log in filtered_logs if log["resource_id"] == resource_id]
-    
-    if start_time:
-        start_time_str = start_time.isoformat()
-        filtered_logs = [log for log in filtered_logs if log["timestamp"] >= start_time_str]
-    
-    if end_time:
-        end_time_str = end_time.isoformat()
-        filtered_logs = [log for log in filtered_logs if log["timestamp"] <= end_time_str]
-    
-    # Sort by timestamp (newest first) and limit results
-    sorted_logs = sorted(filtered_logs, key=lambda x: x["timestamp"], reverse=True)
-    limited_logs = sorted_logs[:limit]
-    
-    return limited_logs
+    return await asyncio.to_thread(
+        audit_log.query, user_id, action_type, resource_id, start_time, end_time, limit
+    )
@@ -0,0 +1,182 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import tiktoken
+from bs4 import BeautifulSoup
+
+from app.config import settings
+from app.models.email import EmailContent, EmailVectorData
+
+# Elements that hold quoted replies in Outlook, Gmail and Apple Mail HTML
+QUOTE_SELECTORS = [
+    "blockquote",
+    "div.gmail_quote",
+    "div#divRplyFwdMsg",
+    "div#appendonsend",
+    "div.moz-cite-prefix",
+]
+
+# A line that starts the quoted part of a plain-text reply
+REPLY_HEADER_PATTERNS = [
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^-{2,}\s*Forwarded message\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^On .{0,200}wrote:\s*$", re.IGNORECASE),
+    re.compile(r"^From:\s.+", re.IGNORECASE),
+    re.compile(r"^_{10,}\s*$"),
+]
+
+# A line that starts a signature block
+SIGNATURE_PATTERNS = [
+    re.compile(r"^--\s*$"),
+    re.compile(r"^Sent from my \w+", re.IGNORECASE),
+    re.compile(r"^Get Outlook for \w+", re.IGNORECASE),
+]
+
+# A closing line on its own ("Thanks,", "Best regards"); only treated as a
+# signature near the end of the message and when a name follows
+SIGN_OFF_PATTERN = re.compile(
+    r"^(?:(?:best|kind|warm)(?:\s+(?:regards|wishes))?|regards|(?:many\s+)?thanks(?:\s+again)?"
+    r"|thank\s+you|cheers|(?:yours\s+)?sincerely)[\s,.!]*$",
+    re.IGNORECASE
+)
+# A short name line such as "Bob", "Mary-Jane O'Neil" or "J. Smith"
+NAME_LINE_PATTERN = re.compile(r"^[^\W\d_][\w.'-]*(?:\s+[^\W\d_][\w.'-]*){0,3}$")
+SIGN_OFF_MAX_TRAILING_LINES = 6
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer() -> tiktoken.Encoding:
+    """Local tokenizer matching the embedding model"""
+    try:
+        return tiktoken.encoding_for_model(settings.EMBEDDING_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer().encode(text, disallowed_special=()))
+
+
+def html_to_text(html: str, keep_quotes: bool = False) -> str:
+    """Visible text of an HTML body, without styles, scripts or (unless kept) quoted replies"""
+    soup = BeautifulSoup(html, "lxml")
+    for element in soup(["script", "style", "head"]):
+        element.decompose()
+    if not keep_quotes:
+        for selector in QUOTE_SELECTORS:
+            for element in soup.select(selector):
+                element.decompose()
+    return soup.get_text("\n")
+
+
+def split_quoted_history(text: str) -> Tuple[str, str]:
+    """Split text into the new reply and the quoted history (">" lines and everything from the first reply header)"""
+    lines = text.splitlines()
+    reply, history = [], []
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if any(pattern.match(stripped) for pattern in REPLY_HEADER_PATTERNS):
+            history.extend(lines[index:])
+            break
+        (history if stripped.startswith(">") else reply).append(line)
+    return "\n".join(reply), "\n".join(history)
+
+
+def strip_quoted_replies(text: str) -> str:
+    """Cut the text at the first reply header and drop ">"-quoted lines"""
+    return split_quoted_history(text)[0]
+
+
+def strip_signature(text: str) -> str:
+    """Cut a trailing signature block (delimiter, device footer, or a sign-off line followed by a name)"""
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if any(pattern.match(stripped) for pattern in SIGNATURE_PATTERNS):
+            return "\n".join(lines[:index])
+        if index > 0 and SIGN_OFF_PATTERN.match(stripped):
+            trailing = [rest.strip() for rest in lines[index + 1:] if rest.strip()]
+            if (
+                trailing
+                and len(trailing) <= SIGN_OFF_MAX_TRAILING_LINES
+                and NAME_LINE_PATTERN.match(trailing[0])
+            ):
+                return "\n".join(lines[:index])
+    return text
+
+
+def collapse_whitespace(text: str) -> str:
+    text = re.sub(r"[ \t\u00a0]+", " ", text)
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+
+def clean_email_body(body: str, is_html: bool = False) -> str:
+    """
+    Reduce an email body to the new text it contributes
+    HTML is flattened, quoted reply chains and signatures are removed and
+    whitespace is collapsed.
+    """
+    text = html_to_text(body) if is_html else body
+    cleaned = collapse_whitespace(strip_signature(strip_quoted_replies(text)))
+    # A bare forward is all quote; keep it rather than embed nothing
+    return cleaned or collapse_whitespace(text)
+
+
+def chunk_text(
+    text: str,
+    chunk_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None
+) -> List[str]:
+    """Split text into windows of at most chunk_tokens tokens, overlapping by overlap_tokens"""
+    chunk_tokens = chunk_tokens or settings.CHUNK_TOKENS
+    overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    tokenizer = get_tokenizer()
+    tokens = tokenizer.encode(text, disallowed_special=())
+    if not tokens:
+        return []
+    if len(tokens) <= chunk_tokens:
+        return [text]
+
+    step = max(1, chunk_tokens - overlap_tokens)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunks.append(tokenizer.decode(tokens[start:start + chunk_tokens]))
+        if start + chunk_tokens >= len(tokens):
+            break
+    return chunks
+
+
+def build_chunk_records(
+    email_id: str,
+    sections: List[tuple],
+    metadata: Dict[str, Any]
+) -> List[EmailVectorData]:
+    """
+    One unembedded record per chunk of each (source, text) section
+    Records are numbered per email (vec_<email_id>_<n>) and carry the
+    parent email_id, so search can collapse chunk hits back to emails.
+    """
+    chunks = [
+        (source, chunk)
+        for source, text in sections
+        for chunk in chunk_text(text)
+    ]
+    return [
+        EmailVectorData(
+            id=f"vec_{email_id}_{index}",
+            email_id=email_id,
+            content=chunk,
+            metadata={**metadata, "chunk_index": index, "chunk_count": len(chunks), "source": source}
+        )
+        for index, (source, chunk) in enumerate(chunks)
+    ]
+
+
+def chunk_email(email: EmailContent, metadata: Dict[str, Any]) -> List[EmailVectorData]:
+    """Chunk records for an email's cleaned body and its parsed attachments"""
+    sections = [("body", clean_email_body(email.body, email.is_html))]
+    for attachment in email.attachments or []:
+        if attachment.content and not attachment.content.startswith("[Error"):
+            sections.append((f"attachment:{attachment.name}", attachment.content))
+    return build_chunk_records(email.id, sections, metadata)
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.models.email import EmailContent
+from app.services.chunker import clean_email_body
+from app.utils.metrics import register_collector
+
+# Prime modulus for the MinHash permutations (just above 2^32)
+MINHASH_PRIME = 4294967311
+
+
+def _optimal_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Split num_perm hashes into (bands, rows) so the LSH collision curve
+    crosses 50% near the similarity threshold: (1 / bands) ** (1 / rows)
+    """
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+def normalize_text(email: EmailContent) -> str:
+    """Body text with quotes, signatures, markup, case and punctuation removed, plus attachment names"""
+    text = clean_email_body(email.body, email.is_html)
+    names = " ".join(attachment.name for attachment in email.attachments or [])
+    return " ".join(re.findall(r"\w+", f"{text} {names}".lower()))
+
+
+class DuplicateDetector:
+    """
+    MinHash + LSH index of analyzed emails for near-duplicate lookup
+    Each email's normalized text is shingled into word n-grams and reduced
+    to a MinHash signature whose agreement rate estimates Jaccard
+    similarity. Signatures are banded into SQLite buckets, so a lookup only
+    compares against emails sharing at least one band. Buckets are kept per
+    owner, so one user's mail never matches (and reuses the analysis of)
+    another user's.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        threshold: Optional[float] = None,
+        num_perm: Optional[int] = None,
+        shingle_size: Optional[int] = None
+    ):
+        self.db_path = db_path or settings.DEDUP_DB
+        self.threshold = threshold if threshold is not None else settings.DEDUP_THRESHOLD
+        self.num_perm = num_perm or settings.DEDUP_NUM_PERM
+        self.shingle_size = shingle_size or settings.DEDUP_SHINGLE_SIZE
+        self.bands, self.rows = _optimal_bands(self.num_perm, self.threshold)
+
+        rng = np.random.default_rng(0)
+        self._a = rng.integers(1, 2 ** 31, self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 31, self.num_perm, dtype=np.uint64)
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                email_id TEXT PRIMARY KEY,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                owner TEXT NOT NULL DEFAULT '',
+                band INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                email_id TEXT NOT NULL
+            );
+            """
+        )
+        # Indexes written before buckets were per owner: their rows match no owner
+        columns = [column for (_, column, *_) in self._conn.execute("PRAGMA table_info(buckets)")]
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE buckets ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        self._conn.executescript(
+            """
+            DROP INDEX IF EXISTS idx_buckets_band_bucket;
+            CREATE INDEX IF NOT EXISTS idx_buckets_owner_band_bucket ON buckets (owner, band, bucket);
+            CREATE INDEX IF NOT EXISTS idx_buckets_email_id ON buckets (email_id);
+            """
+        )
+        self._conn.commit()
+
+        # Work saved by reusing analyses, since process start
+        self.stats = {
+            "lookups": 0,
+            "duplicates": 0,
+            "llm_calls_saved": 0,
+            "llm_tokens_saved": 0,
+            "embedding_tokens_saved": 0
+        }
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (num_perm uint32 values) of the text's word shingles"""
+        words = text.split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % MINHASH_PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[str]:
+        return [
+            hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).hexdigest()
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        """Estimated Jaccard similarity of two signatures"""
+        return float(np.mean(first == second))
+
+    def find(self, owner: str, signature: np.ndarray, exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """The owner's most similar indexed email at or above the threshold, with its similarity"""
+        keys = self._band_keys(signature)
+        with self._lock:
+            self.stats["lookups"] += 1
+            candidates = {
+                email_id
+                for band, key in enumerate(keys)
+                for (email_id,) in self._conn.execute(
+                    "SELECT email_id FROM buckets WHERE owner = ? AND band = ? AND bucket = ?", (owner, band, key)
+                )
+            }
+            candidates.discard(exclude)
+            best = None
+            for email_id in candidates:
+                row = self._conn.execute("SELECT signature FROM signatures WHERE email_id = ?", (email_id,)).fetchone()
+                if row is None:
+                    continue
+                score = self.similarity(signature, np.frombuffer(row[0], dtype=np.uint32))
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (email_id, score)
+            return best
+
+    def add(self, owner: str, email_id: str, signature: np.ndarray) -> None:
+        """Index an email's signature under its owner, replacing any earlier one"""
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets WHERE email_id = ?", (email_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO signatures (email_id, signature) VALUES (?, ?)",
+                (email_id, signature.tobytes())
+            )
+            self._conn.executemany(
+                "INSERT INTO buckets (owner, band, bucket, email_id) VALUES (?, ?, ?, ?)",
+                [(owner, band, key, email_id) for band, key in enumerate(self._band_keys(signature))]
+            )
+            self._conn.commit()
+
+    def remove(self, email_ids: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM buckets WHERE email_id = ?", [(email_id,) for email_id in email_ids])
+            self._conn.executemany("DELETE FROM signatures WHERE email_id = ?", [(email_id,) for email_id in email_ids])
+            self._conn.commit()
+
+    def record_reuse(self, llm_tokens: int, embedding_tokens: int) -> None:
+        """Count one duplicate whose analysis (and embeddings) were reused"""
+        with self._lock:
+            self.stats["duplicates"] += 1
+            self.stats["llm_calls_saved"] += 1
+            self.stats["llm_tokens_saved"] += llm_tokens
+            self.stats["embedding_tokens_saved"] += embedding_tokens
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "threshold": self.threshold, "bands": self.bands, "rows": self.rows}
+
+
+# Shared near-duplicate index
+duplicate_detector = DuplicateDetector()
+register_collector("dedup", duplicate_detector.metrics)
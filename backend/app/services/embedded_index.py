@@ -0,0 +1,783 @@
+import asyncio
+import json
+import math
+import os
+import sqlite3
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.models.email import EmailVectorData
+from app.services.quantization import kmeans, assign, make_quantizer
+from app.services.vector_store import VectorStore, _payload, _timestamp
+from app.utils.metrics import register_collector
+
+# Columns with a dense in-memory code array usable as a pre-filter mask
+CATEGORY_COLUMNS = ["department", "sensitivity"]
+
+# Rows handled per matrix product when scanning, to bound temporary memory
+SCAN_CHUNK_ROWS = 65536
+
+# Bound parameters per SQLite IN (...) query
+SQL_CHUNK_SIZE = 500
+
+
+class _Snapshot(NamedTuple):
+    """The index state one search scans, captured under the lock"""
+    generation: int
+    count: int
+    vectors: np.ndarray
+    quantizer: Any
+    quantized: Optional[np.ndarray]
+    centroids: Optional[np.ndarray]
+    assignments: np.ndarray
+
+
+def _padded(values: np.ndarray, capacity: int, fill) -> np.ndarray:
+    padded = np.full(capacity, fill, dtype=values.dtype)
+    padded[:len(values)] = values
+    return padded
+
+
+class EmbeddedVectorStore(VectorStore):
+    """
+    In-process vector index for deployments without a Qdrant server
+    Unit-normalized float32 embeddings live in one contiguous memory-mapped
+    matrix, so cosine similarity is a single matrix-vector product and top-k
+    is taken with argpartition. Payloads live in a SQLite side table; only
+    the category, date and liveness columns needed for pre-filtering are
+    kept in memory. Above EMBEDDED_IVF_MIN_VECTORS (or with mode "ivf"), a
+    k-means coarse quantizer restricts each search to the closest lists.
+    With quantization ("int8" or "pq"), searches scan a compact code matrix
+    instead and only re-rank the best candidates against the float32 rows,
+    so the full-precision matrix is paged in for a handful of rows per query.
+
+    Searches scan a snapshot taken under the lock, off the event loop.
+    Training the coarse quantizer and the code quantizer, and compacting
+    away deleted rows, run as a background task started by writes; until a
+    quantizer is trained, searches fall back to the exact scan.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        dimension: Optional[int] = None,
+        mode: Optional[str] = None,
+        quantization: Optional[str] = None
+    ):
+        self.directory = directory or settings.EMBEDDED_INDEX_DIR
+        self.dimension = dimension or settings.EMBEDDING_DIMENSION
+        self.mode = mode or settings.EMBEDDED_INDEX_MODE
+        self.quantizer = make_quantizer(
+            quantization or settings.VECTOR_QUANTIZATION,
+            self.dimension,
+            settings.VECTOR_PQ_COMPRESSION
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        self._centroids_path = os.path.join(self.directory, "ivf_centroids.npy")
+        if self.quantizer is not None:
+            self._quantizer_path = os.path.join(self.directory, f"quantizer_{self.quantizer.kind}.npz")
+        self._lock = asyncio.Lock()
+        self._maintenance: Optional[asyncio.Future] = None
+        # Rows rewritten in place while a quantizer trains on a snapshot
+        self._rewritten: Optional[List[int]] = None
+
+        self._conn = sqlite3.connect(os.path.join(self.directory, "rows.db"), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                vector_id TEXT NOT NULL UNIQUE,
+                email_id TEXT NOT NULL,
+                department TEXT,
+                sensitivity TEXT,
+                received_ts REAL,
+                payload TEXT NOT NULL,
+                alive INTEGER NOT NULL DEFAULT 1
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_email_id ON rows (email_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS row_tags (row INTEGER NOT NULL, tag TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_row_tags_tag ON row_tags (tag)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_row_tags_row ON row_tags (row)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._load()
+        register_collector("vector_index", self.metrics)
+
+    # Storage
+
+    def _set_generation(self, generation: int) -> None:
+        """
+        Point at the matrix files of a compaction generation
+        Generation 0 keeps the original file names.
+        """
+        suffix = f".{generation}" if generation else ""
+        self._generation = generation
+        self._vectors_path = os.path.join(self.directory, f"vectors{suffix}.f32")
+        if self.quantizer is not None:
+            self._codes_path = os.path.join(self.directory, f"codes{suffix}.{self.quantizer.kind}")
+
+    @staticmethod
+    def _open_matrix(path: str, capacity: int, columns: int, dtype) -> np.memmap:
+        """Open (growing if needed) a memory-mapped row matrix"""
+        size = capacity * columns * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=(capacity, columns))
+
+    def _open_vectors(self, capacity: int) -> np.memmap:
+        """Open (growing if needed) the memory-mapped embedding matrix"""
+        return self._open_matrix(self._vectors_path, capacity, self.dimension, np.float32)
+
+    def _open_codes(self, capacity: int) -> np.memmap:
+        """Open (growing if needed) the memory-mapped quantized code matrix"""
+        return self._open_matrix(self._codes_path, capacity, self.quantizer.code_size, self.quantizer.code_dtype)
+
+    def _load(self) -> None:
+        """Rebuild the in-memory filter columns from the side table"""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        self._set_generation(int(row[0]) if row else 0)
+        row = self._conn.execute("SELECT COALESCE(MAX(row), -1) FROM rows").fetchone()
+        self._count = row[0] + 1
+        capacity = max(1024, self._count)
+        if os.path.exists(self._vectors_path):
+            capacity = max(capacity, os.path.getsize(self._vectors_path) // (self.dimension * 4))
+        self._vectors = self._open_vectors(capacity)
+
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._received_ts = np.full(capacity, np.nan)
+        self._codes = {column: np.full(capacity, -1, dtype=np.int32) for column in CATEGORY_COLUMNS}
+        self._categories: Dict[str, Dict[str, int]] = {column: {} for column in CATEGORY_COLUMNS}
+
+        for row, department, sensitivity, received_ts in self._conn.execute(
+            "SELECT row, department, sensitivity, received_ts FROM rows WHERE alive = 1"
+        ):
+            self._set_columns(row, {"department": department, "sensitivity": sensitivity}, received_ts)
+        self._dead = self._count - int(self._alive[:self._count].sum())
+
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.full(capacity, -1, dtype=np.int32)
+        self._ivf_built_at = 0
+        if os.path.exists(self._centroids_path) and self._count:
+            self._centroids = np.load(self._centroids_path)
+            self._assignments[:self._count] = self._assign_rows(self._vectors, self._centroids, 0, self._count)
+            self._ivf_built_at = self._count
+
+        self._quantized: Optional[np.memmap] = None
+        if self.quantizer is not None and os.path.exists(self._quantizer_path):
+            self.quantizer.load(self._quantizer_path)
+            self._quantized = self._open_codes(capacity)
+
+    def _grow(self, needed: int) -> None:
+        """Double capacity until `needed` rows fit"""
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        self._vectors.flush()
+        self._vectors = self._open_vectors(new_capacity)
+        if self._quantized is not None:
+            self._quantized.flush()
+            self._quantized = self._open_codes(new_capacity)
+        extra = new_capacity - capacity
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+        self._received_ts = np.concatenate([self._received_ts, np.full(extra, np.nan)])
+        self._assignments = np.concatenate([self._assignments, np.full(extra, -1, dtype=np.int32)])
+        for column in CATEGORY_COLUMNS:
+            self._codes[column] = np.concatenate([self._codes[column], np.full(extra, -1, dtype=np.int32)])
+
+    def _code(self, column: str, value: Optional[str], create: bool = False) -> int:
+        if value is None:
+            return -1
+        categories = self._categories[column]
+        if value not in categories:
+            if not create:
+                return -2  # matches nothing
+            categories[value] = len(categories)
+        return categories[value]
+
+    def _set_columns(self, row: int, categories: Dict[str, Optional[str]], received_ts: Optional[float]) -> None:
+        self._alive[row] = True
+        self._received_ts[row] = received_ts if received_ts is not None else np.nan
+        for column in CATEGORY_COLUMNS:
+            self._codes[column][row] = self._code(column, categories.get(column), create=True)
+
+    def _select_rows(self, sql: str, values: List[Any]) -> List[int]:
+        """Run `sql` (ending in an IN clause placeholder) over values in chunks"""
+        rows = []
+        for i in range(0, len(values), SQL_CHUNK_SIZE):
+            chunk = values[i:i + SQL_CHUNK_SIZE]
+            query = sql.format(placeholders=",".join("?" * len(chunk)))
+            rows.extend(r for (r,) in self._conn.execute(query, chunk))
+        return rows
+
+    def _live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self._alive[:self._count])
+
+    @staticmethod
+    def _sample(vectors: np.ndarray, live_rows: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+        """Up to `size` random live vectors, read in row order"""
+        rng = np.random.default_rng(seed)
+        size = min(len(live_rows), size)
+        return np.asarray(vectors[np.sort(rng.choice(live_rows, size, replace=False))])
+
+    # IVF
+
+    def _use_ivf(self) -> bool:
+        if self.mode == "ivf":
+            return True
+        if self.mode == "exact":
+            return False
+        return self._count - self._dead >= settings.EMBEDDED_IVF_MIN_VECTORS
+
+    @staticmethod
+    def _assign_rows(vectors: np.ndarray, centroids: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Nearest centroid of rows [start, end)"""
+        assignments = np.empty(end - start, dtype=np.int32)
+        for i in range(start, end, SCAN_CHUNK_ROWS):
+            j = min(i + SCAN_CHUNK_ROWS, end)
+            assignments[i - start:j - start] = assign(np.asarray(vectors[i:j]), centroids, spherical=True)
+        return assignments
+
+    def _fit_ivf(
+        self,
+        vectors: np.ndarray,
+        count: int,
+        live_rows: np.ndarray,
+        n_lists: Optional[int] = None,
+        iterations: int = 10,
+        seed: int = 0
+    ) -> tuple:
+        """Centroids trained on a sample of live rows, and the assignment of rows [0, count)"""
+        n_lists = n_lists or settings.EMBEDDED_IVF_LISTS or max(1, int(4 * math.sqrt(len(live_rows))))
+        n_lists = min(n_lists, len(live_rows))
+        sample = self._sample(vectors, live_rows, n_lists * 64, seed=seed)
+        centroids = kmeans(sample, n_lists, iterations=iterations, seed=seed, spherical=True)
+        return centroids, self._assign_rows(vectors, centroids, 0, count)
+
+    def _install_ivf(self, centroids: np.ndarray, assignments: np.ndarray, rewritten: List[int]) -> None:
+        """
+        Switch to freshly trained centroids
+        `assignments` covers the rows the training saw; rows appended or
+        rewritten since are assigned here.
+        """
+        trained = len(assignments)
+        assignments = _padded(assignments, self._vectors.shape[0], -1)
+        assignments[trained:self._count] = self._assign_rows(self._vectors, centroids, trained, self._count)
+        rows = np.unique(np.asarray(rewritten, dtype=np.int64))
+        if len(rows):
+            assignments[rows] = assign(np.asarray(self._vectors[rows]), centroids, spherical=True)
+        np.save(self._centroids_path, centroids)
+        self._centroids = centroids
+        self._assignments = assignments
+        self._ivf_built_at = self._count
+
+    def build_ivf(self, n_lists: Optional[int] = None, iterations: int = 10, seed: int = 0) -> None:
+        """
+        Train the k-means coarse quantizer and assign every row, blocking
+        For tools and benchmarks with no concurrent writers; the service
+        trains it in the background (see maintain).
+        """
+        live_rows = self._live_rows()
+        if len(live_rows) == 0:
+            return
+        centroids, assignments = self._fit_ivf(self._vectors, self._count, live_rows, n_lists, iterations, seed)
+        self._install_ivf(centroids, assignments, [])
+
+    def _needs_ivf(self) -> bool:
+        """Whether the coarse quantizer is missing or the index has doubled since it was trained"""
+        if not self._use_ivf() or self._count == self._dead:
+            return False
+        return self._centroids is None or self._count > 2 * max(self._ivf_built_at, 1)
+
+    # Quantization
+
+    def _fit_quantizer(self, vectors: np.ndarray, count: int, live_rows: np.ndarray, sample_size: int = 16384, seed: int = 0):
+        """A new quantizer trained on a sample of live rows, with rows [0, count) encoded into the code file"""
+        quantizer = make_quantizer(self.quantizer.kind, self.dimension, settings.VECTOR_PQ_COMPRESSION)
+        quantizer.train(self._sample(vectors, live_rows, sample_size, seed=seed))
+        quantized = self._open_matrix(self._codes_path, vectors.shape[0], quantizer.code_size, quantizer.code_dtype)
+        for start in range(0, count, SCAN_CHUNK_ROWS):
+            end = min(start + SCAN_CHUNK_ROWS, count)
+            quantized[start:end] = quantizer.encode(np.asarray(vectors[start:end]))
+        quantized.flush()
+        return quantizer
+
+    def _install_quantizer(self, quantizer, trained: int, rewritten: List[int]) -> None:
+        """Switch to a freshly trained quantizer, encoding rows appended or rewritten since training"""
+        quantized = self._open_matrix(self._codes_path, self._vectors.shape[0], quantizer.code_size, quantizer.code_dtype)
+        rows = np.concatenate([
+            np.arange(trained, self._count),
+            np.unique(np.asarray(rewritten, dtype=np.int64))
+        ]).astype(np.int64)
+        for i in range(0, len(rows), SCAN_CHUNK_ROWS):
+            chunk = rows[i:i + SCAN_CHUNK_ROWS]
+            quantized[chunk] = quantizer.encode(np.asarray(self._vectors[chunk]))
+        quantized.flush()
+        # Saved last: on restart the quantizer file marks the codes as complete
+        quantizer.save(self._quantizer_path)
+        self.quantizer = quantizer
+        self._quantized = quantized
+
+    def build_quantizer(self, sample_size: int = 16384, seed: int = 0) -> None:
+        """
+        Train the quantizer and encode every row, blocking
+        For tools and benchmarks with no concurrent writers; the service
+        trains it in the background (see maintain).
+        """
+        live_rows = self._live_rows()
+        if self.quantizer is None or len(live_rows) == 0:
+            return
+        quantizer = self._fit_quantizer(self._vectors, self._count, live_rows, sample_size, seed)
+        self._install_quantizer(quantizer, self._count, [])
+
+    def _needs_quantizer(self) -> bool:
+        """Whether the index has grown large enough to train the quantizer"""
+        return (
+            self.quantizer is not None
+            and self._quantized is None
+            and self._count - self._dead >= settings.EMBEDDED_QUANTIZATION_MIN_VECTORS
+        )
+
+    # Compaction
+
+    def _needs_compaction(self) -> bool:
+        return (
+            self._dead >= settings.EMBEDDED_COMPACT_MIN_DEAD_ROWS
+            and self._dead >= settings.EMBEDDED_COMPACT_DEAD_RATIO * self._count
+        )
+
+    def _compact(self) -> None:
+        """
+        Rewrite the index without deleted rows
+        Live rows keep their order and are renumbered from 0 into the files
+        of the next generation. The side table is renumbered and the new
+        generation recorded in one transaction, so a crash leaves either
+        the old or the new index intact. Called with the lock held.
+        """
+        live_rows = self._live_rows()
+        count = len(live_rows)
+        capacity = 1024
+        while capacity < count:
+            capacity *= 2
+        old_paths = [self._vectors_path] + ([self._codes_path] if self.quantizer is not None else [])
+        old_vectors, old_quantized = self._vectors, self._quantized
+
+        generation = self._generation + 1
+        self._set_generation(generation)
+        for path in [self._vectors_path] + ([self._codes_path] if self.quantizer is not None else []):
+            if os.path.exists(path):
+                os.remove(path)  # left behind by an interrupted compaction
+        vectors = self._open_vectors(capacity)
+        quantized = self._open_codes(capacity) if old_quantized is not None else None
+        for start in range(0, count, SCAN_CHUNK_ROWS):
+            rows = live_rows[start:start + SCAN_CHUNK_ROWS]
+            vectors[start:start + len(rows)] = old_vectors[rows]
+            if quantized is not None:
+                quantized[start:start + len(rows)] = old_quantized[rows]
+        vectors.flush()
+        if quantized is not None:
+            quantized.flush()
+
+        try:
+            self._conn.execute("DELETE FROM rows WHERE alive = 0")
+            self._conn.execute("CREATE TEMP TABLE remap (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+            self._conn.executemany(
+                "INSERT INTO remap (old, new) VALUES (?, ?)",
+                [(int(old), new) for new, old in enumerate(live_rows) if old != new]
+            )
+            # Via negative numbers, so no intermediate row number collides with a live row
+            for table in ("rows", "row_tags"):
+                self._conn.execute(
+                    f"UPDATE {table} SET row = -1 - (SELECT new FROM remap WHERE old = {table}.row) "
+                    "WHERE row IN (SELECT old FROM remap)"
+                )
+                self._conn.execute(f"UPDATE {table} SET row = -1 - row WHERE row < 0")
+            self._conn.execute("DROP TABLE remap")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (str(generation),)
+            )
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            self._conn.execute("DROP TABLE IF EXISTS temp.remap")
+            self._set_generation(generation - 1)
+            raise
+
+        self._vectors = vectors
+        self._quantized = quantized
+        self._alive = _padded(np.ones(count, dtype=bool), capacity, False)
+        self._received_ts = _padded(self._received_ts[live_rows], capacity, np.nan)
+        self._assignments = _padded(self._assignments[live_rows], capacity, -1)
+        for column in CATEGORY_COLUMNS:
+            self._codes[column] = _padded(self._codes[column][live_rows], capacity, -1)
+        self._count = count
+        self._dead = 0
+        self._ivf_built_at = min(self._ivf_built_at, count)
+        for path in old_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # in-flight searches still map it; nothing reads it again
+
+    async def compact(self) -> None:
+        """
+        Drop deleted rows from the index files
+        Writes and new searches wait for it; searches already scanning see
+        the new generation and run again.
+        """
+        async with self._lock:
+            await asyncio.to_thread(self._compact)
+
+    # Background maintenance
+
+    async def _train_ivf(self) -> None:
+        async with self._lock:
+            generation, count, vectors = self._generation, self._count, self._vectors
+            live_rows = self._live_rows()
+            self._rewritten = []
+        try:
+            centroids, assignments = await asyncio.to_thread(self._fit_ivf, vectors, count, live_rows)
+            async with self._lock:
+                # Trained on rows a compaction has since renumbered: train again
+                if self._generation == generation:
+                    await asyncio.to_thread(self._install_ivf, centroids, assignments, self._rewritten)
+        finally:
+            self._rewritten = None
+
+    async def _train_quantizer(self) -> None:
+        async with self._lock:
+            generation, count, vectors = self._generation, self._count, self._vectors
+            live_rows = self._live_rows()
+            self._rewritten = []
+        try:
+            quantizer = await asyncio.to_thread(self._fit_quantizer, vectors, count, live_rows)
+            async with self._lock:
+                if self._generation == generation:
+                    await asyncio.to_thread(self._install_quantizer, quantizer, count, self._rewritten)
+        finally:
+            self._rewritten = None
+
+    async def _maintain(self) -> None:
+        try:
+            while True:
+                if self._needs_compaction():
+                    await self.compact()
+                elif self._needs_ivf():
+                    await self._train_ivf()
+                elif self._needs_quantizer():
+                    await self._train_quantizer()
+                else:
+                    return
+        except Exception as e:
+            print(f"Error maintaining vector index: {str(e)}")
+
+    def _schedule_maintenance(self) -> Optional[asyncio.Future]:
+        """Start training or compaction in the background when due, unless already running"""
+        if self._maintenance is None or self._maintenance.done():
+            if not (self._needs_compaction() or self._needs_ivf() or self._needs_quantizer()):
+                return None
+            self._maintenance = asyncio.ensure_future(self._maintain())
+        return self._maintenance
+
+    async def maintain(self) -> None:
+        """Run any due training and compaction, waiting for it to finish"""
+        task = self._schedule_maintenance()
+        if task is not None:
+            await task
+
+    # Search
+
+    def _filter_mask(self, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        """
+        Boolean pre-filter over all rows from the metadata columns
+        Queries SQLite for email_id and tag filters; run it in a thread with
+        the lock held.
+        """
+        mask = self._alive[:self._count].copy()
+        if not filters:
+            return mask
+        for column in CATEGORY_COLUMNS:
+            if filters.get(column) is not None:
+                value = str(getattr(filters[column], "value", filters[column]))
+                mask &= self._codes[column][:self._count] == self._code(column, value)
+        start_ts = _timestamp(filters.get("start_date"))
+        end_ts = _timestamp(filters.get("end_date"))
+        if start_ts is not None:
+            mask &= self._received_ts[:self._count] >= start_ts
+        if end_ts is not None:
+            mask &= self._received_ts[:self._count] <= end_ts
+        if filters.get("email_id") is not None:
+            rows = [r for (r,) in self._conn.execute("SELECT row FROM rows WHERE email_id = ?", (filters["email_id"],))]
+            email_mask = np.zeros(self._count, dtype=bool)
+            email_mask[rows] = True
+            mask &= email_mask
+        if filters.get("tags"):
+            rows = self._select_rows(
+                "SELECT DISTINCT row FROM row_tags WHERE tag IN ({placeholders})",
+                list(filters["tags"])
+            )
+            tag_mask = np.zeros(self._count, dtype=bool)
+            tag_mask[rows] = True
+            mask &= tag_mask
+        return mask
+
+    def _snapshot(self) -> _Snapshot:
+        """Capture what a search scans; called with the lock held, alongside _filter_mask"""
+        quantized = self._quantized is not None
+        return _Snapshot(
+            generation=self._generation,
+            count=self._count,
+            vectors=self._vectors,
+            quantizer=self.quantizer if quantized else None,
+            quantized=self._quantized,
+            centroids=self._centroids if self._use_ivf() else None,
+            # A view: appends reallocate the array and retraining replaces it
+            assignments=self._assignments[:self._count]
+        )
+
+    @staticmethod
+    def _scan(candidates: np.ndarray, score, limit: int) -> tuple:
+        """Best `limit` candidates under score(rows), scored chunk by chunk"""
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for i in range(0, len(candidates), SCAN_CHUNK_ROWS):
+            rows = candidates[i:i + SCAN_CHUNK_ROWS]
+            scores = score(rows)
+            rows = np.concatenate([best_rows, rows])
+            scores = np.concatenate([best_scores, scores])
+            if len(scores) > limit:
+                keep = np.argpartition(-scores, limit - 1)[:limit]
+                rows, scores = rows[keep], scores[keep]
+            best_rows, best_scores = rows, scores
+        return best_rows, best_scores
+
+    def _top_k(self, snapshot: _Snapshot, query: np.ndarray, mask: np.ndarray, limit: int, quantized: bool = True) -> List[tuple]:
+        """
+        Cosine top-k over the snapshot rows selected by mask
+        With a trained quantizer (and quantized=True), the approximate scores
+        pick limit * VECTOR_RESCORE_OVERSAMPLING candidates, which are then
+        re-ranked with the exact float32 vectors. Reads only the snapshot, so
+        it is safe to run in a thread while writes continue.
+        """
+        if snapshot.centroids is not None:
+            centroid_scores = snapshot.centroids @ query
+            n_probe = min(settings.EMBEDDED_IVF_PROBES, len(centroid_scores))
+            probe = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+            mask = mask & np.isin(snapshot.assignments, probe)
+
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+
+        if quantized and snapshot.quantized is not None:
+            prepared = snapshot.quantizer.prepare_query(query)
+            depth = max(limit, math.ceil(limit * settings.VECTOR_RESCORE_OVERSAMPLING))
+            candidates, _ = self._scan(
+                candidates, lambda rows: snapshot.quantizer.score(snapshot.quantized[rows], prepared), depth
+            )
+            candidates = np.sort(candidates)
+
+        best_rows, best_scores = self._scan(candidates, lambda rows: snapshot.vectors[rows] @ query, limit)
+        order = np.argsort(-best_scores)
+        return [(int(best_rows[i]), float(best_scores[i])) for i in order]
+
+    def _payloads(self, rows: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Payloads of the live rows among `rows` (run in a thread with the lock held)"""
+        return {
+            row: json.loads(payload)
+            for row, payload in self._conn.execute(
+                f"SELECT row, payload FROM rows WHERE alive = 1 AND row IN ({','.join('?' * len(rows))})",
+                rows
+            )
+        }
+
+    # VectorStore interface
+
+    def _upsert(self, records: List[EmailVectorData]) -> None:
+        """Write records to the row table and the memmaps (run in a thread with the lock held)"""
+        matrix = np.asarray([record.embedding for record in records], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        codes = self.quantizer.encode(matrix) if self._quantized is not None else None
+
+        for index, (record, vector) in enumerate(zip(records, matrix)):
+            payload = _payload(record)
+            existing = self._conn.execute(
+                "SELECT row FROM rows WHERE vector_id = ?", (record.id,)
+            ).fetchone()
+            if existing:
+                row = existing[0]
+                if self._rewritten is not None:
+                    self._rewritten.append(row)
+            else:
+                row = self._count
+                self._count += 1
+                self._grow(self._count)
+            self._vectors[row] = vector
+            if codes is not None:
+                self._quantized[row] = codes[index]
+            self._set_columns(row, payload, payload.get("received_date_ts"))
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO rows
+                (row, vector_id, email_id, department, sensitivity, received_ts, payload, alive)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+                """,
+                (
+                    row, record.id, record.email_id, payload.get("department"),
+                    payload.get("sensitivity"), payload.get("received_date_ts"), json.dumps(payload)
+                )
+            )
+            self._conn.execute("DELETE FROM row_tags WHERE row = ?", (row,))
+            self._conn.executemany(
+                "INSERT INTO row_tags (row, tag) VALUES (?, ?)",
+                [(row, tag) for tag in payload.get("tags", [])]
+            )
+            if self._centroids is not None:
+                self._assignments[row] = int(np.argmax(self._centroids @ vector))
+
+        self._vectors.flush()
+        if self._quantized is not None:
+            self._quantized.flush()
+        self._conn.commit()
+
+    async def upsert(self, records: List[EmailVectorData]) -> None:
+        records = [record for record in records if record.embedding is not None]
+        if not records:
+            return
+        async with self._lock:
+            await asyncio.to_thread(self._upsert, records)
+        self._schedule_maintenance()
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        limit: int = 10,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        while True:
+            async with self._lock:
+                if self._count == 0:
+                    return []
+                snapshot = self._snapshot()
+                mask = await asyncio.to_thread(self._filter_mask, filters)
+            # The scan releases the GIL in the matrix products; keep it off the event loop
+            hits = await asyncio.to_thread(self._top_k, snapshot, query, mask, limit)
+            if not hits:
+                return []
+
+            rows = [row for row, _ in hits]
+            async with self._lock:
+                if self._generation != snapshot.generation:
+                    continue  # compacted mid-scan: the row numbers are stale
+                payloads = await asyncio.to_thread(self._payloads, rows)
+            return [
+                {
+                    "id": payloads[row].get("vector_id"),
+                    "email_id": payloads[row].get("email_id"),
+                    "content": payloads[row].get("content"),
+                    "metadata": payloads[row].get("metadata", {}),
+                    "score": score
+                }
+                for row, score in hits
+                if row in payloads
+            ]
+
+    def _delete_where(self, sql: str, values: List[str]) -> None:
+        """Mark the rows `sql` selects as deleted (run in a thread with the lock held)"""
+        rows = self._select_rows(sql, values)
+        if not rows:
+            return
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        self._dead += int(self._alive[rows].sum())
+        self._alive[rows] = False
+        self._conn.executemany("DELETE FROM row_tags WHERE row = ?", [(int(row),) for row in rows])
+        # Free the vector ID so it can be inserted again as a new row
+        self._conn.executemany(
+            "UPDATE rows SET alive = 0, vector_id = 'deleted:' || row WHERE row = ?",
+            [(int(row),) for row in rows]
+        )
+        self._conn.commit()
+
+    async def delete(self, vector_ids: List[str]) -> None:
+        if not vector_ids:
+            return
+        async with self._lock:
+            await asyncio.to_thread(
+                self._delete_where,
+                "SELECT row FROM rows WHERE vector_id IN ({placeholders})",
+                list(vector_ids)
+            )
+        self._schedule_maintenance()
+
+    async def delete_by_email_ids(self, email_ids: List[str]) -> None:
+        if not email_ids:
+            return
+        async with self._lock:
+            await asyncio.to_thread(
+                self._delete_where,
+                "SELECT row FROM rows WHERE alive = 1 AND email_id IN ({placeholders})",
+                list(email_ids)
+            )
+        self._schedule_maintenance()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Row counts and the bytes scanned per query, float32 vs quantized"""
+        float32_bytes = self._count * self.dimension * 4
+        metrics = {
+            "rows": self._count,
+            "live_rows": self._count - self._dead,
+            "deleted_rows": self._dead,
+            "generation": self._generation,
+            "float32_bytes": float32_bytes,
+            "quantization": self.quantizer.kind if self.quantizer is not None else "none",
+        }
+        if self._quantized is not None:
+            code_bytes = self._count * self.quantizer.code_size
+            metrics["code_bytes"] = code_bytes
+            metrics["compression"] = round(float32_bytes / max(code_bytes, 1), 1)
+        return metrics
+
+    def evaluate_quantization(self, n_queries: int = 100, limit: int = 10, seed: int = 0) -> Dict[str, Any]:
+        """
+        Recall@limit of quantized search against exact search, using sampled
+        stored vectors as queries, alongside the memory footprint
+        Use this to choose VECTOR_QUANTIZATION, VECTOR_PQ_COMPRESSION and
+        VECTOR_RESCORE_OVERSAMPLING for a tenant. Trains the quantizer if
+        due, so run it with no concurrent writers.
+        """
+        if self._needs_quantizer():
+            self.build_quantizer()
+        if self._quantized is None:
+            return {**self.metrics(), "recall": None}
+        snapshot = self._snapshot()
+        mask = self._alive[:self._count].copy()
+        hits = 0
+        queries = self._sample(self._vectors, self._live_rows(), n_queries, seed=seed)
+        for query in queries:
+            exact = {row for row, _ in self._top_k(snapshot, query, mask, limit, quantized=False)}
+            approximate = {row for row, _ in self._top_k(snapshot, query, mask, limit)}
+            hits += len(exact & approximate)
+        recall = hits / max(len(queries) * min(limit, int(mask.sum())), 1)
+        return {**self.metrics(), "queries": len(queries), "limit": limit, "recall": round(recall, 4)}
+
+    async def close(self) -> None:
+        # Let a running training or compaction finish rather than leave it half-written
+        if self._maintenance is not None and not self._maintenance.done():
+            await self._maintenance
+        self._vectors.flush()
+        if self._quantized is not None:
+            self._quantized.flush()
+        self._conn.close()
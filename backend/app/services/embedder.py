@@ -1,52 +1,259 @@
-from typing import List, Dict, Any
-from openai import AsyncOpenAI
+import asyncio
+import hashlib
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from openai import AsyncOpenAI, BadRequestError
 
 from app.config import settings
+from app.models.email import EmailVectorData
+from app.services.chunker import get_tokenizer
+from app.services.vector_store import get_vector_store
+from app.utils.cache import TieredCache
+from app.utils.metrics import register_collector
 
 # Initialize OpenAI client
 client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
 
+# Embeddings cached as float32 bytes, keyed by model, dimension and text hash
+embedding_cache = TieredCache(
+    settings.EMBEDDING_CACHE_DB,
+    memory_bytes=settings.EMBEDDING_CACHE_MEMORY_BYTES,
+    disk_bytes=settings.EMBEDDING_CACHE_DISK_BYTES,
+    ttl=settings.EMBEDDING_CACHE_TTL
+)
+register_collector("embedding_cache", embedding_cache.metrics)
 
-async def create_embedding(text: str) -> List[float]:
+embedding_stats = {
+    "requests": 0,
+    "inputs": 0,
+    "tokens": 0,
+    # Batches rejected as invalid and retried in halves
+    "split_batches": 0,
+    "failed_inputs": 0
+}
+register_collector("embedder", lambda: dict(embedding_stats))
+
+
+def _prepare_input(text: str) -> str:
+    """Normalize whitespace; the API rejects empty strings"""
+    normalized = " ".join(text.split())
+    return normalized if normalized else " "
+
+
+def _fit_inputs(texts: List[str]) -> List[Tuple[str, int]]:
     """
-    Create an embedding vector for the given text using OpenAI's embedding model
+    Each input clamped to the model's per-input token limit, with its
+    token count under the embedding model's tokenizer
+    """
+    tokenizer = get_tokenizer()
+    limit = settings.EMBEDDING_MAX_INPUT_TOKENS
+    fitted = []
+    for text in texts:
+        tokens = tokenizer.encode(text, disallowed_special=())
+        if len(tokens) > limit:
+            fitted.append((tokenizer.decode(tokens[:limit]), limit))
+        else:
+            fitted.append((text, len(tokens)))
+    return fitted
+
+
+def _cache_key(text: str) -> str:
+    """Cache key for a prepared input: model, dimension and SHA-256 of the text"""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{settings.EMBEDDING_MODEL}:{settings.EMBEDDING_DIMENSION}:{digest}"
+
+
+def _pack_batches(token_counts: List[int]) -> List[List[int]]:
+    """
+    Group input indexes into batches that respect both the per-request
+    input count and the per-request token limit
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index, tokens in enumerate(token_counts):
+        if current and (
+            len(current) >= settings.EMBEDDING_BATCH_SIZE
+            or current_tokens + tokens > settings.EMBEDDING_MAX_BATCH_TOKENS
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _embed_batch(texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Embed one packed batch in a single API call, preserving input order
+    A batch the API rejects as invalid is retried in halves, so a bad input
+    only fails itself. Inputs that could not be embedded come back as None.
     """
     try:
+        embedding_stats["requests"] += 1
         response = await client.embeddings.create(
             model=settings.EMBEDDING_MODEL,
-            input=text
+            input=texts
         )
-        
-        # Extract the embedding vector
-        embedding = response.data[0].embedding
-        return embedding
-    
-    except Exception as e:
+
+        # Results carry their input index; don't rely on response order
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for item in response.data:
+            embeddings[item.index] = item.embedding
+        embedding_stats["inputs"] += len(texts)
+        embedding_stats["tokens"] += response.usage.total_tokens
+        return embeddings
+
+    except BadRequestError as e:
+        if len(texts) > 1:
+            embedding_stats["split_batches"] += 1
+            middle = len(texts) // 2
+            # One half after the other, so a split batch holds a single concurrency slot
+            return await _embed_batch(texts[:middle]) + await _embed_batch(texts[middle:])
         print(f"Error creating embedding: {str(e)}")
-        # Return a zero vector as fallback
-        return [0.0] * settings.EMBEDDING_DIMENSION
+        return [None]
+
+    except Exception as e:
+        # The client already retried rate limits and transient errors
+        print(f"Error creating embeddings: {str(e)}")
+        return [None] * len(texts)
+
+
+async def create_embeddings(texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Create embedding vectors for many texts
+    Cached embeddings are served without an API call. The remaining inputs
+    are token-counted (in a thread), packed into as few requests as the
+    model limits allow, a bounded number of requests run concurrently, and
+    results come back in input order. Inputs that could not be embedded
+    come back as None; they are not cached and must not be stored.
+    """
+    if not texts:
+        return []
+
+    prepared = [_prepare_input(text) for text in texts]
+    keys = [_cache_key(text) for text in prepared]
+    embeddings: List[Optional[List[float]]] = [None] * len(prepared)
+
+    # Serve cache hits (one lookup in a thread); embed each distinct missing text once
+    hits = await asyncio.to_thread(embedding_cache.get_many, keys)
+    missing: Dict[str, List[int]] = {}
+    for index, key in enumerate(keys):
+        cached = hits.get(key)
+        if cached is not None:
+            embeddings[index] = np.frombuffer(cached, dtype=np.float32).tolist()
+        else:
+            missing.setdefault(key, []).append(index)
+
+    if missing:
+        missing_indexes = list(missing.values())
+        fitted = await asyncio.to_thread(_fit_inputs, [prepared[indexes[0]] for indexes in missing_indexes])
+        missing_texts = [text for text, _ in fitted]
+        semaphore = asyncio.Semaphore(settings.EMBEDDING_CONCURRENCY)
+        created: List[Tuple[str, bytes]] = []
+
+        async def run_batch(batch: List[int]) -> None:
+            async with semaphore:
+                results = await _embed_batch([missing_texts[i] for i in batch])
+            for i, embedding in zip(batch, results):
+                if embedding is None:
+                    embedding_stats["failed_inputs"] += 1
+                    continue
+                created.append((keys[missing_indexes[i][0]], np.asarray(embedding, dtype=np.float32).tobytes()))
+                for index in missing_indexes[i]:
+                    embeddings[index] = embedding
+
+        await asyncio.gather(*[run_batch(batch) for batch in _pack_batches([tokens for _, tokens in fitted])])
+        if created:
+            await asyncio.to_thread(embedding_cache.set_many, created)
+
+    return embeddings
+
+
+async def embed_records(records: List[EmailVectorData]) -> List[EmailVectorData]:
+    """
+    Fill in the embeddings of records (e.g. email chunks) in batched calls
+    Records that could not be embedded are left with embedding None.
+    """
+    embeddings = await create_embeddings([record.content for record in records])
+    for record, embedding in zip(records, embeddings):
+        record.embedding = embedding
+    return records
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests
+    The first request opens a short window (EMBEDDING_BATCH_WINDOW_MS); every
+    request arriving within it is sent in the same API call. A full batch is
+    flushed immediately.
+    """
+
+    def __init__(self):
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= settings.EMBEDDING_BATCH_SIZE:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(settings.EMBEDDING_BATCH_WINDOW_MS / 1000, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        if pending:
+            # Hold a reference so the flush task isn't garbage collected mid-flight
+            task = asyncio.ensure_future(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            embeddings = await create_embeddings([text for text, _ in pending])
+            for (_, future), embedding in zip(pending, embeddings):
+                if future.done():
+                    continue
+                if embedding is None:
+                    future.set_exception(RuntimeError("Failed to create embedding"))
+                else:
+                    future.set_result(embedding)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+
+
+# Shared micro-batcher for single-text callers
+embedding_batcher = EmbeddingBatcher()
+
+
+async def create_embedding(text: str) -> List[float]:
+    """
+    Create an embedding vector for the given text using OpenAI's embedding model
+    Cached texts are answered at once; concurrent callers that miss the
+    cache are coalesced into shared batch requests.
+    """
+    cached = await asyncio.to_thread(embedding_cache.get, _cache_key(_prepare_input(text)))
+    if cached is not None:
+        return np.frombuffer(cached, dtype=np.float32).tolist()
+    return await embedding_batcher.embed(text)
 
 
 async def search_similar(query_embedding: List[float], limit: int = 10, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
     """
-    Search for similar vectors in Qdrant
-    This is a placeholder implementation - in a real app, this would connect to Qdrant
-    """
-    # In a real implementation, this would search in Qdrant
-    # For now, we'll return placeholder results
-    results = [
-        {
-            "id": f"result_{i}",
-            "email_id": f"email_{i}",
-            "content": f"Sample content for result {i}",
-            "metadata": {
-                "department": "general",
-                "sensitivity": "low",
-                "tags": ["sample", "placeholder"],
-            },
-            "score": 0.9 - (i * 0.1)
-        }
-        for i in range(min(5, limit))
-    ]
-    
-    return results
+    Search for similar vectors in the knowledge base vector store
+    """
+    return await get_vector_store().search(query_embedding, limit=limit, filters=filters)
@@ -1,38 +1,52 @@
-from typing import List, Dict, Any
-from msgraph.core import GraphClient
-from azure.identity import ClientSecretCredential
+from typing import List, Dict, Any, AsyncIterator, Optional
+from .graph_client import get_graph_client
 from ..config import settings
 
 class GraphService:
     def __init__(self, access_token: str):
-        self.client = GraphClient(credential=access_token)
+        self.access_token = access_token
+        self.client = get_graph_client()
 
     async def get_me(self) -> Dict[str, Any]:
-        response = await self.client.get("/me")
-        return response.json()
+        return await self.client.get_json("/me", self.access_token)
 
     async def get_mail_folders(self) -> List[Dict[str, Any]]:
-        response = await self.client.get("/me/mailFolders")
-        return response.json().get("value", [])
+        data = await self.client.get_json("/me/mailFolders", self.access_token)
+        return data.get("value", [])
 
     async def get_messages(self, limit: int = 10) -> List[Dict[str, Any]]:
-        response = await self.client.get(
-            f"/me/messages?$top={limit}&$select=id,subject,from,receivedDateTime"
+        data = await self.client.get_json(
+            f"/me/messages?$top={limit}&$select=id,subject,from,receivedDateTime",
+            self.access_token
         )
-        return response.json().get("value", [])
+        return data.get("value", [])
 
     async def get_folder_messages(
         self,
         folder_id: str,
         limit: int = 10
     ) -> List[Dict[str, Any]]:
-        response = await self.client.get(
-            f"/me/mailFolders/{folder_id}/messages?$top={limit}&$select=id,subject,from,receivedDateTime"
+        data = await self.client.get_json(
+            f"/me/mailFolders/{folder_id}/messages?$top={limit}&$select=id,subject,from,receivedDateTime",
+            self.access_token
         )
-        return response.json().get("value", [])
+        return data.get("value", [])
+
+    async def iter_folder_messages(
+        self,
+        folder_id: Optional[str] = None,
+        page_size: int = settings.GRAPH_PAGE_SIZE
+    ) -> AsyncIterator[Dict[str, Any]]:
+        path = f"/me/mailFolders/{folder_id}/messages" if folder_id else "/me/messages"
+        async for page in self.client.iter_pages(
+            f"{path}?$top={page_size}&$select=id,subject,from,receivedDateTime",
+            self.access_token
+        ):
+            for message in page:
+                yield message
 
     async def get_message_content(self, message_id: str) -> Dict[str, Any]:
-        response = await self.client.get(
-            f"/me/messages/{message_id}?$select=id,subject,body,from,receivedDateTime"
-        )
-        return response.json()
\ No newline at end of file
+        return await self.client.get_json(
+            f"/me/messages/{message_id}?$select=id,subject,body,from,receivedDateTime",
+            self.access_token
+        )
\ No newline at end of file
@@ -0,0 +1,245 @@
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, AsyncIterator
+
+from app.config import settings
+from app.services.throttle import RateGovernor
+from app.utils.metrics import register_collector
+
+# Statuses worth retrying, for whole requests and $batch sub-requests
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Statuses Graph uses to signal throttling
+THROTTLE_STATUS_CODES = {429, 503}
+
+
+def _retry_after_seconds(value: Optional[str], default: Optional[float] = None) -> Optional[float]:
+    """Parse a Retry-After header value (in seconds), falling back to default"""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class GraphClient:
+    """
+    Application-scoped, pooled HTTP client for Microsoft Graph API
+    A single instance is shared by every request so TCP/TLS connections to
+    graph.microsoft.com are reused instead of re-established per call.
+    """
+
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = base_url or settings.GRAPH_API_URL
+        self.governor = RateGovernor()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Create the underlying httpx client with tuned pool limits"""
+        limits = httpx.Limits(
+            max_connections=settings.GRAPH_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.GRAPH_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.GRAPH_KEEPALIVE_EXPIRY
+        )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=limits,
+            timeout=httpx.Timeout(settings.GRAPH_TIMEOUT),
+            http2=settings.GRAPH_HTTP2,
+            headers={"Content-Type": "application/json"}
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Underlying httpx client, created on first use if not started"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def start(self) -> None:
+        """Open the connection pool (called from the application lifespan)"""
+        self.client
+
+    async def close(self) -> None:
+        """Close all pooled connections"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        access_token: str,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Send a request to Graph with the caller's bearer token
+        url may be a path relative to GRAPH_API_URL or an absolute URL
+        (e.g. an @odata.nextLink). Requests are paced per mailbox, and
+        throttled (429/503) or transiently failed requests are retried after
+        Retry-After or a jittered backoff. The last response is returned once
+        retries run out.
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["Authorization"] = f"Bearer {access_token}"
+        mailbox_key = self.governor.mailbox_key(access_token)
+        max_retries = settings.GRAPH_MAX_RETRIES
+
+        for attempt in range(max_retries + 1):
+            try:
+                async with self.governor.slot(mailbox_key):
+                    response = await self.client.request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError:
+                if attempt >= max_retries:
+                    raise
+                self.governor.record_retry()
+                await asyncio.sleep(self.governor.backoff_delay(attempt))
+                continue
+
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                self.governor.record_success()
+                return response
+
+            retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+            if response.status_code in THROTTLE_STATUS_CODES:
+                self.governor.record_throttle(mailbox_key, retry_after)
+            if attempt >= max_retries:
+                return response
+
+            self.governor.record_retry()
+            await response.aclose()
+            await asyncio.sleep(self.governor.backoff_delay(attempt, retry_after))
+
+        return response
+
+    async def get(self, url: str, access_token: str, **kwargs) -> httpx.Response:
+        """Send a GET request to Graph"""
+        return await self.request("GET", url, access_token, **kwargs)
+
+    async def get_json(self, url: str, access_token: str, **kwargs) -> Dict[str, Any]:
+        """Send a GET request to Graph and return the decoded JSON body"""
+        response = await self.get(url, access_token, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    @asynccontextmanager
+    async def stream(self, url: str, access_token: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Open a streamed GET response so large bodies (e.g. attachment $value)
+        can be consumed chunk by chunk instead of buffered in memory
+        Throttled or transiently failed attempts are retried like request()
+        before any of the body is handed out.
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["Authorization"] = f"Bearer {access_token}"
+        mailbox_key = self.governor.mailbox_key(access_token)
+        max_retries = settings.GRAPH_MAX_RETRIES
+
+        for attempt in range(max_retries + 1):
+            retry_after = None
+            async with self.governor.slot(mailbox_key):
+                try:
+                    request = self.client.build_request("GET", url, headers=headers, **kwargs)
+                    response = await self.client.send(request, stream=True)
+                except httpx.TransportError:
+                    if attempt >= max_retries:
+                        raise
+                    response = None
+
+                if response is not None:
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        self.governor.record_success()
+                    else:
+                        retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+                        if response.status_code in THROTTLE_STATUS_CODES:
+                            self.governor.record_throttle(mailbox_key, retry_after)
+
+                    if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                        try:
+                            yield response
+                        finally:
+                            await response.aclose()
+                        return
+                    await response.aclose()
+
+            self.governor.record_retry()
+            await asyncio.sleep(self.governor.backoff_delay(attempt, retry_after))
+
+    async def iter_pages(
+        self,
+        url: str,
+        access_token: str,
+        params: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the "value" array of each page of a Graph collection,
+        following @odata.nextLink until the collection is exhausted
+        Only one page is held in memory at a time.
+        """
+        next_url: Optional[str] = url
+        while next_url:
+            data = await self.get_json(next_url, access_token, params=params)
+            yield data.get("value", [])
+            # nextLink already carries the original query parameters
+            next_url = data.get("@odata.nextLink")
+            params = None
+
+    async def batch(
+        self,
+        requests: List[Dict[str, Any]],
+        access_token: str
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Send up to GRAPH_BATCH_SIZE sub-requests in a single $batch call
+        Each request is a dict with "id", "method" and "url" (relative to the
+        API version root). Sub-requests that fail with a retryable status are
+        resent on their own, after the longest Retry-After among them.
+        Returns the final sub-response for each request, keyed by id.
+        """
+        if len(requests) > settings.GRAPH_BATCH_SIZE:
+            raise ValueError(f"A Graph batch holds at most {settings.GRAPH_BATCH_SIZE} requests")
+
+        results: Dict[str, Dict[str, Any]] = {}
+        pending = {request["id"]: request for request in requests}
+        mailbox_key = self.governor.mailbox_key(access_token)
+        max_retries = settings.GRAPH_BATCH_MAX_RETRIES
+
+        for attempt in range(max_retries + 1):
+            response = await self.request(
+                "POST",
+                "/$batch",
+                access_token,
+                json={"requests": list(pending.values())}
+            )
+            response.raise_for_status()
+
+            delay = 0.0
+            for sub_response in response.json().get("responses", []):
+                status = sub_response.get("status", 500)
+                if status in RETRYABLE_STATUS_CODES and attempt < max_retries:
+                    headers = sub_response.get("headers") or {}
+                    retry_after = _retry_after_seconds(headers.get("Retry-After"))
+                    if status in THROTTLE_STATUS_CODES:
+                        self.governor.record_throttle(mailbox_key, retry_after)
+                    delay = max(delay, self.governor.backoff_delay(attempt, retry_after))
+                    continue
+                results[sub_response.get("id")] = sub_response
+                pending.pop(sub_response.get("id"), None)
+
+            if not pending:
+                break
+            self.governor.record_retry()
+            await asyncio.sleep(delay)
+
+        return results
+
+
+# Shared Graph client instance
+graph_client = GraphClient()
+register_collector("graph", graph_client.governor.metrics)
+
+
+def get_graph_client() -> GraphClient:
+    """Get the shared Graph client"""
+    return graph_client
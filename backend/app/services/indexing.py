@@ -0,0 +1,170 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.models.email import EmailReview, ReviewStatus
+from app.services.chunker import chunk_email
+from app.services.embedder import embed_records
+from app.services.lexical_index import lexical_index
+from app.services.review_store import review_store
+from app.services.vector_store import get_vector_store
+from app.utils.metrics import register_collector
+
+
+def review_metadata(review: EmailReview) -> Dict[str, Any]:
+    """Search metadata for an approved review's chunks"""
+    return {
+        "subject": review.content.subject,
+        "sender": review.content.sender,
+        "sender_email": review.content.sender_email,
+        "received_date": review.content.received_date.isoformat(),
+        "folder_name": review.content.folder_name,
+        "department": review.analysis.department.value,
+        "sensitivity": review.analysis.sensitivity.value,
+        "tags": review.analysis.tags,
+        "is_private": review.analysis.is_private,
+        "summary": review.analysis.summary,
+        "key_points": review.analysis.key_points
+    }
+
+
+async def remove_from_index(email_ids: List[str]) -> None:
+    """Drop every chunk of the given emails from the vector store and lexical index"""
+    if email_ids:
+        await asyncio.gather(
+            get_vector_store().delete_by_email_ids(email_ids),
+            lexical_index.delete_by_email_ids(email_ids)
+        )
+
+
+class IndexingPipeline:
+    """
+    Background jobs that put approved reviews into the knowledge base
+    A job walks its emails in INDEXING_BATCH_EMAILS groups: each group is
+    chunked, embedded through the batched embedding client and bulk-upserted
+    into the vector store and lexical index, replacing earlier chunks. At
+    most INDEXING_CONCURRENCY groups run at once across all jobs. Emails
+    whose analysis was reused from an approved original are skipped, since
+    the original already represents them. Job progress is kept in memory.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, concurrency: Optional[int] = None):
+        self.batch_size = batch_size or settings.INDEXING_BATCH_EMAILS
+        self._semaphore = asyncio.Semaphore(concurrency or settings.INDEXING_CONCURRENCY)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._tasks = set()
+
+    def submit(self, user_id: str, email_ids: List[str]) -> Dict[str, Any]:
+        """Start indexing the given approved emails and return the job to poll"""
+        email_ids = list(dict.fromkeys(email_ids))
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "user_id": user_id,
+            "status": "running",
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "total": len(email_ids),
+            "processed": 0,
+            "indexed": 0,
+            "duplicates": 0,
+            "skipped": 0,
+            "failed": 0,
+            "chunks": 0,
+            "errors": []
+        }
+        self._prune()
+        task = asyncio.ensure_future(self._run(job_id, email_ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return dict(self._jobs[job_id])
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond INDEXING_JOB_HISTORY"""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] != "running"]
+        for job_id in finished[:max(0, len(finished) - settings.INDEXING_JOB_HISTORY)]:
+            del self._jobs[job_id]
+
+    async def _run(self, job_id: str, email_ids: List[str]) -> None:
+        job = self._jobs[job_id]
+
+        async def run_batch(batch: List[str]) -> None:
+            async with self._semaphore:
+                try:
+                    counts = await self.index_batch(batch)
+                except Exception as e:
+                    print(f"Error indexing approved emails: {str(e)}")
+                    counts = {"failed": len(batch)}
+                    if len(job["errors"]) < 20:
+                        job["errors"].append(str(e))
+            for key, value in counts.items():
+                job[key] += value
+            job["processed"] += len(batch)
+
+        await asyncio.gather(*[
+            run_batch(email_ids[start:start + self.batch_size])
+            for start in range(0, len(email_ids), self.batch_size)
+        ])
+        job["status"] = "completed" if not job["failed"] else "completed_with_errors"
+        job["finished_at"] = datetime.now().isoformat()
+
+    async def index_batch(self, email_ids: List[str]) -> Dict[str, int]:
+        """Chunk, embed and index one group of emails that are still approved"""
+        # The store is synchronous SQLite; keep its queries off the event loop
+        stored = await asyncio.to_thread(review_store.get_many, email_ids)
+        reviews = [review for review in stored.values() if review.status == ReviewStatus.APPROVED]
+        original_statuses = await asyncio.to_thread(
+            review_store.statuses,
+            [review.duplicate_of for review in reviews if review.duplicate_of]
+        )
+        to_index = [
+            review for review in reviews
+            if original_statuses.get(review.duplicate_of) != ReviewStatus.APPROVED.value
+        ]
+
+        records = [
+            record
+            for review in to_index
+            for record in chunk_email(review.content, review_metadata(review))
+        ]
+        await embed_records(records)
+
+        # An email is only indexed once every one of its chunks is embedded
+        failed_ids = {record.email_id for record in records if record.embedding is None}
+        to_index = [review for review in to_index if review.email_id not in failed_ids]
+        records = [record for record in records if record.email_id not in failed_ids]
+
+        # Replace earlier chunks of these emails with the new ones
+        indexed_ids = [review.email_id for review in to_index]
+        await remove_from_index(indexed_ids)
+        store = get_vector_store()
+        await asyncio.gather(
+            store.upsert(records),
+            lexical_index.add(records)
+        )
+        return {
+            "indexed": len(to_index),
+            "failed": len(failed_ids),
+            "duplicates": len(reviews) - len(to_index) - len(failed_ids),
+            "skipped": len(email_ids) - len(reviews),
+            "chunks": len(records)
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        jobs = list(self._jobs.values())
+        return {
+            "running_jobs": sum(1 for job in jobs if job["status"] == "running"),
+            "pending_emails": sum(job["total"] - job["processed"] for job in jobs if job["status"] == "running"),
+            "batch_size": self.batch_size
+        }
+
+
+# Shared indexing pipeline
+indexing_pipeline = IndexingPipeline()
+register_collector("indexing", indexing_pipeline.metrics)
@@ -0,0 +1,298 @@
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.models.email import EmailVectorData
+from app.services.vector_store import _payload, _timestamp
+from app.utils.metrics import register_collector
+
+# Words, plus identifiers such as invoice numbers, codenames and email
+# addresses kept whole (inner ".", "@", "-", "+" and "/" are allowed)
+TOKEN_PATTERN = re.compile(r"\w[\w.@+\-/]*\w|\w")
+PART_PATTERN = re.compile(r"[^\W_]+")
+
+# Bound parameters per SQLite IN (...) query
+SQL_CHUNK_SIZE = 500
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms of a text
+    Compound identifiers are indexed whole and by their alphanumeric parts,
+    so "INV-2024-0031" matches both that exact query and "2024 0031".
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+def _indexed_text(record: EmailVectorData) -> str:
+    """
+    Content plus the analysis summary and key points carried in metadata
+    (indexed with an email's first chunk only)
+    """
+    metadata = record.metadata or {}
+    fields = [record.content]
+    if not metadata.get("chunk_index"):
+        fields.append(metadata.get("summary") or "")
+        fields.extend(metadata.get("key_points") or [])
+    return "\n".join(str(field) for field in fields if field)
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over approved knowledge base content
+    Postings (term, document, term frequency) live in SQLite next to the
+    same filterable columns as the vector store, so filters are applied while
+    the postings are read. Documents share IDs with their vectors and are
+    added or replaced incrementally whenever content is embedded.
+
+    Scores are exact BM25 by default. With skip_common_terms, a query that
+    also has rarer terms skips the postings of terms found in more than half
+    the documents: their longest reads are saved, at the cost of scores (and
+    possibly the order of the results) that ignore those terms.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        k1: Optional[float] = None,
+        b: Optional[float] = None,
+        skip_common_terms: Optional[bool] = None
+    ):
+        self.db_path = db_path or settings.LEXICAL_INDEX_DB
+        self.k1 = k1 if k1 is not None else settings.BM25_K1
+        self.b = b if b is not None else settings.BM25_B
+        self.skip_common_terms = skip_common_terms if skip_common_terms is not None else settings.BM25_SKIP_COMMON_TERMS
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id INTEGER PRIMARY KEY,
+                vector_id TEXT NOT NULL UNIQUE,
+                email_id TEXT NOT NULL,
+                department TEXT,
+                sensitivity TEXT,
+                received_ts REAL,
+                length INTEGER NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_email_id ON documents (email_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_doc_id ON postings (doc_id);
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS doc_tags (
+                doc_id INTEGER NOT NULL,
+                tag TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_doc_tags_doc_id ON doc_tags (doc_id);
+            CREATE INDEX IF NOT EXISTS idx_doc_tags_tag ON doc_tags (tag);
+            """
+        )
+        self._conn.commit()
+        self.document_count, self.total_length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents"
+        ).fetchone()
+
+    # Writes
+
+    def _remove_documents(self, doc_ids: List[int]) -> None:
+        """Drop documents and their postings, keeping term and corpus statistics in step"""
+        for doc_id in doc_ids:
+            terms = [term for (term,) in self._conn.execute("SELECT term FROM postings WHERE doc_id = ?", (doc_id,))]
+            self._conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(term,) for term in terms])
+            length = self._conn.execute("SELECT length FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+            self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM doc_tags WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self.document_count -= 1
+            self.total_length -= length
+        self._conn.execute("DELETE FROM terms WHERE df <= 0")
+
+    def _doc_ids(self, column: str, values: List[str]) -> List[int]:
+        doc_ids = []
+        for i in range(0, len(values), SQL_CHUNK_SIZE):
+            chunk = values[i:i + SQL_CHUNK_SIZE]
+            doc_ids.extend(
+                doc_id for (doc_id,) in self._conn.execute(
+                    f"SELECT doc_id FROM documents WHERE {column} IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+            )
+        return doc_ids
+
+    def add_sync(self, records: List[EmailVectorData]) -> None:
+        """Index records, replacing any earlier version with the same ID"""
+        records = list({record.id: record for record in records}.values())
+        with self._lock:
+            self._remove_documents(self._doc_ids("vector_id", [record.id for record in records]))
+            for record in records:
+                payload = _payload(record)
+                counts = Counter(tokenize(_indexed_text(record)))
+                length = sum(counts.values())
+                cursor = self._conn.execute(
+                    """
+                    INSERT INTO documents
+                    (vector_id, email_id, department, sensitivity, received_ts, length, payload)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        record.id, record.email_id, payload.get("department"), payload.get("sensitivity"),
+                        payload.get("received_date_ts"), length, json.dumps(payload)
+                    )
+                )
+                doc_id = cursor.lastrowid
+                self._conn.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in counts.items()]
+                )
+                self._conn.executemany(
+                    "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in counts]
+                )
+                self._conn.executemany(
+                    "INSERT INTO doc_tags (doc_id, tag) VALUES (?, ?)",
+                    [(doc_id, tag) for tag in payload.get("tags", [])]
+                )
+                self.document_count += 1
+                self.total_length += length
+            self._conn.commit()
+
+    def delete_sync(self, vector_ids: List[str]) -> None:
+        with self._lock:
+            self._remove_documents(self._doc_ids("vector_id", list(vector_ids)))
+            self._conn.commit()
+
+    def delete_by_email_ids_sync(self, email_ids: List[str]) -> None:
+        with self._lock:
+            self._remove_documents(self._doc_ids("email_id", list(email_ids)))
+            self._conn.commit()
+
+    # Search
+
+    def _filter_clause(self, filters: Optional[Dict[str, Any]]) -> tuple:
+        """SQL conditions on the documents table (aliased d) for the query filters"""
+        clauses, params = [], []
+        if not filters:
+            return "", params
+        for field in ("department", "sensitivity", "email_id"):
+            if filters.get(field) is not None:
+                clauses.append(f"d.{field} = ?")
+                params.append(str(getattr(filters[field], "value", filters[field])))
+        start_ts = _timestamp(filters.get("start_date"))
+        end_ts = _timestamp(filters.get("end_date"))
+        if start_ts is not None:
+            clauses.append("d.received_ts >= ?")
+            params.append(start_ts)
+        if end_ts is not None:
+            clauses.append("d.received_ts <= ?")
+            params.append(end_ts)
+        if filters.get("tags"):
+            tags = list(filters["tags"])
+            clauses.append(f"d.doc_id IN (SELECT doc_id FROM doc_tags WHERE tag IN ({','.join('?' * len(tags))}))")
+            params.extend(tags)
+        return "".join(f" AND {clause}" for clause in clauses), params
+
+    def search_sync(self, query: str, limit: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Top documents by BM25 score, in the same result shape as the vector store"""
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            if self.document_count == 0:
+                return []
+            n = self.document_count
+            average_length = self.total_length / n
+            document_frequency = dict(self._conn.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({','.join('?' * len(query_terms))})",
+                query_terms
+            ).fetchall())
+            terms = list(document_frequency)
+            if self.skip_common_terms:
+                # Terms in most documents barely move BM25 but cost the longest
+                # postings reads; skip them when rarer terms can rank on their own
+                terms = [term for term in terms if document_frequency[term] <= n / 2] or terms
+
+            filter_sql, filter_params = self._filter_clause(filters)
+            scores: Dict[int, float] = {}
+            for term in terms:
+                df = document_frequency[term]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, tf, length in self._conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN documents d ON d.doc_id = p.doc_id "
+                    f"WHERE p.term = ?{filter_sql}",
+                    [term, *filter_params]
+                ):
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            if not ranked:
+                return []
+            payloads = dict(self._conn.execute(
+                f"SELECT doc_id, payload FROM documents WHERE doc_id IN ({','.join('?' * len(ranked))})",
+                [doc_id for doc_id, _ in ranked]
+            ).fetchall())
+
+        results = []
+        for doc_id, score in ranked:
+            payload = json.loads(payloads[doc_id])
+            results.append({
+                "id": payload.get("vector_id"),
+                "email_id": payload.get("email_id"),
+                "content": payload.get("content"),
+                "metadata": payload.get("metadata", {}),
+                "score": score
+            })
+        return results
+
+    # Async API; SQLite work runs off the event loop
+
+    async def add(self, records: List[EmailVectorData]) -> None:
+        if records:
+            await asyncio.to_thread(self.add_sync, records)
+
+    async def search(self, query: str, limit: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.search_sync, query, limit, filters)
+
+    async def delete(self, vector_ids: List[str]) -> None:
+        if vector_ids:
+            await asyncio.to_thread(self.delete_sync, vector_ids)
+
+    async def delete_by_email_ids(self, email_ids: List[str]) -> None:
+        if email_ids:
+            await asyncio.to_thread(self.delete_by_email_ids_sync, email_ids)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "documents": self.document_count,
+            "average_length": self.total_length / self.document_count if self.document_count else 0.0
+        }
+
+
+# Shared lexical index
+lexical_index = LexicalIndex()
+register_collector("lexical_index", lexical_index.metrics)
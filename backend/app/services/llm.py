@@ -1,37 +1,37 @@
+import asyncio
+import hashlib
 import json
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 from openai import AsyncOpenAI
 
 from app.config import settings
-from app.models.email import EmailContent, EmailAnalysis, SensitivityLevel, Department, PIIType
+from app.models.email import EmailContent, EmailAnalysis, SensitivityLevel, Department
+from app.services.chunker import count_tokens
+from app.services.prompt_budget import plan_prompt
+from app.services.throttle import TokenBucket
+from app.utils.cache import TieredCache
+from app.utils.metrics import register_collector
 
 
 # Initialize OpenAI client
 client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
 
+# Tokens-per-minute budgets, one per model, shared by every caller in the process
+_token_budgets: Dict[str, TokenBucket] = {}
 
-async def analyze_email_content(email: EmailContent) -> EmailAnalysis:
-    """
-    Analyze email content using ChatGPT-4o mini to extract knowledge, tags, and detect PII
-    """
-    # Prepare the content for analysis
-    content_to_analyze = f"""
-Subject: {email.subject}
-From: {email.sender} <{email.sender_email}>
-Date: {email.received_date.isoformat()}
-Body:
-{email.body}
-    """
-    
-    # Add attachment content if available
-    if email.attachments:
-        content_to_analyze += "\n\nAttachments:"
-        for attachment in email.attachments:
-            if attachment.content:
-                content_to_analyze += f"\n\n{attachment.name}:\n{attachment.content}"
-    
-    # Create the prompt for the LLM
-    system_prompt = """
+
+def get_token_budget(model: str) -> TokenBucket:
+    """Token bucket pacing calls to `model` at LLM_TOKENS_PER_MINUTE"""
+    if model not in _token_budgets:
+        _token_budgets[model] = TokenBucket(
+            rate=settings.LLM_TOKENS_PER_MINUTE / 60,
+            capacity=settings.LLM_TOKENS_PER_MINUTE
+        )
+    return _token_budgets[model]
+
+
+SYSTEM_PROMPT = """
 You are an AI assistant that analyzes emails to extract knowledge and detect sensitive information.
 Analyze the provided email and extract the following information:
 1. Sensitivity level (low, medium, high, critical)
@@ -45,11 +45,11 @@ Analyze the provided email and extract the following information:
 
 Respond with a JSON object containing these fields.
 """
-    
-    user_prompt = f"""
+
+USER_PROMPT_TEMPLATE = """
 Please analyze this email content:
 
-{content_to_analyze}
+{content}
 
 Return a JSON object with the following fields:
 - sensitivity: The sensitivity level (low, medium, high, critical)
@@ -61,46 +61,357 @@ Return a JSON object with the following fields:
 - summary: Brief summary of the content
 - key_points: Array of key knowledge points extracted
 """
+
+BATCH_SYSTEM_PROMPT = """
+You are an AI assistant that analyzes emails to extract knowledge and detect sensitive information.
+You will receive several emails, each introduced by a line "### Email <id>". Analyze each email
+independently and extract for each one:
+1. Sensitivity level (low, medium, high, critical)
+2. Department the knowledge belongs to (general, engineering, product, marketing, sales, finance, hr, legal, other)
+3. Relevant tags for categorizing the content (3-5 tags)
+4. Whether the email contains private/confidential information (true/false)
+5. Types of personal identifiable information (PII) detected (name, email, phone, address, ssn, passport, credit_card, bank_account, date_of_birth, salary, other)
+6. Recommended action (store or exclude)
+7. Brief summary of the content (1-2 sentences)
+8. Key knowledge points extracted (3-5 bullet points)
+
+Respond with a JSON object {"analyses": {"<id>": {...}, ...}} with one entry per email ID.
+"""
+
+BATCH_USER_PROMPT_TEMPLATE = """
+Please analyze these emails:
+
+{content}
+
+Return a JSON object {{"analyses": {{...}}}} mapping each email ID to an object with the fields:
+- sensitivity: The sensitivity level (low, medium, high, critical)
+- department: The department this knowledge belongs to (general, engineering, product, marketing, sales, finance, hr, legal, other)
+- tags: Array of relevant tags for categorizing this content (3-5 tags)
+- is_private: Boolean indicating if this contains private/confidential information
+- pii_detected: Array of PII types detected (empty array if none)
+- recommended_action: "store" or "exclude"
+- summary: Brief summary of the content
+- key_points: Array of key knowledge points extracted
+"""
+
+# Changes whenever any prompt changes, invalidating cached analyses
+PROMPT_HASH = hashlib.sha256(
+    (SYSTEM_PROMPT + USER_PROMPT_TEMPLATE + BATCH_SYSTEM_PROMPT + BATCH_USER_PROMPT_TEMPLATE).encode("utf-8")
+).hexdigest()[:16]
+
+# Parsed analyses (EmailAnalysis JSON), keyed by content, model, temperature and prompt
+analysis_cache = TieredCache(
+    settings.ANALYSIS_CACHE_DB,
+    memory_bytes=settings.ANALYSIS_CACHE_MEMORY_BYTES,
+    disk_bytes=settings.ANALYSIS_CACHE_DISK_BYTES,
+    ttl=settings.ANALYSIS_CACHE_TTL
+)
+register_collector("analysis_cache", analysis_cache.metrics)
+
+# Calls and prompt tokens (local estimates) by mode, since process start
+analysis_stats = {
+    "single_calls": 0,
+    "single_prompt_tokens": 0,
+    "batch_calls": 0,
+    "batched_emails": 0,
+    "batched_prompt_tokens": 0,
+    # What the batched emails would have cost as single calls
+    "batched_single_equivalent_tokens": 0,
+    "batch_fallbacks": 0,
+    # Content tokens removed by the prompt budget (quoted history, boilerplate, truncation)
+    "budget_tokens_trimmed": 0
+}
+
+
+def _analysis_metrics() -> Dict[str, Any]:
+    """Call counts plus prompt tokens per email, single vs batched (before and after)"""
+    stats = analysis_stats
+    batched = stats["batched_emails"] or 1
+    return {
+        **stats,
+        "tokens_per_email_single": stats["single_prompt_tokens"] / (stats["single_calls"] or 1),
+        "tokens_per_batched_email_before": stats["batched_single_equivalent_tokens"] / batched,
+        "tokens_per_batched_email_after": stats["batched_prompt_tokens"] / batched
+    }
+
+
+register_collector("llm", _analysis_metrics)
+
+
+@lru_cache(maxsize=None)
+def _template_tokens(template: str) -> int:
+    """Tokens of a fixed prompt (counted once)"""
+    return count_tokens(template)
+
+
+def build_content(email: EmailContent) -> str:
+    """The email text sent for analysis: headers, latest reply, history and attachments within the token budget"""
+    return plan_prompt(email)[0]
+
+
+def analysis_cache_key(content_to_analyze: str, model: Optional[str] = None, temperature: Optional[float] = None) -> str:
+    """Cache key: model, temperature, prompt hash and SHA-256 of the whitespace-normalized content"""
+    normalized = " ".join(content_to_analyze.split())
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    model = model or settings.LLM_MODEL
+    temperature = settings.LLM_TEMPERATURE if temperature is None else temperature
+    return f"{model}:{temperature}:{PROMPT_HASH}:{digest}"
+
+
+def _to_analysis(result: Dict[str, Any]) -> EmailAnalysis:
+    """Build an EmailAnalysis from the model's JSON, filling in defaults"""
+    return EmailAnalysis(
+        sensitivity=result.get("sensitivity", "low"),
+        department=result.get("department", "general"),
+        tags=result.get("tags", []),
+        is_private=result.get("is_private", False),
+        pii_detected=result.get("pii_detected", []),
+        recommended_action=result.get("recommended_action", "exclude" if result.get("is_private", False) else "store"),
+        summary=result.get("summary", ""),
+        key_points=result.get("key_points", [])
+    )
+
+
+# Tag marking the placeholder analysis stored when the model call fails
+FAILED_ANALYSIS_TAG = "processing_failed"
+
+
+def _failed_analysis() -> EmailAnalysis:
+    """Default analysis used when the model call fails"""
+    return EmailAnalysis(
+        sensitivity=SensitivityLevel.LOW,
+        department=Department.GENERAL,
+        tags=["error", FAILED_ANALYSIS_TAG],
+        is_private=True,  # Default to private if analysis fails
+        pii_detected=[],
+        recommended_action="exclude",
+        summary="Analysis failed. Please review manually.",
+        key_points=["Analysis failed due to an error."]
+    )
+
+
+def is_failed_analysis(analysis: EmailAnalysis) -> bool:
+    """Whether an analysis is the placeholder stored after a failed model call"""
+    return FAILED_ANALYSIS_TAG in analysis.tags
+
+
+async def _complete_json(system_prompt: str, user_prompt: str, prompt_tokens: int, output_tokens: int) -> Dict[str, Any]:
+    """One JSON-mode chat completion, paced by the model's tokens-per-minute budget"""
+    # Wait for room in the model's tokens-per-minute budget
+    budget = get_token_budget(settings.LLM_MODEL)
+    reserved = prompt_tokens + output_tokens
+    await budget.acquire(reserved)
+    
+    # Call OpenAI API
+    response = await client.chat.completions.create(
+        model=settings.LLM_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=settings.LLM_TEMPERATURE,
+        response_format={"type": "json_object"}
+    )
+    
+    # Settle the reservation against actual usage
+    if response.usage:
+        budget.adjust(response.usage.total_tokens - reserved)
+    
+    return json.loads(response.choices[0].message.content)
+
+
+def _single_prompt_tokens(content_tokens: int) -> int:
+    return _template_tokens(SYSTEM_PROMPT) + _template_tokens(USER_PROMPT_TEMPLATE) + content_tokens
+
+
+async def _analyze_single(content_to_analyze: str, cache_key: str, content_tokens: int) -> EmailAnalysis:
+    """Analyze one email in its own request"""
+    user_prompt = USER_PROMPT_TEMPLATE.format(content=content_to_analyze)
+    prompt_tokens = _single_prompt_tokens(content_tokens)
+    analysis_stats["single_calls"] += 1
+    analysis_stats["single_prompt_tokens"] += prompt_tokens
     
     try:
-        # Call OpenAI API
-        response = await client.chat.completions.create(
-            model=settings.LLM_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
+        result = await _complete_json(SYSTEM_PROMPT, user_prompt, prompt_tokens, settings.LLM_OUTPUT_TOKEN_ESTIMATE)
         
         # Parse the response
-        result = json.loads(response.choices[0].message.content)
-        
-        # Create EmailAnalysis object
-        analysis = EmailAnalysis(
-            sensitivity=result.get("sensitivity", "low"),
-            department=result.get("department", "general"),
-            tags=result.get("tags", []),
-            is_private=result.get("is_private", False),
-            pii_detected=result.get("pii_detected", []),
-            recommended_action=result.get("recommended_action", "exclude" if result.get("is_private", False) else "store"),
-            summary=result.get("summary", ""),
-            key_points=result.get("key_points", [])
-        )
+        analysis = _to_analysis(result)
         
+        # Only successful analyses are cached
+        await asyncio.to_thread(analysis_cache.set, cache_key, analysis.model_dump_json().encode("utf-8"))
         return analysis
     
     except Exception as e:
         # Log the error and return a default analysis
         print(f"Error analyzing email: {str(e)}")
-        return EmailAnalysis(
-            sensitivity=SensitivityLevel.LOW,
-            department=Department.GENERAL,
-            tags=["error", "processing_failed"],
-            is_private=True,  # Default to private if analysis fails
-            pii_detected=[],
-            recommended_action="exclude",
-            summary="Analysis failed. Please review manually.",
-            key_points=["Analysis failed due to an error."]
+        return _failed_analysis()
+
+
+# A pending batched item: content, cache key, content tokens and the caller's future
+PendingAnalysis = Tuple[str, str, int, asyncio.Future]
+
+
+class AnalysisBatcher:
+    """
+    Packs concurrent short-email analyses into shared JSON-mode requests
+    Items collect for LLM_BATCH_WINDOW_MS; a batch is sent early once it
+    holds LLM_BATCH_MAX_EMAILS emails or the next email would push its
+    estimated prompt past LLM_BATCH_MAX_PROMPT_TOKENS. Each returned
+    analysis is validated against EmailAnalysis; missing or invalid items
+    fall back to single-email calls.
+    """
+
+    def __init__(self):
+        self._pending: List[PendingAnalysis] = []
+        self._pending_tokens = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    def _batch_tokens(self, content_tokens: int) -> int:
+        return _template_tokens(BATCH_SYSTEM_PROMPT) + _template_tokens(BATCH_USER_PROMPT_TEMPLATE) + content_tokens
+
+    async def analyze(self, content_to_analyze: str, cache_key: str, content_tokens: int) -> EmailAnalysis:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        if self._pending and self._batch_tokens(self._pending_tokens + content_tokens) > settings.LLM_BATCH_MAX_PROMPT_TOKENS:
+            self._flush()
+        self._pending.append((content_to_analyze, cache_key, content_tokens, future))
+        self._pending_tokens += content_tokens
+        
+        if len(self._pending) >= settings.LLM_BATCH_MAX_EMAILS:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(settings.LLM_BATCH_WINDOW_MS / 1000, self._flush)
+        
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        self._pending_tokens = 0
+        if pending:
+            # Hold a reference so the flush task isn't garbage collected mid-flight
+            task = asyncio.ensure_future(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending: List[PendingAnalysis]) -> None:
+        try:
+            if len(pending) == 1:
+                content, cache_key, tokens, future = pending[0]
+                results = [await _analyze_single(content, cache_key, tokens)]
+            else:
+                results = await self._run_batch(pending)
+            for (_, _, _, future), analysis in zip(pending, results):
+                if not future.done():
+                    future.set_result(analysis)
+        except Exception as e:
+            for _, _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _run_batch(self, pending: List[PendingAnalysis]) -> List[EmailAnalysis]:
+        # Short positional IDs instead of Graph message IDs, which cost ~40 tokens each
+        ids = [f"e{index + 1}" for index in range(len(pending))]
+        content = "\n\n".join(
+            f"### Email {email_id}\n{item[0].strip()}" for email_id, item in zip(ids, pending)
         )
+        content_tokens = sum(item[2] for item in pending)
+        prompt_tokens = self._batch_tokens(content_tokens)
+        analysis_stats["batch_calls"] += 1
+        analysis_stats["batched_emails"] += len(pending)
+        analysis_stats["batched_prompt_tokens"] += prompt_tokens
+        analysis_stats["batched_single_equivalent_tokens"] += sum(_single_prompt_tokens(item[2]) for item in pending)
+        
+        try:
+            result = await _complete_json(
+                BATCH_SYSTEM_PROMPT,
+                BATCH_USER_PROMPT_TEMPLATE.format(content=content),
+                prompt_tokens,
+                settings.LLM_OUTPUT_TOKEN_ESTIMATE * len(pending)
+            )
+            analyses = result.get("analyses") or {}
+        except Exception as e:
+            print(f"Error analyzing email batch: {str(e)}")
+            analyses = {}
+        
+        results: List[Optional[EmailAnalysis]] = []
+        for email_id in ids:
+            try:
+                results.append(EmailAnalysis.model_validate(analyses[email_id]))
+            except Exception:
+                results.append(None)
+        
+        # The batch's valid analyses are cached in one write
+        valid = [(item[1], analysis) for item, analysis in zip(pending, results) if analysis is not None]
+        if valid:
+            await asyncio.to_thread(
+                analysis_cache.set_many,
+                [(cache_key, analysis.model_dump_json().encode("utf-8")) for cache_key, analysis in valid]
+            )
+        
+        async def resolve(item: PendingAnalysis, analysis: Optional[EmailAnalysis]) -> EmailAnalysis:
+            if analysis is not None:
+                return analysis
+            content_to_analyze, cache_key, tokens, _ = item
+            analysis_stats["batch_fallbacks"] += 1
+            return await _analyze_single(content_to_analyze, cache_key, tokens)
+        
+        return await asyncio.gather(*[resolve(item, analysis) for item, analysis in zip(pending, results)])
+
+
+# Shared batcher for short emails
+analysis_batcher = AnalysisBatcher()
+
+
+async def analyze_email_content(email: EmailContent) -> EmailAnalysis:
+    """
+    Analyze email content using ChatGPT-4o mini to extract knowledge, tags, and detect PII
+    Results are cached by content, model, temperature and prompt version;
+    a cache hit skips the API call entirely. Short emails analyzed
+    concurrently are packed into shared batch requests.
+    """
+    # Prepare the content for analysis, fitted to the token budget
+    content_to_analyze, report = plan_prompt(email)
+    analysis_stats["budget_tokens_trimmed"] += max(0, report["original_tokens"] - report["content_tokens"])
+    
+    cache_key = analysis_cache_key(content_to_analyze)
+    cached = await asyncio.to_thread(analysis_cache.get, cache_key)
+    if cached is not None:
+        return EmailAnalysis.model_validate_json(cached)
+    
+    content_tokens = report["content_tokens"]
+    if settings.LLM_BATCHING_ENABLED and content_tokens <= settings.LLM_BATCH_MAX_EMAIL_TOKENS:
+        return await analysis_batcher.analyze(content_to_analyze, cache_key, content_tokens)
+    return await _analyze_single(content_to_analyze, cache_key, content_tokens)
+
+
+def estimate_analysis(emails: List[EmailContent]) -> Dict[str, Any]:
+    """
+    Forecast the tokens, cost and rate-limited duration of analyzing emails
+    Uses the same prompt budget as analysis; attachments not downloaded yet
+    are counted at their full share, and every email is priced as a single
+    call, so the forecast is an upper bound.
+    """
+    per_email = []
+    for email in emails:
+        _, report = plan_prompt(email, estimate_unloaded=True)
+        report["prompt_tokens"] = _single_prompt_tokens(report["content_tokens"])
+        per_email.append(report)
+    
+    input_tokens = sum(report["prompt_tokens"] for report in per_email)
+    output_tokens = settings.LLM_OUTPUT_TOKEN_ESTIMATE * len(per_email)
+    return {
+        "emails": len(per_email),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "original_tokens": sum(report["original_tokens"] for report in per_email),
+        "cost_usd": (
+            input_tokens * settings.LLM_INPUT_COST_PER_MTOK + output_tokens * settings.LLM_OUTPUT_COST_PER_MTOK
+        ) / 1_000_000,
+        "minutes": (input_tokens + output_tokens) / settings.LLM_TOKENS_PER_MINUTE,
+        "per_email": per_email
+    }
@@ -1,51 +1,39 @@
-import httpx
+import asyncio
+import tempfile
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, BinaryIO
 
 from app.models.email import EmailPreview, EmailContent, EmailAttachment
+from app.services.graph_client import get_graph_client
+from app.services.parser import is_supported_content_type, parse_attachment_file
 from app.config import settings
 
 
 async def get_user_info(access_token: str) -> Dict[str, Any]:
     """Get user information from Microsoft Graph API"""
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        response = await client.get(
-            "https://graph.microsoft.com/v1.0/me",
-            headers=headers
-        )
-        response.raise_for_status()
-        return response.json()
+    client = get_graph_client()
+    return await client.get_json("/me", access_token)
 
 
 async def get_email_folders(access_token: str) -> List[Dict[str, Any]]:
     """Get list of email folders from Outlook"""
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        response = await client.get(
-            "https://graph.microsoft.com/v1.0/me/mailFolders",
-            headers=headers
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data.get("value", [])
+    client = get_graph_client()
+    data = await client.get_json("/me/mailFolders", access_token)
+    return data.get("value", [])
 
 
-async def get_email_preview(
-    access_token: str,
-    folder_id: Optional[str] = None,
+# Expand attachment metadata only; contentBytes is never pulled inline
+ATTACHMENT_EXPAND = "attachments($select=id,name,contentType,size,isInline)"
+
+
+def _build_preview_params(
+    page_size: int,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     keywords: Optional[List[str]] = None,
     sender: Optional[str] = None
-) -> List[EmailPreview]:
-    """Get preview of emails based on filter criteria"""
+) -> Dict[str, Any]:
+    """Build Graph query parameters for a filtered message listing"""
     # Build filter query
     filter_parts = []
     
@@ -63,12 +51,9 @@ async def get_email_preview(
     if keywords and len(keywords) > 0:
         search_query = " OR ".join(keywords)
     
-    # Determine folder endpoint
-    folder_path = f"/{folder_id}" if folder_id else ""
-    
     # Build query parameters
     params = {
-        "$top": settings.MAX_PREVIEW_EMAILS,
+        "$top": page_size,
         "$select": "id,subject,from,receivedDateTime,bodyPreview",
         "$orderby": "receivedDateTime desc"
     }
@@ -79,33 +64,216 @@ async def get_email_preview(
     if search_query:
         params["$search"] = f'"{search_query}"'
     
+    return params
+
+
+def _messages_path(folder_id: Optional[str] = None) -> str:
+    """Graph path of the message collection for a folder (or the whole mailbox)"""
+    return f"/me/mailFolders/{folder_id}/messages" if folder_id else "/me/messages"
+
+
+def _to_email_preview(item: Dict[str, Any]) -> EmailPreview:
+    """Convert a Graph message resource to an EmailPreview"""
+    return EmailPreview(
+        id=item.get("id"),
+        subject=item.get("subject", "(No subject)"),
+        sender=item.get("from", {}).get("emailAddress", {}).get("name", "Unknown"),
+        received_date=datetime.fromisoformat(item.get("receivedDateTime").replace("Z", "+00:00")),
+        snippet=item.get("bodyPreview", "")
+    )
+
+
+async def get_email_preview(
+    access_token: str,
+    folder_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    keywords: Optional[List[str]] = None,
+    sender: Optional[str] = None
+) -> List[EmailPreview]:
+    """Get preview of emails based on filter criteria"""
+    params = _build_preview_params(
+        settings.MAX_PREVIEW_EMAILS,
+        start_date=start_date,
+        end_date=end_date,
+        keywords=keywords,
+        sender=sender
+    )
+    
     # Make API request
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        response = await client.get(
-            f"https://graph.microsoft.com/v1.0/me/mailFolders{folder_path}/messages",
-            headers=headers,
-            params=params
-        )
-        response.raise_for_status()
-        data = response.json()
-        
-        # Convert to EmailPreview objects
-        previews = []
-        for item in data.get("value", []):
-            preview = EmailPreview(
-                id=item.get("id"),
-                subject=item.get("subject", "(No subject)"),
-                sender=item.get("from", {}).get("emailAddress", {}).get("name", "Unknown"),
-                received_date=datetime.fromisoformat(item.get("receivedDateTime").replace("Z", "+00:00")),
-                snippet=item.get("bodyPreview", "")
+    client = get_graph_client()
+    data = await client.get_json(_messages_path(folder_id), access_token, params=params)
+    
+    # Convert to EmailPreview objects
+    return [_to_email_preview(item) for item in data.get("value", [])]
+
+
+async def iter_email_previews(
+    access_token: str,
+    folder_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    keywords: Optional[List[str]] = None,
+    sender: Optional[str] = None,
+    page_size: Optional[int] = None,
+    max_results: Optional[int] = None
+) -> AsyncIterator[EmailPreview]:
+    """
+    Crawl every message matching the filter criteria in one folder,
+    following @odata.nextLink and yielding previews as each page arrives
+    """
+    params = _build_preview_params(
+        page_size or settings.GRAPH_PAGE_SIZE,
+        start_date=start_date,
+        end_date=end_date,
+        keywords=keywords,
+        sender=sender
+    )
+    
+    client = get_graph_client()
+    yielded = 0
+    async for page in client.iter_pages(_messages_path(folder_id), access_token, params=params):
+        for item in page:
+            yield _to_email_preview(item)
+            yielded += 1
+            if max_results is not None and yielded >= max_results:
+                return
+
+
+async def crawl_email_previews(
+    access_token: str,
+    folder_ids: Optional[List[str]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    keywords: Optional[List[str]] = None,
+    sender: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    max_results: Optional[int] = None
+) -> AsyncIterator[EmailPreview]:
+    """
+    Crawl several folders at once, yielding previews in arrival order
+    At most `concurrency` folders are fetched in parallel, and a bounded
+    queue applies backpressure so memory stays flat however large the
+    mailbox is.
+    """
+    folders: List[Optional[str]] = list(folder_ids) if folder_ids else [None]
+    semaphore = asyncio.Semaphore(concurrency or settings.CRAWL_CONCURRENCY)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.CRAWL_QUEUE_SIZE)
+    done = object()
+    
+    async def crawl_folder(folder_id: Optional[str]) -> None:
+        try:
+            async with semaphore:
+                async for preview in iter_email_previews(
+                    access_token,
+                    folder_id=folder_id,
+                    start_date=start_date,
+                    end_date=end_date,
+                    keywords=keywords,
+                    sender=sender,
+                    max_results=max_results
+                ):
+                    await queue.put(preview)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+        await queue.put(done)
+    
+    tasks = [asyncio.create_task(crawl_folder(folder_id)) for folder_id in folders]
+    remaining = len(tasks)
+    yielded = 0
+    try:
+        while remaining:
+            item = await queue.get()
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+                yielded += 1
+                if max_results is not None and yielded >= max_results:
+                    return
+    finally:
+        # Stop outstanding folder crawls if the consumer goes away early
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def iter_message_delta(
+    access_token: str,
+    folder_id: str,
+    delta_link: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    page_size: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield the raw pages of one messages/delta round for a folder
+    Without a delta_link this is an initial sync of the folder; with one,
+    only messages added, changed or removed since that link was issued are
+    returned. The final page carries the next @odata.deltaLink.
+    """
+    client = get_graph_client()
+    headers = {"Prefer": f"odata.maxpagesize={page_size or settings.GRAPH_PAGE_SIZE}"}
+    
+    params: Optional[Dict[str, Any]] = None
+    next_url = delta_link
+    if not next_url:
+        next_url = f"/me/mailFolders/{folder_id}/messages/delta"
+        params = {"$select": "id,subject,from,receivedDateTime,bodyPreview"}
+        if start_date:
+            params["$filter"] = f"receivedDateTime ge {start_date.isoformat()}"
+    
+    while next_url:
+        data = await client.get_json(next_url, access_token, params=params, headers=headers)
+        yield data
+        next_url = data.get("@odata.nextLink")
+        params = None
+
+
+def _to_email_content(data: Dict[str, Any]) -> EmailContent:
+    """Convert a Graph message resource (with expanded attachments) to EmailContent"""
+    # Extract attachment information
+    attachments = []
+    for attachment in data.get("attachments", []):
+        # Only process file attachments (the type annotation may be absent
+        # when the attachment properties are selected explicitly)
+        if attachment.get("@odata.type", "#microsoft.graph.fileAttachment") == "#microsoft.graph.fileAttachment":
+            attachment_obj = EmailAttachment(
+                id=attachment.get("id"),
+                name=attachment.get("name"),
+                content_type=attachment.get("contentType"),
+                size=attachment.get("size", 0),
+                # Attachment bodies are not fetched here; they are streamed
+                # on demand through download_attachment
             )
-            previews.append(preview)
-        
-        return previews
+            attachments.append(attachment_obj)
+    
+    # Create EmailContent object
+    return EmailContent(
+        id=data.get("id"),
+        internet_message_id=data.get("internetMessageId"),
+        subject=data.get("subject", "(No subject)"),
+        sender=data.get("from", {}).get("emailAddress", {}).get("name", "Unknown"),
+        sender_email=data.get("from", {}).get("emailAddress", {}).get("address", ""),
+        recipients=[
+            recipient.get("emailAddress", {}).get("address", "")
+            for recipient in data.get("toRecipients", [])
+        ],
+        cc_recipients=[
+            recipient.get("emailAddress", {}).get("address", "")
+            for recipient in data.get("ccRecipients", [])
+        ],
+        received_date=datetime.fromisoformat(data.get("receivedDateTime").replace("Z", "+00:00")),
+        body=data.get("body", {}).get("content", ""),
+        is_html=data.get("body", {}).get("contentType", "") == "html",
+        folder_id=data.get("parentFolderId", ""),
+        folder_name="",  # We would need another API call to get the folder name
+        attachments=attachments,
+        importance=data.get("importance", "normal")
+    )
 
 
 async def get_email_content(
@@ -113,60 +281,116 @@ async def get_email_content(
     email_id: str
 ) -> EmailContent:
     """Get full content of a specific email including attachments"""
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
+    client = get_graph_client()
+    
+    # Get email details
+    data = await client.get_json(
+        f"/me/messages/{email_id}",
+        access_token,
+        params={
+            "$expand": ATTACHMENT_EXPAND
         }
-        
-        # Get email details
-        response = await client.get(
-            f"https://graph.microsoft.com/v1.0/me/messages/{email_id}",
-            headers=headers,
-            params={
-                "$expand": "attachments"
+    )
+    
+    return _to_email_content(data)
+
+
+async def get_email_contents(
+    access_token: str,
+    email_ids: List[str]
+) -> Dict[str, EmailContent]:
+    """
+    Get full content of many emails, packing up to GRAPH_BATCH_SIZE message
+    fetches into each Graph $batch call
+    Emails that could not be fetched are left out of the result.
+    """
+    client = get_graph_client()
+    semaphore = asyncio.Semaphore(settings.CRAWL_CONCURRENCY)
+    contents: Dict[str, EmailContent] = {}
+    
+    async def fetch_batch(batch_ids: List[str]) -> None:
+        requests = [
+            {
+                "id": str(index),
+                "method": "GET",
+                "url": f"/me/messages/{email_id}?$expand={ATTACHMENT_EXPAND}"
             }
-        )
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract attachment information
-        attachments = []
-        for attachment in data.get("attachments", []):
-            # Only process file attachments
-            if attachment.get("@odata.type") == "#microsoft.graph.fileAttachment":
-                attachment_obj = EmailAttachment(
-                    id=attachment.get("id"),
-                    name=attachment.get("name"),
-                    content_type=attachment.get("contentType"),
-                    size=attachment.get("size", 0),
-                    # Base64 content is available in attachment.get("contentBytes")
-                    # We'll process this separately in the parser service
-                )
-                attachments.append(attachment_obj)
-        
-        # Create EmailContent object
-        content = EmailContent(
-            id=data.get("id"),
-            internet_message_id=data.get("internetMessageId"),
-            subject=data.get("subject", "(No subject)"),
-            sender=data.get("from", {}).get("emailAddress", {}).get("name", "Unknown"),
-            sender_email=data.get("from", {}).get("emailAddress", {}).get("address", ""),
-            recipients=[
-                recipient.get("emailAddress", {}).get("address", "")
-                for recipient in data.get("toRecipients", [])
-            ],
-            cc_recipients=[
-                recipient.get("emailAddress", {}).get("address", "")
-                for recipient in data.get("ccRecipients", [])
-            ],
-            received_date=datetime.fromisoformat(data.get("receivedDateTime").replace("Z", "+00:00")),
-            body=data.get("body", {}).get("content", ""),
-            is_html=data.get("body", {}).get("contentType", "") == "html",
-            folder_id=data.get("parentFolderId", ""),
-            folder_name="",  # We would need another API call to get the folder name
-            attachments=attachments,
-            importance=data.get("importance", "normal")
-        )
+            for index, email_id in enumerate(batch_ids)
+        ]
+        async with semaphore:
+            responses = await client.batch(requests, access_token)
         
-        return content
+        for index, email_id in enumerate(batch_ids):
+            sub_response = responses.get(str(index))
+            if sub_response and 200 <= sub_response.get("status", 500) < 300:
+                contents[email_id] = _to_email_content(sub_response.get("body", {}))
+            else:
+                status = sub_response.get("status") if sub_response else "no response"
+                print(f"Error fetching email {email_id}: {status}")
+    
+    unique_ids = list(dict.fromkeys(email_ids))
+    batch_size = settings.GRAPH_BATCH_SIZE
+    await asyncio.gather(*[
+        fetch_batch(unique_ids[i:i + batch_size])
+        for i in range(0, len(unique_ids), batch_size)
+    ])
+    
+    return contents
+
+
+def should_download_attachment(attachment: EmailAttachment) -> bool:
+    """Whether an attachment is worth downloading: a parseable type within the size cap"""
+    return (
+        is_supported_content_type(attachment.content_type)
+        and 0 < attachment.size <= settings.ATTACHMENT_MAX_BYTES
+    )
+
+
+async def download_attachment(
+    access_token: str,
+    email_id: str,
+    attachment_id: str,
+    size: Optional[int] = None
+) -> BinaryIO:
+    """
+    Stream an attachment's raw bytes into a temp file
+    Small attachments stay in memory; larger ones spill to disk, so memory
+    use per download is bounded by ATTACHMENT_SPOOL_BYTES. Attachments whose
+    expected size is over that go straight to a named file, which parser
+    workers open by path. The caller owns (and must close) the returned file.
+    """
+    client = get_graph_client()
+    if size is not None and size > settings.ATTACHMENT_SPOOL_BYTES:
+        spool = tempfile.NamedTemporaryFile()
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=settings.ATTACHMENT_SPOOL_BYTES)
+    try:
+        async with client.stream(
+            f"/me/messages/{email_id}/attachments/{attachment_id}/$value",
+            access_token
+        ) as response:
+            response.raise_for_status()
+            written = 0
+            async for chunk in response.aiter_bytes(settings.ATTACHMENT_CHUNK_BYTES):
+                written += len(chunk)
+                if written > settings.ATTACHMENT_MAX_BYTES:
+                    raise ValueError(f"Attachment {attachment_id} exceeds {settings.ATTACHMENT_MAX_BYTES} bytes")
+                spool.write(chunk)
+        spool.seek(0)
+        return spool
+    except BaseException:
+        spool.close()
+        raise
+
+
+async def load_attachment_contents(access_token: str, email: EmailContent) -> EmailContent:
+    """Download and parse the eligible attachments of an email, filling in their content"""
+    for attachment in email.attachments or []:
+        if attachment.content is not None or not should_download_attachment(attachment):
+            continue
+        try:
+            with await download_attachment(access_token, email.id, attachment.id, attachment.size) as file:
+                attachment.content = await parse_attachment_file(file, attachment.content_type)
+        except Exception as e:
+            print(f"Error downloading attachment {attachment.id}: {str(e)}")
+    return email
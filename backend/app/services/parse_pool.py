@@ -0,0 +1,140 @@
+import asyncio
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from app.config import settings
+
+
+class ParseTimeoutError(Exception):
+    """Raised when a parse job exceeds its time budget"""
+
+
+def _init_worker(memory_limit_mb: int) -> None:
+    """Cap the address space of a parser worker process"""
+    if memory_limit_mb <= 0:
+        return
+    try:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        # Not supported on this platform; run without a memory cap
+        pass
+
+
+def _on_alarm(signum, frame):
+    raise ParseTimeoutError("Parse job timed out")
+
+
+def _run_with_timeout(job: Callable[..., Any], timeout: float, *args) -> Any:
+    """Run a job inside a worker, interrupting it after `timeout` seconds"""
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return job(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class ParsingEngine:
+    """
+    Runs CPU-bound parse jobs in a process pool so they never block the
+    event loop
+    At most PARSER_QUEUE_SIZE jobs may be queued or running; further callers
+    wait for a slot, which applies backpressure to bulk ingest. Each job is
+    interrupted inside its worker after PARSER_JOB_TIMEOUT seconds, and
+    workers are capped at PARSER_WORKER_MEMORY_MB of address space.
+    """
+
+    def __init__(
+        self,
+        job: Callable[..., Any],
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+        memory_limit_mb: Optional[int] = None
+    ):
+        self.job = job
+        self.workers = workers or settings.PARSER_WORKERS
+        self.timeout = timeout or settings.PARSER_JOB_TIMEOUT
+        self.memory_limit_mb = memory_limit_mb if memory_limit_mb is not None else settings.PARSER_WORKER_MEMORY_MB
+        self._slots = asyncio.Semaphore(queue_size or settings.PARSER_QUEUE_SIZE)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.in_flight = 0
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        """Underlying process pool, created on first use if not started"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.memory_limit_mb,)
+            )
+        return self._pool
+
+    async def start(self) -> None:
+        """Spin up the worker pool (called from the application lifespan)"""
+        self.pool
+
+    async def close(self) -> None:
+        """Shut the pool down, dropping jobs that have not started"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def submit(self, *args) -> Any:
+        """
+        Run the job with `args` in a worker process and return its result
+        Cancelling the awaiting task cancels the job if it has not started.
+        """
+        async with self._slots:
+            self.submitted += 1
+            self.in_flight += 1
+            loop = asyncio.get_running_loop()
+            pool = self.pool
+            try:
+                future = loop.run_in_executor(pool, _run_with_timeout, self.job, self.timeout, *args)
+                result = await future
+                self.completed += 1
+                return result
+            except ParseTimeoutError:
+                self.timeouts += 1
+                raise
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+            except BrokenProcessPool:
+                # A worker died (e.g. hit its memory cap); start a fresh pool,
+                # unless another job already replaced this one
+                self.failed += 1
+                if self._pool is pool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = None
+                raise
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of job counters"""
+        return {
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "in_flight": self.in_flight
+        }
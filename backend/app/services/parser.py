@@ -1,9 +1,16 @@
+import asyncio
 import base64
+import hashlib
 import io
-from typing import Optional
+import os
+import shutil
+import tempfile
+from typing import Optional, Tuple, Union, BinaryIO, Iterator
 
 # PDF parsing
-from pdfminer.high_level import extract_text
+from pdfminer.high_level import extract_text, extract_pages
+from pdfminer.layout import LTTextContainer
+from pdfminer.pdfpage import PDFPage
 
 # DOCX parsing
 import docx
@@ -11,48 +18,267 @@ import docx
 # Excel parsing
 import openpyxl
 
+from app.config import settings
+from app.services.parse_pool import ParsingEngine
+from app.utils.cache import TieredCache
+from app.utils.metrics import register_collector
 
-async def parse_attachment(content_bytes: str, content_type: str) -> Optional[str]:
+# Bump whenever parser output changes so cached text is not reused
+PARSER_VERSION = "2"
+
+
+PDF_CONTENT_TYPE = "application/pdf"
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+EXCEL_CONTENT_TYPES = [
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.ms-excel"
+]
+
+
+def is_supported_content_type(content_type: Optional[str]) -> bool:
+    """Whether the parser can extract text from this MIME type"""
+    if not content_type:
+        return False
+    return (
+        content_type in (PDF_CONTENT_TYPE, DOCX_CONTENT_TYPE)
+        or content_type in EXCEL_CONTENT_TYPES
+        or content_type.startswith("text/")
+    )
+
+
+def _as_file(content: Union[bytes, BinaryIO]) -> BinaryIO:
+    """Wrap raw bytes in a file-like object; pass file objects through"""
+    if isinstance(content, (bytes, bytearray)):
+        return io.BytesIO(content)
+    content.seek(0)
+    return content
+
+
+def _parse_content(
+    content: Union[bytes, BinaryIO],
+    content_type: str,
+    max_chars: Optional[int] = None,
+    sample_rows: Optional[int] = None,
+    sample_pages: Optional[int] = None
+) -> str:
+    """
+    Parse binary content (bytes or a file object) based on its MIME type
+    With max_chars, sample_rows or sample_pages set, documents are extracted
+    in streaming, bounded mode (see extract_text_bounded).
+    """
+    if (max_chars is not None or sample_rows is not None or sample_pages is not None) and (
+        content_type in (PDF_CONTENT_TYPE, DOCX_CONTENT_TYPE) or content_type in EXCEL_CONTENT_TYPES
+    ):
+        return extract_text_bounded(
+            content, content_type, max_chars=max_chars, sample_rows=sample_rows, sample_pages=sample_pages
+        )
+    
+    if content_type == PDF_CONTENT_TYPE:
+        return parse_pdf(content)
+    
+    elif content_type == DOCX_CONTENT_TYPE:
+        return parse_docx(content)
+    
+    elif content_type in EXCEL_CONTENT_TYPES:
+        return parse_excel(content)
+    
+    elif content_type.startswith("text/"):
+        # Plain text files (a UTF-8 character is at most 4 bytes)
+        file = _as_file(content)
+        raw = file.read(max_chars * 4) if max_chars is not None else file.read()
+        text = raw.decode("utf-8", errors="replace")
+        return text[:max_chars] if max_chars is not None else text
+    
+    else:
+        # Unsupported file type
+        return f"[Unsupported file type: {content_type}]"
+
+
+def _parse_job(
+    source: Union[bytes, str],
+    content_type: str,
+    max_chars: Optional[int] = None,
+    sample_rows: Optional[int] = None,
+    sample_pages: Optional[int] = None
+) -> str:
+    """
+    Worker entry point: source is either the content itself (small files) or
+    the path of a file holding it, which the worker opens and parses in
+    place so large attachments are never copied through the pool
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as file:
+            return _parse_content(file, content_type, max_chars, sample_rows, sample_pages)
+    return _parse_content(source, content_type, max_chars, sample_rows, sample_pages)
+
+
+# Process pool for the CPU-bound PDF/DOCX/Excel parsers
+parsing_engine = ParsingEngine(_parse_job)
+register_collector("parser", parsing_engine.metrics)
+
+# Content-addressed cache of extracted text
+parse_cache = TieredCache(
+    settings.PARSE_CACHE_DB,
+    memory_bytes=settings.PARSE_CACHE_MEMORY_BYTES,
+    disk_bytes=settings.PARSE_CACHE_DISK_BYTES
+)
+parse_cache_bytes_saved = 0
+
+
+def _parse_cache_metrics():
+    return {**parse_cache.metrics(), "bytes_saved": parse_cache_bytes_saved}
+
+
+register_collector("parse_cache", _parse_cache_metrics)
+
+
+def _is_offloaded(content_type: str) -> bool:
+    """Whether a MIME type is parsed in the worker pool (and cached)"""
+    return content_type in (PDF_CONTENT_TYPE, DOCX_CONTENT_TYPE) or content_type in EXCEL_CONTENT_TYPES
+
+
+def _parse_cache_key(
+    file: BinaryIO,
+    content_type: str,
+    max_chars: Optional[int] = None,
+    sample_rows: Optional[int] = None,
+    sample_pages: Optional[int] = None
+) -> Tuple[str, int]:
+    """
+    Cache key (parser version, MIME type, extraction bounds and SHA-256 of
+    the content) and size of a file, hashed in ATTACHMENT_CHUNK_BYTES reads
+    """
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    for chunk in iter(lambda: file.read(settings.ATTACHMENT_CHUNK_BYTES), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return f"{PARSER_VERSION}:{content_type}:{max_chars}:{sample_rows}:{sample_pages}:{digest.hexdigest()}", size
+
+
+def _lookup_parsed(
+    file: BinaryIO,
+    content_type: str,
+    max_chars: Optional[int] = None,
+    sample_rows: Optional[int] = None,
+    sample_pages: Optional[int] = None
+) -> Tuple[str, int, Optional[str]]:
+    """Cache key, content size and cached text (None on a miss) of a file"""
+    key, size = _parse_cache_key(file, content_type, max_chars, sample_rows, sample_pages)
+    cached = parse_cache.get(key)
+    return key, size, cached.decode("utf-8") if cached is not None else None
+
+
+def _stage_for_worker(file: BinaryIO, size: int) -> Tuple[Union[bytes, str], Optional[str]]:
+    """
+    What to hand a parser worker for a file, and a temp path to remove
+    afterwards: the path of a file already on disk, the bytes of a file of
+    at most ATTACHMENT_SPOOL_BYTES, or else a copy made in chunks to a
+    named temp file
+    """
+    path = getattr(file, "name", None)
+    if isinstance(path, str) and os.path.isfile(path):
+        file.flush()
+        return path, None
+    if size <= settings.ATTACHMENT_SPOOL_BYTES:
+        file.seek(0)
+        return file.read(), None
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False) as staged:
+        shutil.copyfileobj(file, staged, settings.ATTACHMENT_CHUNK_BYTES)
+    return staged.name, staged.name
+
+
+async def _parse_offloaded(
+    file: BinaryIO,
+    content_type: str,
+    max_chars: Optional[int] = None,
+    sample_rows: Optional[int] = None,
+    sample_pages: Optional[int] = None
+) -> str:
+    """
+    Parse a file in the worker pool without blocking the event loop
+    PDF, DOCX and Excel results are looked up by content hash first, so the
+    same attachment is only ever parsed once. Hashing, cache access and
+    cheap text extraction run in a thread.
+    """
+    global parse_cache_bytes_saved
+    
+    if not _is_offloaded(content_type):
+        return await asyncio.to_thread(_parse_content, file, content_type, max_chars)
+    
+    key, size, cached = await asyncio.to_thread(_lookup_parsed, file, content_type, max_chars, sample_rows, sample_pages)
+    if cached is not None:
+        parse_cache_bytes_saved += size
+        return cached
+    
+    source, staged_path = await asyncio.to_thread(_stage_for_worker, file, size)
+    try:
+        text = await parsing_engine.submit(source, content_type, max_chars, sample_rows, sample_pages)
+    finally:
+        if staged_path is not None:
+            os.unlink(staged_path)
+    # Parsers report failures in-band; don't pin those in the cache
+    if not text.startswith("[Error"):
+        await asyncio.to_thread(parse_cache.set, key, text.encode("utf-8"))
+    return text
+
+
+async def parse_attachment(
+    content_bytes: str,
+    content_type: str,
+    max_chars: Optional[int] = settings.ATTACHMENT_MAX_CHARS,
+    sample_rows: Optional[int] = settings.EXCEL_SAMPLE_ROWS,
+    sample_pages: Optional[int] = settings.PDF_SAMPLE_PAGES
+) -> Optional[str]:
     """
     Parse attachment content based on file type
     content_bytes: Base64 encoded content
     content_type: MIME type of the attachment
+    max_chars: Stop extracting once this many characters are collected (None for full text)
+    sample_rows: Sample at most this many rows per spreadsheet sheet (None for all rows)
+    sample_pages: Read at most this many evenly spaced PDF pages (None for all pages)
     """
     try:
         # Decode base64 content
-        binary_content = base64.b64decode(content_bytes)
+        binary_content = await asyncio.to_thread(base64.b64decode, content_bytes)
         
         # Parse based on content type
-        if content_type == "application/pdf":
-            return parse_pdf(binary_content)
-        
-        elif content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            return parse_docx(binary_content)
-        
-        elif content_type in [
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            "application/vnd.ms-excel"
-        ]:
-            return parse_excel(binary_content)
-        
-        elif content_type.startswith("text/"):
-            # Plain text files
-            return binary_content.decode("utf-8", errors="replace")
-        
-        else:
-            # Unsupported file type
-            return f"[Unsupported file type: {content_type}]"
+        return await _parse_offloaded(io.BytesIO(binary_content), content_type, max_chars, sample_rows, sample_pages)
+    
+    except Exception as e:
+        print(f"Error parsing attachment: {str(e)}")
+        return f"[Error parsing attachment: {str(e)}]"
+
+
+async def parse_attachment_file(
+    file: BinaryIO,
+    content_type: str,
+    max_chars: Optional[int] = settings.ATTACHMENT_MAX_CHARS,
+    sample_rows: Optional[int] = settings.EXCEL_SAMPLE_ROWS,
+    sample_pages: Optional[int] = settings.PDF_SAMPLE_PAGES
+) -> Optional[str]:
+    """
+    Parse attachment content from a binary file object (e.g. a temp file
+    streamed from Graph) without base64-decoding it first
+    The file is hashed in chunks. A file on disk is parsed by path in the
+    worker; only small in-memory files are sent to it as bytes.
+    """
+    try:
+        return await _parse_offloaded(file, content_type, max_chars, sample_rows, sample_pages)
     
     except Exception as e:
         print(f"Error parsing attachment: {str(e)}")
         return f"[Error parsing attachment: {str(e)}]"
 
 
-def parse_pdf(content: bytes) -> str:
+def parse_pdf(content: Union[bytes, BinaryIO]) -> str:
     """Parse PDF content to extract text"""
     try:
         # Create a file-like object from bytes
-        pdf_file = io.BytesIO(content)
+        pdf_file = _as_file(content)
         
         # Extract text from PDF
         text = extract_text(pdf_file)
@@ -63,11 +289,11 @@ def parse_pdf(content: bytes) -> str:
         return f"[Error parsing PDF: {str(e)}]"
 
 
-def parse_docx(content: bytes) -> str:
+def parse_docx(content: Union[bytes, BinaryIO]) -> str:
     """Parse DOCX content to extract text"""
     try:
         # Create a file-like object from bytes
-        docx_file = io.BytesIO(content)
+        docx_file = _as_file(content)
         
         # Open the document
         doc = docx.Document(docx_file)
@@ -81,11 +307,11 @@ def parse_docx(content: bytes) -> str:
         return f"[Error parsing DOCX: {str(e)}]"
 
 
-def parse_excel(content: bytes) -> str:
+def parse_excel(content: Union[bytes, BinaryIO]) -> str:
     """Parse Excel content to extract text"""
     try:
         # Create a file-like object from bytes
-        excel_file = io.BytesIO(content)
+        excel_file = _as_file(content)
         
         # Open the workbook
         wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
@@ -109,3 +335,133 @@ def parse_excel(content: bytes) -> str:
     except Exception as e:
         print(f"Error parsing Excel: {str(e)}")
         return f"[Error parsing Excel: {str(e)}]"
+
+
+def iter_pdf_text(
+    content: Union[bytes, BinaryIO],
+    sample_pages: Optional[int] = None,
+    max_chars: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Yield the text of a PDF page by page; later pages are not parsed until requested
+    With sample_pages set, longer documents are read at an even page stride
+    (the first and last pages are always kept). With max_chars set, each page
+    read gets an even share of what is left of the budget, so the text
+    covers the whole document instead of stopping after its opening pages.
+    """
+    file = _as_file(content)
+    page_count = sum(1 for _ in PDFPage.get_pages(file))
+    file.seek(0)
+    page_numbers = list(range(page_count))
+    if sample_pages and page_count > sample_pages:
+        stride = -(-page_count // sample_pages)
+        page_numbers = sorted(set(page_numbers[::stride]) | {page_count - 1})
+        yield f"[Sampled every {stride} pages of {page_count}]\n"
+
+    remaining = max_chars
+    for index, page in enumerate(extract_pages(file, page_numbers=page_numbers)):
+        text = "".join(
+            element.get_text() for element in page if isinstance(element, LTTextContainer)
+        )
+        if not text.strip():
+            continue
+        if remaining is not None:
+            share = remaining // (len(page_numbers) - index)
+            if len(text) > share:
+                text = text[:share] + "\n[...]\n"
+            remaining -= len(text)
+        yield text
+
+
+def iter_docx_text(content: Union[bytes, BinaryIO]) -> Iterator[str]:
+    """Yield the text of a DOCX paragraph by paragraph"""
+    doc = docx.Document(_as_file(content))
+    for para in doc.paragraphs:
+        yield para.text + "\n"
+
+
+def iter_excel_text(
+    content: Union[bytes, BinaryIO],
+    sample_rows: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Yield the text of a workbook row by row
+    With sample_rows set, sheets longer than that are sampled at an even
+    stride (the header row is always kept) instead of read in full.
+    """
+    wb = openpyxl.load_workbook(_as_file(content), read_only=True, data_only=True)
+    try:
+        for sheet_name in wb.sheetnames:
+            sheet = wb[sheet_name]
+            yield f"Sheet: {sheet_name}\n"
+            
+            stride = 1
+            if sample_rows and sheet.max_row and sheet.max_row > sample_rows:
+                stride = -(-sheet.max_row // sample_rows)
+                yield f"[Sampled every {stride} rows of {sheet.max_row}]\n"
+            
+            for index, row in enumerate(sheet.iter_rows(values_only=True)):
+                if index % stride:
+                    continue
+                row_text = " | ".join([str(cell) if cell is not None else "" for cell in row])
+                if row_text.strip():
+                    yield row_text + "\n"
+            
+            yield "\n"  # Add a blank line between sheets
+    finally:
+        wb.close()
+
+
+def iter_text(
+    content: Union[bytes, BinaryIO],
+    content_type: str,
+    sample_rows: Optional[int] = None,
+    sample_pages: Optional[int] = None,
+    max_chars: Optional[int] = None
+) -> Iterator[str]:
+    """Yield text chunks of a document (pages, paragraphs or rows) based on its MIME type"""
+    if content_type == PDF_CONTENT_TYPE:
+        return iter_pdf_text(content, sample_pages=sample_pages, max_chars=max_chars)
+    elif content_type == DOCX_CONTENT_TYPE:
+        return iter_docx_text(content)
+    elif content_type in EXCEL_CONTENT_TYPES:
+        return iter_excel_text(content, sample_rows=sample_rows)
+    raise ValueError(f"Streaming extraction not supported for {content_type}")
+
+
+def extract_text_bounded(
+    content: Union[bytes, BinaryIO],
+    content_type: str,
+    max_chars: Optional[int] = None,
+    sample_rows: Optional[int] = None,
+    sample_pages: Optional[int] = None
+) -> str:
+    """
+    Extract text chunk by chunk, stopping as soon as max_chars is reached
+    Only the pages/rows needed to fill the budget are ever parsed, so memory
+    and CPU per attachment stay bounded however large the document is.
+    Spreadsheets and PDFs are sampled across their whole length (a row or
+    page stride, and for PDFs a per-page share of max_chars); DOCX files are
+    read from the start and keep only their first max_chars characters.
+    """
+    chunks = []
+    collected = 0
+    try:
+        generator = iter_text(
+            content, content_type, sample_rows=sample_rows, sample_pages=sample_pages, max_chars=max_chars
+        )
+        try:
+            for chunk in generator:
+                if max_chars is not None and collected + len(chunk) > max_chars:
+                    chunks.append(chunk[:max_chars - collected])
+                    chunks.append("\n[Truncated]")
+                    break
+                chunks.append(chunk)
+                collected += len(chunk)
+        finally:
+            generator.close()
+        return "".join(chunks)
+    
+    except Exception as e:
+        print(f"Error extracting text: {str(e)}")
+        return f"[Error extracting text: {str(e)}]"
\ No newline at end of file
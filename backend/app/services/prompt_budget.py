@@ -0,0 +1,205 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models.email import EmailContent
+from app.services.chunker import (
+    clean_email_body,
+    collapse_whitespace,
+    count_tokens,
+    get_tokenizer,
+    html_to_text,
+    split_quoted_history,
+    strip_signature
+)
+from app.services.outlook import should_download_attachment
+
+# Paragraphs that carry no knowledge: legal footers, banners and mailing-list chrome
+BOILERPLATE_PATTERNS = [
+    re.compile(r"(this (e-?mail|message)|the information contained).{0,200}(confidential|privileged|intended (solely )?for)", re.IGNORECASE | re.DOTALL),
+    re.compile(r"if you (are not|have received this).{0,100}(intended recipient|in error)", re.IGNORECASE | re.DOTALL),
+    re.compile(r"^\[?(external|caution)\]?:?\s.{0,200}(outside|external)", re.IGNORECASE | re.DOTALL),
+    re.compile(r"unsubscribe|manage (your )?(email )?preferences|view (this email )?in (your )?browser", re.IGNORECASE),
+    re.compile(r"please consider the environment before printing", re.IGNORECASE),
+]
+
+# Placed between excerpts of a sampled attachment
+EXCERPT_SEPARATOR = "\n[...]\n"
+
+
+def strip_boilerplate(text: str) -> str:
+    """Drop paragraphs matching a boilerplate pattern"""
+    paragraphs = re.split(r"\n\s*\n", text)
+    kept = [p for p in paragraphs if not any(pattern.search(p) for pattern in BOILERPLATE_PATTERNS)]
+    return "\n\n".join(kept)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The first max_tokens tokens of the text"""
+    if max_tokens <= 0:
+        return ""
+    tokenizer = get_tokenizer()
+    tokens = tokenizer.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return tokenizer.decode(tokens[:max_tokens])
+
+
+def sample_tokens(text: str, max_tokens: int, excerpts: Optional[int] = None) -> str:
+    """
+    Evenly spaced excerpts (always including the start and end) totalling
+    at most max_tokens tokens, so a long document is represented throughout
+    rather than only by its opening pages
+    Only the extracted text is sampled: attachments are read within
+    ATTACHMENT_MAX_CHARS, which parsing spreads over a PDF's pages and a
+    sheet's rows but fills from the start of a DOCX.
+    """
+    if max_tokens <= 0:
+        return ""
+    tokenizer = get_tokenizer()
+    tokens = tokenizer.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+
+    separator_tokens = count_tokens(EXCERPT_SEPARATOR)
+    excerpts = max(1, min(excerpts or settings.LLM_PROMPT_SAMPLE_EXCERPTS, max_tokens // 64))
+    size = (max_tokens - separator_tokens * (excerpts - 1)) // excerpts
+    if excerpts == 1 or size <= 0:
+        return tokenizer.decode(tokens[:max_tokens])
+    step = (len(tokens) - size) / (excerpts - 1)
+    return EXCERPT_SEPARATOR.join(
+        tokenizer.decode(tokens[round(index * step):round(index * step) + size])
+        for index in range(excerpts)
+    )
+
+
+def _fair_shares(budget: int, demands: List[Optional[int]]) -> List[int]:
+    """
+    Split a budget across demands (None meaning unknown, i.e. as much as
+    offered): small demands are met in full and what they leave is shared
+    evenly by the rest
+    """
+    shares = [0] * len(demands)
+    remaining = sorted(range(len(demands)), key=lambda i: float("inf") if demands[i] is None else demands[i])
+    while remaining and budget > 0:
+        share = budget // len(remaining)
+        index = remaining[0]
+        if demands[index] is not None and demands[index] <= share:
+            shares[index] = demands[index]
+            budget -= demands[index]
+            remaining.pop(0)
+            continue
+        for index in remaining:
+            shares[index] = share
+        break
+    return shares
+
+
+def _section(name: str, text: Optional[str], tokens: Optional[int]) -> Dict[str, Any]:
+    return {"name": name, "text": text, "tokens": tokens, "allocated": 0}
+
+
+def plan_prompt(email: EmailContent, budget: Optional[int] = None, estimate_unloaded: bool = False) -> Tuple[str, Dict[str, Any]]:
+    """
+    Fit an email into a token allowance for analysis
+    The allowance (LLM_PROMPT_TOKEN_BUDGET by default) is split by priority:
+    headers always; the latest reply is guaranteed LLM_PROMPT_REPLY_SHARE of
+    it; attachments share what is left evenly; anything still unused tops
+    up the reply and then admits quoted history. Boilerplate is removed up
+    front, so quoted history and boilerplate are the first to go. Replies
+    and history are truncated, oversized attachments are sampled.
+
+    With estimate_unloaded, attachments that would be downloaded but have no
+    content yet are assumed to fill their share, for forecasting a job
+    before fetching anything.
+
+    Returns the content to analyze and a report of per-section token
+    counts, allocations and actions.
+    """
+    budget = budget or settings.LLM_PROMPT_TOKEN_BUDGET
+    header = f"""
+Subject: {email.subject}
+From: {email.sender} <{email.sender_email}>
+Date: {email.received_date.isoformat()}
+Body:
+"""
+    header_tokens = count_tokens(header)
+
+    full_text = html_to_text(email.body, keep_quotes=True) if email.is_html else email.body
+    reply_text = collapse_whitespace(strip_boilerplate(clean_email_body(email.body, email.is_html)))
+    history_text = collapse_whitespace(strip_boilerplate(strip_signature(split_quoted_history(full_text)[1])))
+    reply = _section("reply", reply_text, count_tokens(reply_text))
+    history = _section("history", history_text, count_tokens(history_text))
+
+    attachments = []
+    for attachment in email.attachments or []:
+        name = f"attachment:{attachment.name}"
+        if attachment.content and not attachment.content.startswith("[Error"):
+            attachments.append(_section(name, attachment.content, count_tokens(attachment.content)))
+        elif attachment.content is None and estimate_unloaded and should_download_attachment(attachment):
+            attachments.append(_section(name, None, None))
+
+    # Each section also pays for its label line
+    label_tokens = [count_tokens(f"\n\n{section['name'][len('attachment:'):]}:\n") for section in attachments]
+    remaining = max(0, budget - header_tokens)
+
+    reply["allocated"] = min(reply["tokens"], int(remaining * settings.LLM_PROMPT_REPLY_SHARE))
+    remaining -= reply["allocated"]
+
+    shares = _fair_shares(
+        max(0, remaining - sum(label_tokens)),
+        [section["tokens"] for section in attachments]
+    )
+    for section, share, labels in zip(attachments, shares, label_tokens):
+        section["allocated"] = share
+        if share:
+            remaining -= share + labels
+
+    top_up = min(reply["tokens"] - reply["allocated"], max(0, remaining))
+    reply["allocated"] += top_up
+    remaining -= top_up
+    history["allocated"] = min(history["tokens"], max(0, remaining))
+
+    content_to_analyze = header + truncate_tokens(reply["text"], reply["allocated"])
+    if history["allocated"]:
+        content_to_analyze += "\n\nEarlier messages:\n" + truncate_tokens(history["text"], history["allocated"])
+    included = [section for section in attachments if section["allocated"] and section["text"]]
+    if included:
+        content_to_analyze += "\n\nAttachments:"
+        for section in included:
+            text = sample_tokens(section["text"], section["allocated"])
+            content_to_analyze += f"\n\n{section['name'][len('attachment:'):]}:\n{text}"
+
+    # Tokens the unbudgeted prompt (full body plus every attachment) would have used
+    original_tokens = header_tokens + count_tokens(email.body) + sum(
+        count_tokens(attachment.content) for attachment in email.attachments or [] if attachment.content
+    )
+
+    report_sections = []
+    for section, action in [(reply, "truncated"), (history, "truncated")] + [(section, "sampled") for section in attachments]:
+        if section["tokens"] is None:
+            outcome = "estimated"
+        elif not section["allocated"]:
+            outcome = "dropped"
+        elif section["allocated"] < section["tokens"]:
+            outcome = action
+        else:
+            outcome = "kept"
+        report_sections.append({
+            "name": section["name"],
+            "tokens": section["tokens"],
+            "allocated": section["allocated"],
+            "action": outcome
+        })
+
+    content_tokens = count_tokens(content_to_analyze)
+    # Unloaded attachments are forecast at their full share
+    content_tokens += sum(section["allocated"] for section in attachments if section["text"] is None)
+    report = {
+        "email_id": email.id,
+        "budget": budget,
+        "original_tokens": original_tokens,
+        "content_tokens": content_tokens,
+        "sections": report_sections
+    }
+    return content_to_analyze, report
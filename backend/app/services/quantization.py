@@ -0,0 +1,159 @@
+from typing import Optional
+
+import numpy as np
+
+# Rows encoded or scored per step, to bound temporary memory
+CHUNK_ROWS = 65536
+
+
+def kmeans(
+    sample: np.ndarray,
+    k: int,
+    iterations: int = 10,
+    seed: int = 0,
+    spherical: bool = False
+) -> np.ndarray:
+    """
+    Lloyd's k-means over `sample`
+    With spherical=True, points and centroids are compared by dot product and
+    centroids are kept unit length (for cosine IVF lists); otherwise plain
+    Euclidean distance is used (for PQ codebooks).
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(sample))
+    centroids = sample[rng.choice(len(sample), k, replace=False)].astype(np.float32)
+
+    for _ in range(iterations):
+        labels = assign(sample, centroids, spherical=spherical)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        # Re-seed empty clusters from random sample points
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        counts[empty] = 1
+        if spherical:
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        else:
+            centroids = sums / counts[:, None]
+    return centroids.astype(np.float32)
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, spherical: bool = False) -> np.ndarray:
+    """Index of the nearest centroid for each vector"""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    centroid_norms = None if spherical else (centroids ** 2).sum(axis=1)
+    for i in range(0, len(vectors), CHUNK_ROWS):
+        chunk = np.asarray(vectors[i:i + CHUNK_ROWS], dtype=np.float32)
+        products = chunk @ centroids.T
+        if spherical:
+            labels[i:i + CHUNK_ROWS] = np.argmax(products, axis=1)
+        else:
+            # ||x - c||^2 up to the per-row constant ||x||^2
+            labels[i:i + CHUNK_ROWS] = np.argmin(centroid_norms - 2 * products, axis=1)
+    return labels
+
+
+class ScalarQuantizer:
+    """
+    Symmetric int8 scalar quantization (4x smaller than float32)
+    Each dimension gets its own scale from the 99th percentile of absolute
+    values in the training sample.
+    """
+
+    kind = "int8"
+    code_dtype = np.int8
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.code_size = dimension
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.scale is not None
+
+    def train(self, sample: np.ndarray) -> None:
+        self.scale = (np.maximum(np.quantile(np.abs(sample), 0.99, axis=0), 1e-6) / 127).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def prepare_query(self, query: np.ndarray) -> np.ndarray:
+        """Fold the scales into the query so scoring is a single product"""
+        return (query * self.scale).astype(np.float32)
+
+    def score(self, codes: np.ndarray, prepared: np.ndarray) -> np.ndarray:
+        """Approximate dot products between the query and encoded rows"""
+        return codes.astype(np.float32) @ prepared
+
+    def save(self, path: str) -> None:
+        np.savez(path, scale=self.scale)
+
+    def load(self, path: str) -> None:
+        self.scale = np.load(path)["scale"]
+
+
+class ProductQuantizer:
+    """
+    Product quantization: each vector is split into code_size sub-vectors of
+    `compression / 4` dimensions, and each sub-vector is stored as the uint8
+    index of its nearest of 256 codebook centroids (compression x smaller
+    than float32). Scoring uses per-query lookup tables (asymmetric distance).
+    """
+
+    kind = "pq"
+    code_dtype = np.uint8
+
+    def __init__(self, dimension: int, compression: int):
+        self.dimension = dimension
+        self.sub_dimension = max(1, compression // 4)
+        if dimension % self.sub_dimension:
+            raise ValueError(f"Dimension {dimension} is not divisible into sub-vectors of {self.sub_dimension}")
+        self.code_size = dimension // self.sub_dimension
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.reshape(len(vectors), self.code_size, self.sub_dimension)
+
+    def train(self, sample: np.ndarray, iterations: int = 10, seed: int = 0) -> None:
+        parts = self._split(np.asarray(sample, dtype=np.float32))
+        codebooks = np.zeros((self.code_size, 256, self.sub_dimension), dtype=np.float32)
+        for j in range(self.code_size):
+            centroids = kmeans(parts[:, j], 256, iterations=iterations, seed=seed + j)
+            codebooks[j, :len(centroids)] = centroids
+        self.codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        parts = self._split(np.asarray(vectors, dtype=np.float32))
+        codes = np.empty((len(vectors), self.code_size), dtype=np.uint8)
+        for j in range(self.code_size):
+            codes[:, j] = assign(parts[:, j], self.codebooks[j])
+        return codes
+
+    def prepare_query(self, query: np.ndarray) -> np.ndarray:
+        """Lookup table of sub-vector dot products, shape (code_size, 256)"""
+        return np.einsum("jkd,jd->jk", self.codebooks, query.reshape(self.code_size, self.sub_dimension))
+
+    def score(self, codes: np.ndarray, prepared: np.ndarray) -> np.ndarray:
+        """Approximate dot products between the query and encoded rows"""
+        return prepared[np.arange(self.code_size), codes.astype(np.int64)].sum(axis=1)
+
+    def save(self, path: str) -> None:
+        np.savez(path, codebooks=self.codebooks)
+
+    def load(self, path: str) -> None:
+        self.codebooks = np.load(path)["codebooks"]
+
+
+def make_quantizer(kind: str, dimension: int, compression: int):
+    """Build the quantizer named by VECTOR_QUANTIZATION ("none", "int8" or "pq")"""
+    if kind == "int8":
+        return ScalarQuantizer(dimension)
+    if kind == "pq":
+        return ProductQuantizer(dimension, compression)
+    return None
@@ -0,0 +1,321 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.models.email import EmailReview, ReviewStatus, ReviewSummary
+from app.utils.metrics import register_collector
+
+# Pending reviews are listed newest first; every filter combination below is
+# served by an index that starts with the filter columns and ends with the
+# sort key, so a page is an index range scan whatever the table size.
+INDEXES = {
+    "idx_reviews_status": "(status, received_date DESC, email_id DESC)",
+    "idx_reviews_department": "(status, department, received_date DESC, email_id DESC)",
+    "idx_reviews_sensitivity": "(status, sensitivity, received_date DESC, email_id DESC)",
+    "idx_reviews_private": "(status, is_private, received_date DESC, email_id DESC)",
+    "idx_reviews_received": "(received_date DESC, email_id DESC)",
+    "idx_reviews_duplicate_of": "(duplicate_of, status)",
+}
+
+# Stay under SQLite's bound-parameter limit
+IN_BATCH_SIZE = 500
+
+
+def _date_key(value: datetime) -> str:
+    """Sortable UTC timestamp for the received_date column"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec="microseconds")
+
+
+def encode_cursor(received_key: str, email_id: str) -> str:
+    """Opaque keyset cursor pointing just past a review"""
+    return base64.urlsafe_b64encode(json.dumps([received_key, email_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        received_key, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return str(received_key), str(email_id)
+
+
+class ReviewStore:
+    """
+    Email reviews in SQLite, shared by every worker process
+    Each review is stored as serialized EmailReview JSON, next to the
+    columns it is filtered and sorted on. Listing uses keyset pagination on
+    (received_date, email_id), so deep pages cost the same as the first.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.REVIEW_DB
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # Other workers may hold the write lock briefly; wait rather than fail
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reviews (
+                email_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                department TEXT NOT NULL,
+                sensitivity TEXT NOT NULL,
+                is_private INTEGER NOT NULL,
+                received_date TEXT NOT NULL,
+                duplicate_of TEXT,
+                updated_at TEXT NOT NULL,
+                data TEXT NOT NULL
+            )
+            """
+        )
+        for name, columns in INDEXES.items():
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON reviews {columns}")
+        self._conn.commit()
+
+    @staticmethod
+    def _row(review: EmailReview) -> Tuple:
+        return (
+            review.email_id,
+            review.status.value,
+            review.analysis.department.value,
+            review.analysis.sensitivity.value,
+            int(review.analysis.is_private),
+            _date_key(review.content.received_date),
+            review.duplicate_of,
+            datetime.now().isoformat(),
+            review.model_dump_json()
+        )
+
+    def get(self, email_id: str) -> Optional[EmailReview]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM reviews WHERE email_id = ?", (email_id,)).fetchone()
+        return EmailReview.model_validate_json(row[0]) if row else None
+
+    def get_many(self, email_ids: Iterable[str]) -> Dict[str, EmailReview]:
+        with self._lock:
+            rows = self._select_in("SELECT email_id, data FROM reviews WHERE email_id IN ({})", email_ids)
+        return {email_id: EmailReview.model_validate_json(data) for email_id, data in rows}
+
+    def _select_in(self, query: str, values: Iterable[str], *params: Any) -> List[Tuple]:
+        """Run a query with an IN ({}) placeholder over values in parameter-limited batches"""
+        values = list(dict.fromkeys(values))
+        rows = []
+        for start in range(0, len(values), IN_BATCH_SIZE):
+            batch = values[start:start + IN_BATCH_SIZE]
+            rows += self._conn.execute(query.format(",".join("?" * len(batch))), batch + list(params)).fetchall()
+        return rows
+
+    def statuses(self, email_ids: Iterable[str]) -> Dict[str, str]:
+        """Review status of each of the emails that has a review"""
+        with self._lock:
+            return dict(self._select_in("SELECT email_id, status FROM reviews WHERE email_id IN ({})", email_ids))
+
+    def duplicates_of(self, email_ids: Iterable[str], status: Optional[str] = None) -> List[str]:
+        """Emails whose analysis was reused from one of the given emails, optionally by status"""
+        query = "SELECT email_id FROM reviews WHERE duplicate_of IN ({})"
+        params = []
+        if status is not None:
+            query += " AND status = ?"
+            params.append(getattr(status, "value", status))
+        with self._lock:
+            return [email_id for (email_id,) in self._select_in(query, email_ids, *params)]
+
+    def exists(self, email_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM reviews WHERE email_id = ?", (email_id,)).fetchone()
+        return row is not None
+
+    def save(self, review: EmailReview) -> None:
+        self.save_many([review])
+
+    def save_many(self, reviews: List[EmailReview]) -> None:
+        """Insert or replace reviews in one transaction"""
+        rows = [self._row(review) for review in reviews]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO reviews
+                        (email_id, status, department, sensitivity, is_private, received_date, duplicate_of, updated_at, data)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    rows
+                )
+
+    def set_status(
+        self,
+        email_ids: List[str],
+        status: ReviewStatus,
+        reviewer_id: str,
+        notes: Optional[str] = None
+    ) -> List[EmailReview]:
+        """
+        Approve or reject reviews in a single write transaction
+        The reviews are read and rewritten under one write lock, so a
+        concurrent decision from another worker can't interleave. Returns
+        the updated reviews; unknown IDs are skipped.
+        """
+        reviewed_at = datetime.now()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                rows = self._select_in("SELECT data FROM reviews WHERE email_id IN ({})", email_ids)
+                reviews = []
+                for (data,) in rows:
+                    review = EmailReview.model_validate_json(data)
+                    review.status = status
+                    review.reviewed_at = reviewed_at
+                    review.reviewer_id = reviewer_id
+                    review.review_notes = notes
+                    reviews.append(review)
+                self._conn.executemany(
+                    "UPDATE reviews SET status = ?, updated_at = ?, data = ? WHERE email_id = ?",
+                    [
+                        (status.value, reviewed_at.isoformat(), review.model_dump_json(), review.email_id)
+                        for review in reviews
+                    ]
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return reviews
+
+    def delete(self, email_id: str) -> bool:
+        """Remove a review; returns whether it existed"""
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute("DELETE FROM reviews WHERE email_id = ?", (email_id,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, email_ids: Iterable[str]) -> int:
+        """Remove reviews in one transaction; returns how many existed"""
+        email_ids = list(dict.fromkeys(email_ids))
+        deleted = 0
+        with self._lock:
+            with self._conn:
+                for start in range(0, len(email_ids), IN_BATCH_SIZE):
+                    batch = email_ids[start:start + IN_BATCH_SIZE]
+                    cursor = self._conn.execute(
+                        "DELETE FROM reviews WHERE email_id IN ({})".format(",".join("?" * len(batch))), batch
+                    )
+                    deleted += cursor.rowcount
+        return deleted
+
+    @staticmethod
+    def _filters(
+        status: Optional[str],
+        department: Optional[str],
+        sensitivity: Optional[str],
+        is_private: Optional[bool],
+        cursor: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for column, value in (("status", status), ("department", department), ("sensitivity", sensitivity)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(getattr(value, "value", value))
+        if is_private is not None:
+            clauses.append("is_private = ?")
+            params.append(int(is_private))
+        if cursor:
+            received_key, email_id = decode_cursor(cursor)
+            clauses.append("(received_date, email_id) < (?, ?)")
+            params += [received_key, email_id]
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def _page(self, columns: str, limit: int, **filters: Any) -> Tuple[List[Tuple], Optional[str]]:
+        """Rows of one page (after the received_date and email_id columns) and the next cursor"""
+        where, params = self._filters(**filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT received_date, email_id, {columns} FROM reviews {where}
+                ORDER BY received_date DESC, email_id DESC
+                LIMIT ?
+                """,
+                params + [limit + 1]
+            ).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return [row[2:] for row in rows[:limit]], next_cursor
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        department: Optional[str] = None,
+        sensitivity: Optional[str] = None,
+        is_private: Optional[bool] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[EmailReview], Optional[str]]:
+        """
+        One page of reviews, newest received first, and the cursor of the
+        next page (None on the last page)
+        """
+        rows, next_cursor = self._page(
+            "data", limit,
+            status=status, department=department, sensitivity=sensitivity, is_private=is_private, cursor=cursor
+        )
+        return [EmailReview.model_validate_json(data) for (data,) in rows], next_cursor
+
+    def list_summaries(
+        self,
+        status: Optional[str] = None,
+        department: Optional[str] = None,
+        sensitivity: Optional[str] = None,
+        is_private: Optional[bool] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[ReviewSummary], Optional[str]]:
+        """Like list, but only the summary fields, extracted in SQL without parsing bodies in Python"""
+        rows, next_cursor = self._page(
+            """
+            email_id,
+            json_extract(data, '$.content.subject'),
+            json_extract(data, '$.content.sender'),
+            json_extract(data, '$.content.received_date'),
+            sensitivity,
+            department,
+            is_private,
+            json_extract(data, '$.analysis.summary'),
+            duplicate_of
+            """,
+            limit,
+            status=status, department=department, sensitivity=sensitivity, is_private=is_private, cursor=cursor
+        )
+        return [
+            ReviewSummary(
+                email_id=email_id,
+                subject=subject,
+                sender=sender,
+                received_date=received_date,
+                sensitivity=row_sensitivity,
+                department=row_department,
+                is_private=bool(row_private),
+                summary=summary,
+                duplicate_of=duplicate_of
+            )
+            for email_id, subject, sender, received_date, row_sensitivity, row_department, row_private, summary, duplicate_of in rows
+        ], next_cursor
+
+    def counts(self) -> Dict[str, int]:
+        """Number of reviews per status"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM reviews GROUP BY status").fetchall())
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"reviews": self.counts()}
+
+
+# Shared review store
+review_store = ReviewStore()
+register_collector("review_store", review_store.metrics)
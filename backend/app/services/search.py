@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.services.embedder import create_embedding, search_similar
+from app.services.lexical_index import lexical_index
+
+
+def collapse_by_email(results: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Keep the best-ranked chunk of each email, preserving rank order"""
+    collapsed: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        key = result.get("email_id") or result["id"]
+        if key not in collapsed:
+            collapsed[key] = result
+            if len(collapsed) == limit:
+                break
+    return list(collapsed.values())
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Dict[str, List[Dict[str, Any]]],
+    limit: int,
+    k: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Fuse ranked result lists by summing 1 / (k + rank) per result ID
+    Each fused result keeps its fields, with `score` set to the fused score
+    and `scores` holding the original score from every list it appeared in.
+    """
+    k = k or settings.HYBRID_RRF_K
+    fused: Dict[str, Dict[str, Any]] = {}
+    for source, results in ranked_lists.items():
+        for rank, result in enumerate(results, start=1):
+            entry = fused.setdefault(result["id"], {**result, "score": 0.0, "scores": {}})
+            entry["score"] += 1.0 / (k + rank)
+            entry["scores"][source] = result["score"]
+    return sorted(fused.values(), key=lambda result: result["score"], reverse=True)[:limit]
+
+
+async def _vector_search(query: str, limit: int, filters: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    query_embedding = await create_embedding(query)
+    return await search_similar(query_embedding, limit=limit, filters=filters)
+
+
+async def hybrid_search(
+    query: str,
+    limit: int = 10,
+    filters: Optional[Dict[str, Any]] = None,
+    mode: str = "hybrid"
+) -> List[Dict[str, Any]]:
+    """
+    Search the knowledge base semantically, lexically (BM25) or both
+    In hybrid mode both legs fetch HYBRID_CANDIDATES results concurrently
+    and are merged with reciprocal-rank fusion, so latency tracks the slower
+    leg rather than their sum. Results are chunks; they are collapsed to the
+    best chunk per email.
+    """
+    depth = limit * settings.SEARCH_COLLAPSE_OVERSAMPLING
+    if mode == "vector":
+        return collapse_by_email(await _vector_search(query, depth, filters), limit)
+    if mode == "lexical":
+        return collapse_by_email(await lexical_index.search(query, limit=depth, filters=filters), limit)
+
+    depth = max(depth, settings.HYBRID_CANDIDATES)
+    vector_results, lexical_results = await asyncio.gather(
+        _vector_search(query, depth, filters),
+        lexical_index.search(query, limit=depth, filters=filters)
+    )
+    fused = reciprocal_rank_fusion({"vector": vector_results, "lexical": lexical_results}, limit=depth)
+    return collapse_by_email(fused, limit)
@@ -0,0 +1,243 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.config import settings
+from app.models.email import EmailChangeSet, EmailContent, EmailReview
+from app.services.chunker import count_tokens
+from app.services.dedup import duplicate_detector, normalize_text
+from app.services.lexical_index import lexical_index
+from app.services.llm import analyze_email_content, is_failed_analysis
+from app.services.review_store import review_store
+from app.services.vector_store import get_vector_store
+from app.services.outlook import iter_message_delta, load_attachment_contents, _to_email_preview
+
+
+class DeltaTokenStore:
+    """Persists Graph delta links per (user, folder) in a local SQLite file"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.SYNC_STATE_DB
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS delta_tokens (
+                user_id TEXT NOT NULL,
+                folder_id TEXT NOT NULL,
+                delta_link TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (user_id, folder_id)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, user_id: str, folder_id: str) -> Optional[str]:
+        """Get the stored delta link for a folder, if any"""
+        row = self._conn.execute(
+            "SELECT delta_link FROM delta_tokens WHERE user_id = ? AND folder_id = ?",
+            (user_id, folder_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, user_id: str, folder_id: str, delta_link: str) -> None:
+        """Store the delta link to resume from on the next sync"""
+        self._conn.execute(
+            """
+            INSERT INTO delta_tokens (user_id, folder_id, delta_link, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, folder_id)
+            DO UPDATE SET delta_link = excluded.delta_link, updated_at = excluded.updated_at
+            """,
+            (user_id, folder_id, delta_link, datetime.now().isoformat())
+        )
+        self._conn.commit()
+
+    def delete(self, user_id: str, folder_id: str) -> None:
+        """Forget the delta link so the next sync is a full one"""
+        self._conn.execute(
+            "DELETE FROM delta_tokens WHERE user_id = ? AND folder_id = ?",
+            (user_id, folder_id)
+        )
+        self._conn.commit()
+
+
+# Shared delta token store
+delta_store = DeltaTokenStore()
+
+
+async def _collect_changes(
+    access_token: str,
+    changes: EmailChangeSet,
+    delta_link: Optional[str],
+    start_date: Optional[datetime]
+) -> Optional[str]:
+    """Run one delta round into the change set and return the next delta link"""
+    next_delta_link = None
+    async for page in iter_message_delta(
+        access_token,
+        changes.folder_id,
+        delta_link=delta_link,
+        start_date=start_date
+    ):
+        for item in page.get("value", []):
+            if "@removed" in item:
+                changes.removed.append(item.get("id"))
+            else:
+                changes.changed.append(_to_email_preview(item))
+        next_delta_link = page.get("@odata.deltaLink") or next_delta_link
+    return next_delta_link
+
+
+async def _record_changes(access_token: str, user_id: str, changes: EmailChangeSet) -> None:
+    """
+    Apply a delta round before its delta link is stored
+    Removed messages are dropped from the review store and the knowledge
+    base, and messages without a review are queued as a persistent analysis
+    job. If this fails, or the process stops first, the link is not saved
+    and the next sync reports the same changes again.
+    """
+    # analysis_jobs imports this module for analyze_and_store
+    from app.services.analysis_jobs import analysis_queue
+
+    if changes.removed:
+        await asyncio.to_thread(review_store.delete_many, changes.removed)
+        await get_vector_store().delete_by_email_ids(changes.removed)
+        await lexical_index.delete_by_email_ids(changes.removed)
+        duplicate_detector.remove(changes.removed)
+
+    changed_ids = [preview.id for preview in changes.changed]
+    reviewed = await asyncio.to_thread(review_store.statuses, changed_ids)
+    new_ids = [email_id for email_id in changed_ids if email_id not in reviewed]
+    if new_ids:
+        changes.analysis_job_id = await analysis_queue.submit(user_id, access_token, list(dict.fromkeys(new_ids)))
+
+
+async def sync_folder(
+    access_token: str,
+    user_id: str,
+    folder_id: str = "inbox",
+    start_date: Optional[datetime] = None
+) -> EmailChangeSet:
+    """
+    Pull the messages added, changed or removed in a folder since the last
+    sync, apply the removals and queue the new messages for analysis
+    The new delta link is only stored once the whole round has been read and
+    recorded, so an interrupted sync is simply repeated on the next run.
+    """
+    delta_link = delta_store.get(user_id, folder_id)
+    changes = EmailChangeSet(folder_id=folder_id, full_sync=delta_link is None)
+
+    try:
+        next_delta_link = await _collect_changes(access_token, changes, delta_link, start_date)
+    except httpx.HTTPStatusError as e:
+        # 410 Gone means the delta token expired; fall back to a full sync
+        if e.response.status_code != 410 or delta_link is None:
+            raise
+        delta_store.delete(user_id, folder_id)
+        changes = EmailChangeSet(folder_id=folder_id, full_sync=True)
+        next_delta_link = await _collect_changes(access_token, changes, None, start_date)
+
+    await _record_changes(access_token, user_id, changes)
+    if next_delta_link:
+        delta_store.set(user_id, folder_id, next_delta_link)
+
+    return changes
+
+
+async def sync_mailbox(
+    access_token: str,
+    user_id: str,
+    folder_ids: Optional[List[str]] = None,
+    start_date: Optional[datetime] = None
+) -> List[EmailChangeSet]:
+    """Sync several folders concurrently"""
+    semaphore = asyncio.Semaphore(settings.CRAWL_CONCURRENCY)
+
+    async def sync_one(folder_id: str) -> EmailChangeSet:
+        async with semaphore:
+            return await sync_folder(access_token, user_id, folder_id, start_date)
+
+    return await asyncio.gather(*[sync_one(folder_id) for folder_id in (folder_ids or ["inbox"])])
+
+
+# Makes each batch's lookups and inserts atomic against other batches
+_match_lock = threading.Lock()
+
+
+def match_duplicates(user_id: str, contents: Dict[str, EmailContent]) -> Dict[str, str]:
+    """
+    Map each near-duplicate email to the email of the same user whose
+    analysis it can reuse
+    Emails are indexed as they are checked, so duplicates within the same
+    batch resolve to the first copy. Parses and hashes every body, so call
+    it through asyncio.to_thread.
+    """
+    duplicates = {}
+    if not settings.DEDUP_ENABLED:
+        return duplicates
+    signatures = {}
+    for email_id, content in contents.items():
+        text = normalize_text(content)
+        # Very short messages ("Thanks!") look alike but mean different things
+        if len(text.split()) >= duplicate_detector.shingle_size:
+            signatures[email_id] = duplicate_detector.signature(text)
+    with _match_lock:
+        for email_id, signature in signatures.items():
+            match = duplicate_detector.find(user_id, signature, exclude=email_id)
+            if match:
+                duplicates[email_id] = match[0]
+            else:
+                duplicate_detector.add(user_id, email_id, signature)
+    return duplicates
+
+
+async def analyze_and_store(
+    access_token: str,
+    email_id: str,
+    content: EmailContent,
+    original_id: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Load attachments, analyze one email and write its review record
+    With original_id (a near-duplicate match) the original's analysis is
+    reused instead of calling the LLM, as long as that analysis exists and
+    is not the placeholder left by a failed model call.
+    Returns the counters to add to the caller's stats.
+    """
+    original = await asyncio.to_thread(review_store.get, original_id) if original_id else None
+    if original is None or is_failed_analysis(original.analysis):
+        await load_attachment_contents(access_token, content)
+        analysis = await analyze_email_content(content)
+        await asyncio.to_thread(review_store.save, EmailReview(
+            email_id=email_id,
+            content=content,
+            analysis=analysis
+        ))
+        return {"analyzed": 1}
+
+    try:
+        await load_attachment_contents(access_token, content)
+    except Exception as e:
+        print(f"Error loading attachments for email {email_id}: {str(e)}")
+    await asyncio.to_thread(review_store.save, EmailReview(
+        email_id=email_id,
+        content=content,
+        analysis=original.analysis.model_copy(deep=True),
+        duplicate_of=original_id
+    ))
+    body_tokens = count_tokens(content.body)
+    attachment_tokens = sum(count_tokens(a.content) for a in content.attachments or [] if a.content)
+    duplicate_detector.record_reuse(body_tokens + attachment_tokens, body_tokens)
+    return {
+        "duplicates": 1,
+        "llm_calls_saved": 1,
+        "llm_tokens_saved": body_tokens + attachment_tokens,
+        "embedding_tokens_saved": body_tokens
+    }
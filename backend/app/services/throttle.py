@@ -0,0 +1,169 @@
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from app.config import settings
+
+
+class TokenBucket:
+    """Token bucket that paces requests to a steady rate with a bounded burst"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Wait until `amount` tokens (at most a full bucket) are available and take them"""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount: float) -> None:
+        """Take (or, if negative, return) tokens after the fact, e.g. once actual usage is known"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket so no request is sent for roughly `seconds`"""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limiter
+    The limit grows by about one slot per window of successful calls and is
+    halved on every throttling signal.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+
+    def on_throttle(self) -> None:
+        self.limit = max(float(self.minimum), self.limit / 2)
+
+
+class RateGovernor:
+    """
+    Client-side rate governor for Microsoft Graph
+    Combines a per-mailbox token bucket, an adaptive global concurrency limit
+    and jittered exponential backoff that defers to Retry-After when given.
+    """
+
+    def __init__(self):
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial=settings.GRAPH_INITIAL_CONCURRENCY,
+            minimum=settings.GRAPH_MIN_CONCURRENCY,
+            maximum=settings.GRAPH_MAX_CONCURRENCY
+        )
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.requests = 0
+        self.retries = 0
+        self.throttle_events = 0
+
+    @staticmethod
+    def mailbox_key(access_token: str) -> str:
+        """
+        Identify the mailbox a token acts for by the signed-in user's tenant
+        and object ID claims, so a refreshed token keeps its user's bucket
+        The claims only pick a bucket and are not verified. Tokens that are
+        not JWTs fall back to a hash of the token.
+        """
+        try:
+            payload = access_token.split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+            user_id = claims.get("oid") or claims.get("sub")
+        except (IndexError, ValueError, AttributeError):
+            user_id = None
+        if user_id:
+            return f"{claims.get('tid', '')}:{user_id}"
+        return "token:" + hashlib.sha256(access_token.encode("utf-8")).hexdigest()[:16]
+
+    def bucket_for(self, mailbox_key: str) -> TokenBucket:
+        """Get (or create) the token bucket of a mailbox"""
+        bucket = self._buckets.get(mailbox_key)
+        if bucket is None:
+            bucket = TokenBucket(settings.GRAPH_MAILBOX_RATE, settings.GRAPH_MAILBOX_BURST)
+            self._buckets[mailbox_key] = bucket
+            # Forget the least recently used mailboxes
+            while len(self._buckets) > settings.GRAPH_MAX_TRACKED_MAILBOXES:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(mailbox_key)
+        return bucket
+
+    @asynccontextmanager
+    async def slot(self, mailbox_key: str) -> AsyncIterator[None]:
+        """Wait for the mailbox's rate and a global concurrency slot"""
+        await self.bucket_for(mailbox_key).acquire()
+        await self.limiter.acquire()
+        self.requests += 1
+        try:
+            yield
+        finally:
+            await self.limiter.release()
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before the next attempt: Retry-After if given, else full-jitter backoff"""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, settings.GRAPH_BACKOFF_BASE)
+        ceiling = min(settings.GRAPH_BACKOFF_MAX, settings.GRAPH_BACKOFF_BASE * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def record_success(self) -> None:
+        self.limiter.on_success()
+
+    def record_throttle(self, mailbox_key: Optional[str] = None, retry_after: Optional[float] = None) -> None:
+        self.throttle_events += 1
+        self.limiter.on_throttle()
+        if mailbox_key is not None and retry_after:
+            self.bucket_for(mailbox_key).pause(retry_after)
+
+    def record_retry(self) -> None:
+        self.retries += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of throttling counters and current concurrency"""
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttle_events": self.throttle_events,
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "tracked_mailboxes": len(self._buckets)
+        }
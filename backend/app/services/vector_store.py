@@ -0,0 +1,306 @@
+import asyncio
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from qdrant_client import AsyncQdrantClient, models
+
+from app.config import settings
+from app.models.email import EmailVectorData
+
+# Namespace for deriving Qdrant point IDs (UUIDs) from our vector IDs
+POINT_ID_NAMESPACE = uuid.UUID("5d1f7a3e-2b8c-4e0a-9f6d-1c3b5a7e9d2f")
+
+# Payload fields that get a server-side keyword index
+KEYWORD_INDEX_FIELDS = ["email_id", "department", "sensitivity", "tags"]
+
+# Date fields are stored as epoch seconds alongside the original value
+DATE_FIELDS = ["received_date", "created_at"]
+
+
+class VectorStore(ABC):
+    """Interface of the knowledge base vector store used by routes/vector.py"""
+
+    @abstractmethod
+    async def upsert(self, records: List[EmailVectorData]) -> None:
+        """Insert or replace embedded records"""
+
+    @abstractmethod
+    async def search(
+        self,
+        query_embedding: List[float],
+        limit: int = 10,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the closest records as dicts with id, email_id, content,
+        metadata and score
+        filters may hold department, sensitivity, tags (any of), and
+        start_date / end_date (bounds on received_date)
+        """
+
+    @abstractmethod
+    async def delete(self, vector_ids: List[str]) -> None:
+        """Delete records by vector ID"""
+
+    @abstractmethod
+    async def delete_by_email_ids(self, email_ids: List[str]) -> None:
+        """Delete every record belonging to the given emails"""
+
+    async def close(self) -> None:
+        """Release any resources held by the store"""
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds for a datetime or ISO 8601 string"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _payload(record: EmailVectorData) -> Dict[str, Any]:
+    """Flatten a record into a Qdrant payload with filterable fields at the top level"""
+    metadata = dict(record.metadata)
+    metadata.setdefault("created_at", record.created_at.isoformat())
+    payload = {
+        "vector_id": record.id,
+        "email_id": record.email_id,
+        "content": record.content,
+        "metadata": {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in metadata.items()
+        }
+    }
+    for field in ("department", "sensitivity"):
+        if metadata.get(field) is not None:
+            payload[field] = str(getattr(metadata[field], "value", metadata[field]))
+    if metadata.get("tags"):
+        payload["tags"] = list(metadata["tags"])
+    for field in DATE_FIELDS:
+        ts = _timestamp(metadata.get(field))
+        if ts is not None:
+            payload[f"{field}_ts"] = ts
+    return payload
+
+
+def _point_id(vector_id: str) -> str:
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, vector_id))
+
+
+def _quantization_config(kind: str, compression: int) -> Optional[models.QuantizationConfig]:
+    """Qdrant quantization settings for VECTOR_QUANTIZATION; quantized vectors stay in RAM"""
+    if kind == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
+            )
+        )
+    if kind == "pq":
+        return models.ProductQuantization(
+            product=models.ProductQuantizationConfig(
+                compression=models.CompressionRatio(f"x{compression}"),
+                always_ram=True
+            )
+        )
+    return None
+
+
+class QdrantVectorStore(VectorStore):
+    """
+    Vector store backed by Qdrant
+    Pass location=":memory:" to run against Qdrant's local in-process mode
+    (no server needed). With quantization ("int8" or "pq"), the collection
+    keeps compressed vectors in RAM and the float32 originals on disk; searches
+    oversample on the compressed vectors and rescore with the originals.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        location: Optional[str] = None,
+        collection_name: Optional[str] = None,
+        dimension: Optional[int] = None,
+        quantization: Optional[str] = None
+    ):
+        self.local = bool(location)
+        if location:
+            self.client = AsyncQdrantClient(location=location)
+        else:
+            self.client = AsyncQdrantClient(url=url or settings.QDRANT_URL, api_key=api_key or settings.QDRANT_API_KEY)
+        self.collection_name = collection_name or settings.QDRANT_COLLECTION
+        self.dimension = dimension or settings.EMBEDDING_DIMENSION
+        self.quantization = quantization or settings.VECTOR_QUANTIZATION
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+
+    async def _ensure_collection(self) -> None:
+        """Create the collection and its payload indexes on first use"""
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if self._ready:
+                return
+            collections = await self.client.get_collections()
+            created = self.collection_name not in {c.name for c in collections.collections}
+            if created:
+                quantization_config = _quantization_config(self.quantization, settings.VECTOR_PQ_COMPRESSION)
+                await self.client.create_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=models.VectorParams(
+                        size=self.dimension,
+                        distance=models.Distance.COSINE,
+                        on_disk=quantization_config is not None
+                    ),
+                    quantization_config=quantization_config
+                )
+            # Payload indexes only take effect on a Qdrant server
+            if created and not self.local:
+                for field in KEYWORD_INDEX_FIELDS:
+                    await self.client.create_payload_index(
+                        self.collection_name,
+                        field_name=field,
+                        field_schema=models.PayloadSchemaType.KEYWORD
+                    )
+                for field in DATE_FIELDS:
+                    await self.client.create_payload_index(
+                        self.collection_name,
+                        field_name=f"{field}_ts",
+                        field_schema=models.PayloadSchemaType.FLOAT
+                    )
+            self._ready = True
+
+    async def upsert(self, records: List[EmailVectorData]) -> None:
+        """Upsert in parallel batches without waiting for indexing to finish"""
+        if not records:
+            return
+        await self._ensure_collection()
+
+        points = [
+            models.PointStruct(
+                id=_point_id(record.id),
+                vector=record.embedding,
+                payload=_payload(record)
+            )
+            for record in records
+            if record.embedding is not None
+        ]
+        batch_size = settings.VECTOR_UPSERT_BATCH_SIZE
+        semaphore = asyncio.Semaphore(settings.VECTOR_UPSERT_CONCURRENCY)
+
+        async def upsert_batch(batch: List[models.PointStruct]) -> None:
+            async with semaphore:
+                await self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=batch,
+                    wait=False
+                )
+
+        await asyncio.gather(*[
+            upsert_batch(points[i:i + batch_size])
+            for i in range(0, len(points), batch_size)
+        ])
+
+    def _build_filter(self, filters: Optional[Dict[str, Any]]) -> Optional[models.Filter]:
+        """Translate query filters into a server-side Qdrant filter"""
+        if not filters:
+            return None
+        must = []
+        for field in ("department", "sensitivity", "email_id"):
+            if filters.get(field) is not None:
+                must.append(models.FieldCondition(key=field, match=models.MatchValue(value=str(filters[field]))))
+        if filters.get("tags"):
+            must.append(models.FieldCondition(key="tags", match=models.MatchAny(any=list(filters["tags"]))))
+        start_ts = _timestamp(filters.get("start_date"))
+        end_ts = _timestamp(filters.get("end_date"))
+        if start_ts is not None or end_ts is not None:
+            must.append(models.FieldCondition(key="received_date_ts", range=models.Range(gte=start_ts, lte=end_ts)))
+        return models.Filter(must=must) if must else None
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        limit: int = 10,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        await self._ensure_collection()
+        search_params = None
+        if self.quantization != "none":
+            search_params = models.SearchParams(
+                quantization=models.QuantizationSearchParams(
+                    rescore=True,
+                    oversampling=settings.VECTOR_RESCORE_OVERSAMPLING
+                )
+            )
+        points = await self.client.search(
+            collection_name=self.collection_name,
+            query_vector=query_embedding,
+            query_filter=self._build_filter(filters),
+            search_params=search_params,
+            limit=limit,
+            with_payload=True
+        )
+        return [
+            {
+                "id": point.payload.get("vector_id"),
+                "email_id": point.payload.get("email_id"),
+                "content": point.payload.get("content"),
+                "metadata": point.payload.get("metadata", {}),
+                "score": point.score
+            }
+            for point in points
+        ]
+
+    async def delete(self, vector_ids: List[str]) -> None:
+        if not vector_ids:
+            return
+        await self._ensure_collection()
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=models.PointIdsList(points=[_point_id(vector_id) for vector_id in vector_ids])
+        )
+
+    async def delete_by_email_ids(self, email_ids: List[str]) -> None:
+        if not email_ids:
+            return
+        await self._ensure_collection()
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(must=[
+                    models.FieldCondition(key="email_id", match=models.MatchAny(any=list(email_ids)))
+                ])
+            )
+        )
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+_vector_store: Optional[VectorStore] = None
+
+
+def get_vector_store() -> VectorStore:
+    """Get the shared vector store, created from settings on first use"""
+    global _vector_store
+    if _vector_store is None:
+        if settings.VECTOR_STORE_BACKEND == "embedded":
+            from app.services.embedded_index import EmbeddedVectorStore
+            _vector_store = EmbeddedVectorStore()
+        else:
+            _vector_store = QdrantVectorStore(location=settings.QDRANT_LOCATION)
+    return _vector_store
+
+
+def set_vector_store(store: VectorStore) -> None:
+    """Replace the shared vector store (e.g. with an in-memory one in tests)"""
+    global _vector_store
+    _vector_store = store
@@ -0,0 +1,266 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Keys per IN (...) query, below SQLite's host parameter limit
+IN_BATCH_SIZE = 500
+
+
+class MemoryLRU:
+    """In-process LRU of byte values, bounded by total size"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= len(previous)
+        self._entries[key] = value
+        self.total_bytes += len(value)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+    def delete(self, key: str) -> None:
+        value = self._entries.pop(key, None)
+        if value is not None:
+            self.total_bytes -= len(value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    SQLite-backed byte cache that survives restarts
+    Entries are evicted least-recently-used first once the stored size
+    exceeds max_bytes, and expire after ttl seconds when a ttl is set.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int, ttl: Optional[float] = None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed_at ON entries (accessed_at)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        self.total_bytes = row[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """
+        Look up several keys with one query per IN batch
+        Expired entries are dropped and the access times of the hits are
+        bumped in a single commit.
+        """
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found = {}
+        with self._lock:
+            rows = self._select_in("SELECT key, value, size, created_at FROM entries WHERE key IN ({})", keys)
+            expired = []
+            for key, value, size, created_at in rows:
+                if self.ttl is not None and now - created_at > self.ttl:
+                    expired.append((key,))
+                    self.total_bytes -= size
+                else:
+                    found[key] = value
+            if expired:
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", expired)
+            if found:
+                self._conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+            if expired or found:
+                self._conn.commit()
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        """Store several entries in one transaction"""
+        items = {key: value for key, value in items if len(value) <= self.max_bytes}
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            for _, size in self._select_in("SELECT key, size FROM entries WHERE key IN ({})", list(items)):
+                self.total_bytes -= size
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, value, len(value), now, now) for key, value in items.items()]
+            )
+            self.total_bytes += sum(len(value) for value in items.values())
+            self._evict()
+            self._conn.commit()
+
+    def _select_in(self, query: str, keys: List[str]) -> List[Tuple]:
+        """Run a query with an IN ({}) placeholder over keys in parameter-limited batches (caller holds the lock)"""
+        rows = []
+        for start in range(0, len(keys), IN_BATCH_SIZE):
+            batch = keys[start:start + IN_BATCH_SIZE]
+            rows += self._conn.execute(query.format(",".join("?" * len(batch))), batch).fetchall()
+        return rows
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self.total_bytes -= row[0]
+
+    def _evict(self) -> None:
+        """Drop expired entries, then least recently used ones until under the size cap"""
+        if self.ttl is not None:
+            cutoff = time.time() - self.ttl
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries WHERE created_at < ?",
+                (cutoff,)
+            ).fetchone()
+            if row[0]:
+                self._conn.execute("DELETE FROM entries WHERE created_at < ?", (cutoff,))
+                self.total_bytes -= row[0]
+        while self.total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+
+class TieredCache:
+    """
+    Two-tier byte cache: an in-process LRU in front of a persistent disk store
+    Safe to call from worker threads (e.g. through asyncio.to_thread).
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        memory_bytes: int,
+        disk_bytes: int,
+        ttl: Optional[float] = None
+    ):
+        self.memory = MemoryLRU(memory_bytes)
+        self.disk = DiskCache(db_path, disk_bytes, ttl=ttl)
+        self.ttl = ttl
+        self._memory_expiry: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """
+        Look up several keys, falling back to a single disk query for the
+        ones the memory tier doesn't hold; returns only the hits
+        """
+        keys = list(dict.fromkeys(keys))
+        found, missing = {}, []
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                value = self.memory.get(key)
+                if value is not None:
+                    if self.ttl is None or self._memory_expiry.get(key, 0) > now:
+                        found[key] = value
+                        continue
+                    self.memory.delete(key)
+                    self._memory_expiry.pop(key, None)
+                missing.append(key)
+            self.memory_hits += len(found)
+
+        if missing:
+            from_disk = self.disk.get_many(missing)
+            with self._lock:
+                for key, value in from_disk.items():
+                    self._set_memory(key, value)
+                self.disk_hits += len(from_disk)
+                self.misses += len(missing) - len(from_disk)
+            found.update(from_disk)
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        """Store several entries, writing the disk tier in one transaction"""
+        items = list(items)
+        with self._lock:
+            for key, value in items:
+                self._set_memory(key, value)
+        self.disk.set_many(items)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self.memory.delete(key)
+            self._memory_expiry.pop(key, None)
+        self.disk.delete(key)
+
+    def _set_memory(self, key: str, value: bytes) -> None:
+        """Put a value in the memory tier (caller holds the lock)"""
+        self.memory.set(key, value)
+        if self.ttl is not None:
+            self._memory_expiry[key] = time.time() + self.ttl
+            # Keep the expiry map in step with LRU evictions
+            if len(self._memory_expiry) > 2 * len(self.memory) + 1024:
+                self._memory_expiry = {
+                    k: t for k, t in self._memory_expiry.items() if k in self.memory
+                }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of hit/miss counters and tier sizes"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "miss_ratio": self.misses / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.total_bytes,
+            "disk_bytes": self.disk.total_bytes
+        }
@@ -0,0 +1,14 @@
+from typing import Any, Callable, Dict
+
+# Registered metric collectors, keyed by subsystem name
+_collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_collector(name: str, collector: Callable[[], Dict[str, Any]]) -> None:
+    """Register a callable that returns a snapshot of a subsystem's metrics"""
+    _collectors[name] = collector
+
+
+def collect_metrics() -> Dict[str, Dict[str, Any]]:
+    """Collect a snapshot from every registered subsystem"""
+    return {name: collector() for name, collector in _collectors.items()}
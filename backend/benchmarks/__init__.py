@@ -0,0 +1,22 @@
+"""
+Micro-benchmarks for the backend's hot paths
+
+Run from the backend directory, e.g. `python -m benchmarks.graph_pool`.
+Each module prints its own numbers; none of them needs Microsoft or OpenAI
+credentials unless it says so.
+"""
+import os
+
+# Settings without defaults, so benchmarks run without a .env
+for _name, _value in {
+    "JWT_SECRET": "benchmark",
+    "MS_CLIENT_ID": "benchmark",
+    "MS_TENANT_ID": "benchmark",
+    "MS_CLIENT_SECRET": "benchmark",
+    "MS_REDIRECT_URI": "http://localhost:8000/auth/callback",
+    "FRONTEND_URL": "http://localhost:5173",
+    "BACKEND_URL": "http://localhost:8000",
+    # The OpenAI client needs a key to be constructed; benchmarks fake its API
+    "OPENAI_API_KEY": "benchmark",
+}.items():
+    os.environ.setdefault(_name, _value)
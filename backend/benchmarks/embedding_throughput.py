@@ -0,0 +1,95 @@
+"""
+Embedding throughput: one request per chunk against create_embeddings,
+which packs chunks by token count into batched requests
+
+    python -m benchmarks.embedding_throughput [--chunks 2000] [--words 300]
+                                              [--latency-ms 150] [--ms-per-ktok 5]
+
+The embeddings endpoint is simulated: each request costs --latency-ms plus
+--ms-per-ktok per thousand input tokens. Token counts use the embedding
+model's tiktoken encoding, which must be available locally.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+os.environ.setdefault("EMBEDDING_CACHE_DB", os.path.join(tempfile.mkdtemp(prefix="embedding-bench-"), "cache.db"))
+
+from app.config import settings  # noqa: E402
+from app.services import embedder  # noqa: E402
+
+WORDS = "invoice budget quarterly review meeting contract supplier project deadline report".split()
+
+
+def _fake_api(args: argparse.Namespace, counters: dict) -> AsyncOpenAI:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        inputs = json.loads(request.content)["input"]
+        tokens = sum(len(text) // 4 + 1 for text in inputs)
+        counters["requests"] += 1
+        await asyncio.sleep((args.latency_ms + args.ms_per_ktok * tokens / 1000) / 1000)
+        return httpx.Response(200, json={
+            "object": "list",
+            "model": settings.EMBEDDING_MODEL,
+            "data": [
+                {"object": "embedding", "index": index, "embedding": [0.1] * 8}
+                for index in range(len(inputs))
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    return AsyncOpenAI(api_key="benchmark", max_retries=0, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        embedder.get_tokenizer()
+    except Exception as e:
+        raise SystemExit(f"The embedding tokenizer is not available: {e}")
+
+    rng = random.Random(0)
+
+    def chunks(label: str):
+        return [
+            f"{label} {index} " + " ".join(rng.choice(WORDS) for _ in range(args.words))
+            for index in range(args.chunks)
+        ]
+
+    counters = {"requests": 0}
+    embedder.client = _fake_api(args, counters)
+    semaphore = asyncio.Semaphore(settings.EMBEDDING_CONCURRENCY)
+
+    async def one_per_request(texts):
+        async def embed(text):
+            async with semaphore:
+                return (await embedder._embed_batch([text]))[0]
+        return await asyncio.gather(*[embed(text) for text in texts])
+
+    for name, embed_all, texts in (
+        ("per-chunk", one_per_request, chunks("a")),
+        ("packed", embedder.create_embeddings, chunks("b"))
+    ):
+        counters["requests"] = 0
+        started = time.perf_counter()
+        embeddings = await embed_all(texts)
+        elapsed = time.perf_counter() - started
+        assert all(embedding is not None for embedding in embeddings)
+        print(
+            f"{name:<10} {len(texts)} chunks  {counters['requests']:5d} requests  "
+            f"{elapsed:6.2f} s  {len(texts) / elapsed:7.0f} chunks/s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--ms-per-ktok", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from typing import Any, Dict, Optional, Tuple
+
+
+class FakeGraphServer:
+    """
+    Minimal HTTP/1.1 keep-alive server standing in for graph.microsoft.com
+    connect_delay is paid once per new connection (the TCP + TLS handshake a
+    real client pays to Graph); latency is paid by every request (the
+    server-side round trip). Message GETs and $batch calls are answered
+    with small message bodies.
+    """
+
+    def __init__(self, connect_delay: float = 0.0, latency: float = 0.0):
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.url = ""
+
+    async def __aenter__(self) -> "FakeGraphServer":
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/v1.0"
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def reset(self) -> None:
+        self.connections = 0
+        self.requests = 0
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        length = 0
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        body = await reader.readexactly(length) if length else b""
+        return method, path, body
+
+    @staticmethod
+    def message(path: str) -> Dict[str, Any]:
+        """Graph message resource for a /messages/{id} path"""
+        message_id = path.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+        return {
+            "id": message_id,
+            "internetMessageId": f"<{message_id}@example.com>",
+            "subject": "Quarterly report",
+            "from": {"emailAddress": {"name": "Alice", "address": "alice@example.com"}},
+            "toRecipients": [{"emailAddress": {"address": "bob@example.com"}}],
+            "receivedDateTime": "2024-01-02T03:04:05Z",
+            "body": {"contentType": "text", "content": "x" * 512},
+            "attachments": []
+        }
+
+    def respond(self, method: str, path: str, body: bytes) -> Dict[str, Any]:
+        """JSON body for a request: a message, or the sub-responses of a $batch"""
+        if path.split("?")[0].endswith("/$batch"):
+            return {
+                "responses": [
+                    {"id": request["id"], "status": 200, "body": self.message(request["url"])}
+                    for request in json.loads(body)["requests"]
+                ]
+            }
+        return self.message(path)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        await asyncio.sleep(self.connect_delay)
+        try:
+            while True:
+                method, path, body = await self._read_request(reader)
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                payload = json.dumps(self.respond(method, path, body)).encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n" % len(payload) + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
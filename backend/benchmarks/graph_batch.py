@@ -0,0 +1,59 @@
+"""
+Round trips for bulk message fetches: one GET per message (the previous
+pattern) against get_email_contents, which packs GRAPH_BATCH_SIZE fetches
+into each $batch call
+
+    python -m benchmarks.graph_batch [--emails 500] [--latency-ms 80]
+
+--latency-ms is the per-request round trip to Graph; the number of
+requests the fake server receives is the round-trip count.
+"""
+import argparse
+import asyncio
+import time
+
+from app.config import settings
+from app.services import outlook
+from app.services.graph_client import graph_client
+from benchmarks.fake_graph import FakeGraphServer
+
+
+async def main(args: argparse.Namespace) -> None:
+    # Pacing is not under test here
+    settings.GRAPH_MAILBOX_RATE = 1e9
+    settings.GRAPH_MAILBOX_BURST = 1e9
+
+    email_ids = [f"m{index}" for index in range(args.emails)]
+    async with FakeGraphServer(latency=args.latency_ms / 1000) as server:
+        graph_client.base_url = server.url
+        await graph_client.close()
+
+        async def one_by_one() -> int:
+            semaphore = asyncio.Semaphore(settings.CRAWL_CONCURRENCY)
+
+            async def fetch(email_id: str):
+                async with semaphore:
+                    return await outlook.get_email_content("token", email_id)
+
+            return len(await asyncio.gather(*[fetch(email_id) for email_id in email_ids]))
+
+        async def batched() -> int:
+            return len(await outlook.get_email_contents("token", email_ids))
+
+        for name, fetch_all in (("one-by-one", one_by_one), ("$batch", batched)):
+            server.reset()
+            started = time.perf_counter()
+            fetched = await fetch_all()
+            elapsed = time.perf_counter() - started
+            print(
+                f"{name:<11} {fetched} emails  {server.requests:5d} round trips  "
+                f"{elapsed:6.2f} s  {fetched / elapsed:7.0f} emails/s"
+            )
+        await graph_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""
+Connection pooling: a fresh httpx client per Graph call (the previous
+pattern) against the shared, pooled GraphClient
+
+    python -m benchmarks.graph_pool [--requests 400] [--concurrency 16]
+                                    [--connect-delay-ms 30] [--latency-ms 5]
+
+The fake server charges --connect-delay-ms per new connection to stand in
+for the TCP + TLS handshake with graph.microsoft.com.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, List
+
+import httpx
+
+from app.config import settings
+from app.services.graph_client import GraphClient
+from benchmarks.fake_graph import FakeGraphServer
+
+
+async def _run(call: Callable[[int], Awaitable[None]], requests: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await call(index)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*[one(index) for index in range(requests)])
+    return latencies
+
+
+def _report(name: str, latencies: List[float], elapsed: float, server: FakeGraphServer) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<12} {len(latencies) / elapsed:8.0f} req/s  "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms  "
+        f"connections {server.connections}"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    # Pacing is not under test here
+    settings.GRAPH_MAILBOX_RATE = 1e9
+    settings.GRAPH_MAILBOX_BURST = 1e9
+    settings.GRAPH_INITIAL_CONCURRENCY = args.concurrency
+
+    async with FakeGraphServer(args.connect_delay_ms / 1000, args.latency_ms / 1000) as server:
+        async def per_call_client(index: int) -> None:
+            async with httpx.AsyncClient(base_url=server.url) as client:
+                response = await client.get(f"/me/messages/m{index}", headers={"Authorization": "Bearer token"})
+                response.json()
+
+        graph = GraphClient(base_url=server.url)
+
+        async def pooled_client(index: int) -> None:
+            response = await graph.get(f"/me/messages/m{index}", "token")
+            response.json()
+
+        for name, call in (("per-call", per_call_client), ("pooled", pooled_client)):
+            server.reset()
+            started = time.perf_counter()
+            latencies = await _run(call, args.requests, args.concurrency)
+            _report(name, latencies, time.perf_counter() - started, server)
+        await graph.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--connect-delay-ms", type=float, default=30.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+"""
+/health latency while attachments are being parsed: parsing inline on the
+event loop (the previous behaviour) against parse_attachment_file, which
+hashes in a thread and parses in the worker pool
+
+    python -m benchmarks.parse_health [--attachments 8] [--rows 20000]
+
+/health is polled every 10 ms through the ASGI app on the same event loop,
+so any time the loop is blocked shows up as health-check latency.
+"""
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+from typing import List
+
+import httpx
+import openpyxl
+from fastapi import FastAPI
+
+os.environ.setdefault("PARSE_CACHE_DB", os.path.join(tempfile.mkdtemp(prefix="parse-bench-"), "parse_cache.db"))
+
+from app.services import parser  # noqa: E402
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+app = FastAPI()
+
+
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy"}
+
+
+def _workbook(rows: int, label: str) -> bytes:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for index in range(rows):
+        sheet.append([index, f"{label} row {index}", index * 1.5, "lorem ipsum dolor sit amet"])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def _poll_health(stop: asyncio.Event) -> List[float]:
+    """
+    Latency of a /health check due every 10 ms, counted from when it was due,
+    so checks the blocked loop could not even send are included
+    """
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        due = time.perf_counter()
+        while not stop.is_set():
+            response = await client.get("/health")
+            response.raise_for_status()
+            now = time.perf_counter()
+            # Every check that fell due while the loop was blocked waited until now
+            while due <= now:
+                latencies.append(now - due)
+                due += 0.01
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+    return latencies
+
+
+async def _measure(name: str, parse_all) -> None:
+    stop = asyncio.Event()
+    poller = asyncio.create_task(_poll_health(stop))
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    await parse_all()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    latencies = await poller
+    print(
+        f"{name:<8} parse {elapsed:6.2f} s  /health p50 {_percentile(latencies, 0.5) * 1000:7.1f} ms  "
+        f"p99 {_percentile(latencies, 0.99) * 1000:7.1f} ms  max {max(latencies) * 1000:7.1f} ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"Building {args.attachments} workbooks of {args.rows} rows...")
+    files = []
+    for index in range(args.attachments):
+        file = tempfile.NamedTemporaryFile()
+        file.write(_workbook(args.rows, f"attachment {index}"))
+        file.flush()
+        files.append(file)
+
+    async def idle():
+        await asyncio.sleep(1)
+
+    async def inline():
+        for file in files:
+            file.seek(0)
+            parser._parse_content(file, XLSX_CONTENT_TYPE, None, args.rows + 1)
+            # Each attachment would be a separate request; let other work in between
+            await asyncio.sleep(0)
+
+    async def pooled():
+        await asyncio.gather(*[
+            parser.parse_attachment_file(file, XLSX_CONTENT_TYPE, max_chars=None, sample_rows=args.rows + 1)
+            for file in files
+        ])
+
+    await parser.parsing_engine.start()
+    # Warm the worker processes so start-up is not measured
+    await parser.parsing_engine.submit(b"warm-up", "text/plain", None, None)
+    for name, parse_all in (("idle", idle), ("inline", inline), ("pool", pooled)):
+        await _measure(name, parse_all)
+    await parser.parsing_engine.close()
+    for file in files:
+        file.close()
+
+
+if __name__ == "__main__":
+    parser_args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser_args.add_argument("--attachments", type=int, default=8)
+    parser_args.add_argument("--rows", type=int, default=20000)
+    asyncio.run(main(parser_args.parse_args()))
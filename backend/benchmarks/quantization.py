@@ -0,0 +1,86 @@
+"""
+Embedding quantization: memory per vector against recall@10 and queries per
+second for float32, int8 and product quantization at several compressions
+and re-ranking depths
+
+    python -m benchmarks.quantization [--size 100000] [--dimension 1536]
+                                      [--queries 200] [--compressions 8 16 32]
+                                      [--oversampling 1 4 10]
+
+Each configuration indexes the same clustered synthetic vectors in an exact
+EmbeddedVectorStore; recall is measured against a brute-force float32
+top-10. Use the table to pick VECTOR_QUANTIZATION, VECTOR_PQ_COMPRESSION and
+VECTOR_RESCORE_OVERSAMPLING for a tenant.
+"""
+import argparse
+import asyncio
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.services.embedded_index import EmbeddedVectorStore
+from benchmarks.vector_index import LIMIT, _load, _measure, _vectors
+
+
+def _list_bytes(dimension: int) -> int:
+    """Memory of an embedding held as List[float], as on EmailVectorData"""
+    embedding = [float(i) + 0.5 for i in range(dimension)]
+    return sys.getsizeof(embedding) + sum(sys.getsizeof(value) for value in embedding)
+
+
+async def main(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp(prefix="quantization-bench-")
+    try:
+        vectors = _vectors(args.size, args.dimension, rng)
+        queries = vectors[rng.choice(args.size, args.queries, replace=False)] + 0.1 * rng.normal(size=(args.queries, args.dimension)).astype(np.float32)
+        truth = [set(np.argpartition(-(vectors @ query), LIMIT - 1)[:LIMIT].tolist()) for query in queries]
+
+        store = EmbeddedVectorStore(directory, dimension=args.dimension, mode="exact", quantization="none")
+        await _load(store, vectors)
+        await store.close()
+
+        print(f"{args.size} vectors x {args.dimension}")
+        print(f"  {'List[float]':<16} {_list_bytes(args.dimension):6d} bytes/vector")
+        print(f"  {'float32':<16} {args.dimension * 4:6d} bytes/vector")
+        store = EmbeddedVectorStore(directory, dimension=args.dimension, mode="exact", quantization="none")
+        await _measure("float32", store, queries, truth)
+        await store.close()
+
+        configurations = [("int8", None)] + [("pq", compression) for compression in args.compressions]
+        for kind, compression in configurations:
+            # Each configuration trains from scratch
+            for path in glob.glob(os.path.join(directory, "quantizer_*")) + glob.glob(os.path.join(directory, "codes*")):
+                os.remove(path)
+            if compression is not None:
+                settings.VECTOR_PQ_COMPRESSION = compression
+            store = EmbeddedVectorStore(directory, dimension=args.dimension, mode="exact", quantization=kind)
+            started = time.perf_counter()
+            store.build_quantizer()
+            name = kind if compression is None else f"pq x{compression}"
+            print(
+                f"  {name:<16} {store.quantizer.code_size:6d} bytes/vector  "
+                f"(trained and encoded in {time.perf_counter() - started:.1f} s)"
+            )
+            for oversampling in args.oversampling:
+                settings.VECTOR_RESCORE_OVERSAMPLING = oversampling
+                await _measure(f"  rerank x{oversampling:g}", store, queries, truth)
+            await store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=settings.EMBEDDING_DIMENSION)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--compressions", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[1, 4, 10])
+    asyncio.run(main(parser.parse_args()))
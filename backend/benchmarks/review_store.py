@@ -0,0 +1,135 @@
+"""
+Pending reviews: the previous full scan of an in-memory dict against the
+indexed, keyset-paginated query of ReviewStore
+
+    python -m benchmarks.review_store [--reviews 1000000] [--pages 10]
+
+Half of the synthetic reviews are pending, spread over every department,
+sensitivity and privacy flag. The dict scan is the old /review/pending
+filter; the store query returns one REVIEW_PAGE_SIZE page of summaries, and
+"next pages" is the mean of following the cursor --pages more times.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.models.email import Department, EmailAnalysis, EmailContent, EmailReview, ReviewStatus, SensitivityLevel
+from app.services.review_store import ReviewStore
+
+SAVE_BATCH = 10000
+
+FILTERS = [
+    ("(none)", {}),
+    ("department", {"department": Department.FINANCE}),
+    ("department+is_private", {"department": Department.FINANCE, "is_private": False}),
+    ("sensitivity", {"sensitivity": SensitivityLevel.HIGH}),
+]
+
+
+def _reviews(count: int):
+    """Synthetic reviews sharing a pool of content and analysis objects, to keep memory bounded"""
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    contents = [
+        EmailContent(
+            id=f"content-{i}",
+            internet_message_id=f"<content-{i}@example.com>",
+            subject=f"Quarterly report {i}",
+            sender="Alice",
+            sender_email="alice@example.com",
+            recipients=["bob@example.com"],
+            received_date=start + timedelta(minutes=i),
+            body="Please find the figures attached. " * 20,
+            folder_id="inbox",
+            folder_name="Inbox"
+        )
+        for i in range(1000)
+    ]
+    analyses = [
+        EmailAnalysis(
+            sensitivity=sensitivity,
+            department=department,
+            tags=["report"],
+            is_private=is_private,
+            recommended_action="store",
+            summary=f"{department.value} report",
+            key_points=["Figures attached"]
+        )
+        for department in Department
+        for sensitivity in SensitivityLevel
+        for is_private in (False, True)
+    ]
+    for i in range(count):
+        yield EmailReview.model_construct(
+            email_id=f"email-{i}",
+            content=contents[rng.randrange(len(contents))],
+            analysis=analyses[rng.randrange(len(analyses))],
+            status=ReviewStatus.PENDING if rng.random() < 0.5 else rng.choice([ReviewStatus.APPROVED, ReviewStatus.REJECTED]),
+            reviewed_at=None,
+            reviewer_id=None,
+            review_notes=None,
+            duplicate_of=None
+        )
+
+
+def _scan(email_reviews: dict, department=None, sensitivity=None, is_private=None) -> list:
+    """The filter /review/pending ran over the module-level dict"""
+    return [
+        review for review in email_reviews.values()
+        if review.status == ReviewStatus.PENDING
+        and (department is None or review.analysis.department == department)
+        and (sensitivity is None or review.analysis.sensitivity == sensitivity)
+        and (is_private is None or review.analysis.is_private == is_private)
+    ]
+
+
+def main(args: argparse.Namespace) -> None:
+    directory = tempfile.mkdtemp(prefix="review-bench-")
+    try:
+        store = ReviewStore(os.path.join(directory, "reviews.db"))
+        email_reviews = {}
+        started = time.perf_counter()
+        batch = []
+        for review in _reviews(args.reviews):
+            email_reviews[review.email_id] = review
+            batch.append(review)
+            if len(batch) == SAVE_BATCH:
+                store.save_many(batch)
+                batch = []
+        store.save_many(batch)
+        print(f"{args.reviews} reviews (stored in {time.perf_counter() - started:.1f} s)")
+        print(f"  {'filter':<24}{'old dict scan':>16}{'indexed first page':>22}{'next pages':>14}")
+
+        for name, filters in FILTERS:
+            started = time.perf_counter()
+            _scan(email_reviews, **filters)
+            scan = time.perf_counter() - started
+
+            started = time.perf_counter()
+            _, cursor = store.list_summaries(status=ReviewStatus.PENDING, limit=settings.REVIEW_PAGE_SIZE, **filters)
+            first = time.perf_counter() - started
+
+            started = time.perf_counter()
+            pages = 0
+            while cursor and pages < args.pages:
+                _, cursor = store.list_summaries(
+                    status=ReviewStatus.PENDING, limit=settings.REVIEW_PAGE_SIZE, cursor=cursor, **filters
+                )
+                pages += 1
+            following = (time.perf_counter() - started) / max(pages, 1)
+
+            print(f"  {name:<24}{scan * 1000:13.0f} ms{first * 1000:19.1f} ms{following * 1000:11.1f} ms")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reviews", type=int, default=1000000)
+    parser.add_argument("--pages", type=int, default=10)
+    main(parser.parse_args())
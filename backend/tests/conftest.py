@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+# Settings that have no defaults; tests never reach Microsoft or OpenAI
+REQUIRED_SETTINGS = {
+    "JWT_SECRET": "test-secret",
+    "MS_CLIENT_ID": "test-client",
+    "MS_TENANT_ID": "test-tenant",
+    "MS_CLIENT_SECRET": "test-client-secret",
+    "MS_REDIRECT_URI": "http://localhost:8000/auth/callback",
+    "FRONTEND_URL": "http://localhost:5173",
+    "BACKEND_URL": "http://localhost:8000",
+    "OPENAI_API_KEY": "sk-test",
+}
+
+for name, value in REQUIRED_SETTINGS.items():
+    os.environ.setdefault(name, value)
+
+# Module-level stores open their SQLite files on import; keep them out of data/
+DATA_DIR = tempfile.mkdtemp(prefix="ekb-tests-")
+for name, relative in {
+    "DATA_DIR": "",
+    "SYNC_STATE_DB": "sync_state.db",
+    "REVIEW_DB": "reviews.db",
+    "AUDIT_DIR": "audit",
+    "DEDUP_DB": "dedup.db",
+    "ANALYSIS_JOBS_DB": "analysis_jobs.db",
+    "EMBEDDING_CACHE_DB": "embedding_cache.db",
+    "ANALYSIS_CACHE_DB": "analysis_cache.db",
+    "PARSE_CACHE_DB": "parse_cache.db",
+    "LEXICAL_INDEX_DB": "lexical_index.db",
+    "EMBEDDED_INDEX_DIR": "vector_index",
+}.items():
+    os.environ[name] = os.path.join(DATA_DIR, relative)
@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+from app.config import settings
+from app.services import analysis_jobs
+from app.services.analysis_jobs import PENDING, RUNNING, AnalysisJobStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(analysis_jobs, "time", clock)
+    monkeypatch.setattr(settings, "ANALYSIS_LEASE_SECONDS", 60.0)
+    return clock
+
+
+def statuses(store: AnalysisJobStore, job_id: str) -> dict:
+    return dict(store._conn.execute("SELECT email_id, status FROM job_items WHERE job_id = ?", (job_id,)))
+
+
+def test_starting_a_second_process_leaves_live_leases_alone(tmp_path, clock):
+    first = AnalysisJobStore(str(tmp_path / "jobs.db"))
+    job_id = first.create_job("alice", ["e1", "e2", "e3"])
+    assert first.claim(job_id, 2, "process-a") == ["e1", "e2"]
+
+    # Another app process starts against the same file
+    second = AnalysisJobStore(str(tmp_path / "jobs.db"))
+    assert second.requeue_expired() == 0
+    assert statuses(second, job_id) == {"e1": RUNNING, "e2": RUNNING, "e3": PENDING}
+    assert second.claim(job_id, 5, "process-b") == ["e3"]
+
+
+def test_renewed_leases_survive_and_abandoned_ones_are_requeued(tmp_path, clock):
+    store = AnalysisJobStore(str(tmp_path / "jobs.db"))
+    job_id = store.create_job("alice", ["e1", "e2"])
+    store.claim(job_id, 1, "alive")
+    store.claim(job_id, 1, "crashed")
+
+    clock.now += 40
+    store.renew_leases("alive")
+    clock.now += 40
+    assert store.requeue_expired() == 1
+    assert statuses(store, job_id) == {"e1": RUNNING, "e2": PENDING}
+    assert store.claim(job_id, 5, "alive") == ["e2"]
+
+
+def test_running_items_from_before_leases_are_requeued(tmp_path, clock):
+    path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE jobs (job_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, created_at TEXT NOT NULL);
+        CREATE TABLE job_items (
+            job_id TEXT NOT NULL, email_id TEXT NOT NULL, position INTEGER NOT NULL, status TEXT NOT NULL,
+            outcome TEXT, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, updated_at TEXT NOT NULL,
+            PRIMARY KEY (job_id, email_id)
+        );
+        INSERT INTO jobs VALUES ('job', 'alice', '2024-01-01');
+        INSERT INTO job_items (job_id, email_id, position, status, updated_at) VALUES ('job', 'e1', 0, 'running', '2024-01-01');
+        """
+    )
+    conn.commit()
+    conn.close()
+
+    store = AnalysisJobStore(path)
+    assert store.requeue_expired() == 1
+    assert statuses(store, "job") == {"e1": PENDING}
+
+
+def test_complete_many_settles_items_and_releases_their_leases(tmp_path, clock):
+    store = AnalysisJobStore(str(tmp_path / "jobs.db"))
+    job_id = store.create_job("alice", ["e1", "e2", "e3"])
+    store.claim(job_id, 3, "process-a")
+    store.complete_many(job_id, ["e1", "e3"], analysis_jobs.FAILED, error="Email not found")
+
+    assert statuses(store, job_id) == {"e1": analysis_jobs.FAILED, "e2": RUNNING, "e3": analysis_jobs.FAILED}
+    clock.now += 120
+    assert store.requeue_expired() == 1
+    assert not store.is_finished(job_id)
@@ -0,0 +1,106 @@
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+from app.config import settings
+from app.services import audit
+from app.services.audit import AuditLog
+
+
+class Clock(datetime):
+    """datetime whose now() is set by the test"""
+    current = datetime(2024, 1, 15, 9, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit, "datetime", Clock)
+    monkeypatch.setattr(settings, "AUDIT_COMPRESS_AFTER_MONTHS", 2)
+    monkeypatch.setattr(settings, "AUDIT_RETENTION_MONTHS", 0)
+    monkeypatch.setattr(settings, "AUDIT_OPEN_ARCHIVES", 2)
+    return AuditLog(str(tmp_path))
+
+
+def append_at(log: AuditLog, when: datetime, user_id: str, action_type: str = "approve_email") -> None:
+    Clock.current = when
+    log.append(action_type, user_id, resource_id=f"email-{when:%m%d%H}")
+
+
+def test_entries_come_back_newest_first_across_segments(log):
+    for month in (1, 2, 3):
+        for hour in (9, 10):
+            append_at(log, datetime(2024, month, 15, hour), "alice")
+
+    entries = log.query(limit=5)
+    assert [entry["timestamp"][:13] for entry in entries] == [
+        "2024-03-15T10", "2024-03-15T09", "2024-02-15T10", "2024-02-15T09", "2024-01-15T10"
+    ]
+    entries = log.query(start_time=datetime(2024, 2, 1), end_time=datetime(2024, 2, 28))
+    assert [entry["resource_id"] for entry in entries] == ["email-021510", "email-021509"]
+
+
+def test_old_segments_are_compressed_and_still_queried(log, tmp_path):
+    append_at(log, datetime(2024, 1, 10, 9), "alice")
+    append_at(log, datetime(2024, 2, 10, 9), "bob")
+    # The first entry of April closes March; January and February aged out
+    append_at(log, datetime(2024, 3, 10, 9), "carol")
+    append_at(log, datetime(2024, 4, 10, 9), "dave")
+
+    files = set(os.listdir(tmp_path))
+    assert {"audit-2024-01.db.gz", "audit-2024-01.db.filter", "audit-2024-02.db.gz"} <= files
+    assert "audit-2024-01.db" not in files and "audit-2024-03.db" in files
+    assert [entry["user_id"] for entry in log.query()] == ["dave", "carol", "bob", "alice"]
+    assert log.metrics()["compressed_segments"] == 2
+
+
+def test_archives_whose_filter_rules_them_out_are_not_decompressed(log, monkeypatch):
+    append_at(log, datetime(2024, 1, 10, 9), "alice")
+    append_at(log, datetime(2024, 2, 10, 9), "bob", action_type="reject_email")
+    append_at(log, datetime(2024, 4, 10, 9), "carol")
+
+    decompressed = []
+    decompress = log._decompress
+
+    def recording_decompress(month):
+        decompressed.append(month)
+        return decompress(month)
+
+    monkeypatch.setattr(log, "_decompress", recording_decompress)
+    assert [entry["user_id"] for entry in log.query(user_id="alice")] == ["alice"]
+    assert [entry["user_id"] for entry in log.query(action_type="reject_email")] == ["bob"]
+    assert log.query(user_id="nobody") == []
+    # Each archive was opened once, only for the query that could match it
+    assert decompressed == ["2024-01", "2024-02"]
+
+
+def test_appends_do_not_wait_for_an_archive_to_decompress(log, monkeypatch):
+    append_at(log, datetime(2024, 1, 10, 9), "alice")
+    append_at(log, datetime(2024, 3, 10, 9), "bob")
+
+    started, release = threading.Event(), threading.Event()
+    decompress = log._decompress
+
+    def slow_decompress(month):
+        started.set()
+        release.wait(5)
+        return decompress(month)
+
+    monkeypatch.setattr(log, "_decompress", slow_decompress)
+    results = []
+    query = threading.Thread(target=lambda: results.append(log.query(user_id="alice")))
+    query.start()
+    assert started.wait(5)
+    append = threading.Thread(target=append_at, args=(log, datetime(2024, 3, 11, 9), "carol"))
+    append.start()
+    append.join(2)
+    # The append finished while the archive was still being decompressed
+    assert not append.is_alive()
+    release.set()
+    query.join(5)
+    assert [entry["user_id"] for entry in results[0]] == ["alice"]
@@ -0,0 +1,39 @@
+from app.utils import cache
+from app.utils.cache import TieredCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+def test_batched_lookups_fall_back_to_disk_for_memory_misses(tmp_path):
+    path = str(tmp_path / "cache.db")
+    TieredCache(path, 1 << 20, 1 << 20).set_many([("a", b"1"), ("b", b"2")])
+
+    # A fresh process only has the disk tier
+    restarted = TieredCache(path, 1 << 20, 1 << 20)
+    assert restarted.get_many(["a", "b", "c", "a"]) == {"a": b"1", "b": b"2"}
+    assert restarted.get_many(["a"]) == {"a": b"1"}
+    metrics = restarted.metrics()
+    assert (metrics["disk_hits"], metrics["memory_hits"], metrics["misses"]) == (2, 1, 1)
+
+
+def test_expired_entries_are_dropped_and_their_size_released(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    store = TieredCache(str(tmp_path / "cache.db"), 1 << 20, 1 << 20, ttl=60)
+    store.set_many([("old", b"x" * 100)])
+    clock.now += 30
+    store.set_many([("new", b"y" * 10), ("old", b"x" * 50)])
+    assert store.disk.total_bytes == 60
+
+    clock.now += 40
+    store.memory = cache.MemoryLRU(1 << 20)
+    assert store.get_many(["old", "new"]) == {"old": b"x" * 50, "new": b"y" * 10}
+    clock.now += 40
+    assert store.disk.get_many(["old", "new"]) == {}
+    assert store.disk.total_bytes == 0
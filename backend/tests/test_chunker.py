@@ -0,0 +1,23 @@
+import pytest
+
+from app.services.chunker import strip_signature
+
+
+@pytest.mark.parametrize("text", [
+    "Hi Bob,\nThanks for the report.",
+    "Hi Bob,\nThanks for the report.\nIt covers everything we need.\nAlice",
+    "Hi all,\nBest regards to the team in Leeds from everyone here.\nAlice",
+    "Hi Bob,\nThanks,\nplease send the figures by Friday, the auditors are waiting.",
+])
+def test_sentences_starting_with_a_sign_off_word_are_kept(text):
+    assert strip_signature(text) == text
+
+
+@pytest.mark.parametrize("text, body", [
+    ("Hi Bob,\nThe figures are attached.\nThanks,\nAlice", "Hi Bob,\nThe figures are attached."),
+    ("Hi Bob,\nSee below.\n\nBest regards\nMary-Jane O'Neil\nFinance Director\n+44 20 7946 0000", "Hi Bob,\nSee below.\n"),
+    ("Hi Bob,\nDone.\nMany thanks!\nJ. Smith", "Hi Bob,\nDone."),
+    ("Hi Bob,\nDone.\n--\nAlice Example | Acme Ltd", "Hi Bob,\nDone."),
+])
+def test_sign_off_followed_by_a_name_is_cut(text, body):
+    assert strip_signature(text) == body
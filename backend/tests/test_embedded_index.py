@@ -0,0 +1,177 @@
+import asyncio
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.models.email import EmailVectorData
+from app.services.embedded_index import EmbeddedVectorStore
+
+DIMENSION = 16
+
+
+def records(count: int, start: int = 0, seed: int = 0, **metadata):
+    rng = np.random.default_rng(seed)
+    return [
+        EmailVectorData(
+            id=f"v{i}",
+            email_id=f"e{i // 2}",
+            content=f"chunk {i}",
+            metadata={"department": "finance" if i % 2 else "legal", "tags": [f"t{i % 3}"], **metadata},
+            embedding=rng.normal(size=DIMENSION).tolist()
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def test_search_finds_the_nearest_rows_within_filters(tmp_path):
+    async def run():
+        store = EmbeddedVectorStore(str(tmp_path), dimension=DIMENSION, mode="exact", quantization="none")
+        data = records(50)
+        await store.upsert(data)
+
+        hits = await store.search(data[7].embedding, limit=3)
+        assert hits[0]["id"] == "v7" and hits[0]["content"] == "chunk 7"
+        assert abs(hits[0]["score"] - 1.0) < 1e-5
+
+        hits = await store.search(data[7].embedding, limit=50, filters={"department": "legal", "tags": ["t1"]})
+        assert hits and all(int(hit["id"][1:]) % 6 == 4 for hit in hits)
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_deleted_emails_leave_search_and_their_ids_can_return(tmp_path):
+    async def run():
+        store = EmbeddedVectorStore(str(tmp_path), dimension=DIMENSION, mode="exact", quantization="none")
+        data = records(10)
+        await store.upsert(data)
+        await store.delete_by_email_ids(["e3"])
+
+        assert await store.search(data[6].embedding, limit=10, filters={"email_id": "e3"}) == []
+        hits = await store.search(data[6].embedding, limit=10)
+        assert {"v6", "v7"}.isdisjoint(hit["id"] for hit in hits)
+
+        await store.upsert(data[6:7])
+        hits = await store.search(data[6].embedding, limit=1, filters={"email_id": "e3"})
+        assert [hit["id"] for hit in hits] == ["v6"]
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_searches_during_writes_scan_a_consistent_snapshot(tmp_path):
+    async def run():
+        store = EmbeddedVectorStore(str(tmp_path), dimension=DIMENSION, mode="ivf", quantization="none")
+        await store.upsert(records(10))
+        store.build_ivf()
+        query = records(1, seed=1)[0].embedding
+        top_k = store._top_k
+
+        def slow_top_k(*args):
+            # Widen the window in which writes land while a scan is under way
+            time.sleep(0.005)
+            return top_k(*args)
+
+        store._top_k = slow_top_k
+
+        async def write():
+            for batch in range(20):
+                # Crosses the initial capacity, so the column arrays are reallocated mid-search
+                await store.upsert(records(100, start=10 + batch * 100, seed=batch))
+                await asyncio.sleep(0.002)
+
+        async def read():
+            for _ in range(40):
+                await store.search(query, limit=5, filters={"department": "finance"})
+
+        await asyncio.gather(write(), read(), read())
+        assert store.metrics()["live_rows"] == 2010
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_training_runs_in_the_background_not_in_search(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDED_QUANTIZATION_MIN_VECTORS", 100)
+
+    async def run():
+        store = EmbeddedVectorStore(str(tmp_path), dimension=DIMENSION, mode="ivf", quantization="int8")
+        data = records(300)
+        fits = []
+        fit_ivf, fit_quantizer = store._fit_ivf, store._fit_quantizer
+        store._fit_ivf = lambda *args: fits.append("ivf") or fit_ivf(*args)
+        store._fit_quantizer = lambda *args: fits.append("quantizer") or fit_quantizer(*args)
+
+        await store.upsert(data)
+        # Untrained so far: the search is an exact scan and trains nothing itself
+        assert (await store.search(data[3].embedding, limit=1))[0]["id"] == "v3"
+        await store.maintain()
+        assert fits == ["ivf", "quantizer"]
+        assert store.metrics()["quantization"] == "int8" and "code_bytes" in store.metrics()
+
+        # Rows written after training are assigned and encoded on upsert
+        extra = records(5, start=300, seed=9)
+        await store.upsert(extra)
+        for _ in range(3):
+            assert (await store.search(extra[2].embedding, limit=1))[0]["id"] == "v302"
+        assert fits == ["ivf", "quantizer"]
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_compaction_drops_deleted_rows_and_keeps_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDED_COMPACT_MIN_DEAD_ROWS", 10)
+    monkeypatch.setattr(settings, "EMBEDDED_COMPACT_DEAD_RATIO", 0.25)
+    data = records(100)
+
+    async def run():
+        store = EmbeddedVectorStore(str(tmp_path), dimension=DIMENSION, mode="exact", quantization="int8")
+        await store.upsert(data)
+        store.build_quantizer()
+        await store.delete([record.id for record in data[:60:2]])
+        await store.maintain()
+        assert store.metrics()["generation"] == 1
+        assert store.metrics()["rows"] == store.metrics()["live_rows"] == 70
+
+        hits = await store.search(data[41].embedding, limit=1, filters={"tags": ["t2"]})
+        assert hits[0]["id"] == "v41" and hits[0]["email_id"] == "e20"
+        assert await store.search(data[40].embedding, limit=1, filters={"email_id": "e20"}) != []
+        assert all(hit["id"] != "v40" for hit in await store.search(data[40].embedding, limit=5))
+        await store.close()
+
+        # The compacted generation is what a restart opens
+        reopened = EmbeddedVectorStore(str(tmp_path), dimension=DIMENSION, mode="exact", quantization="int8")
+        assert reopened.metrics()["rows"] == 70
+        assert (await reopened.search(data[99].embedding, limit=1))[0]["id"] == "v99"
+        await reopened.close()
+
+    asyncio.run(run())
+
+
+def test_search_reruns_when_compacted_mid_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDED_COMPACT_MIN_DEAD_ROWS", 1_000_000)
+    data = records(40)
+
+    async def run():
+        store = EmbeddedVectorStore(str(tmp_path), dimension=DIMENSION, mode="exact", quantization="none")
+        await store.upsert(data)
+        await store.delete([record.id for record in data[:20]])
+        scans = []
+        top_k = store._top_k
+
+        def compacting_top_k(*args):
+            scans.append(args[0].generation)
+            hits = top_k(*args)
+            if len(scans) == 1:
+                store._compact()
+            return hits
+
+        store._top_k = compacting_top_k
+        hits = await store.search(data[30].embedding, limit=1)
+        assert scans == [0, 1]
+        assert hits[0]["id"] == "v30"
+        await store.close()
+
+    asyncio.run(run())
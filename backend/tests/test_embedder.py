@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from app.config import settings
+from app.services import embedder
+from app.utils.cache import TieredCache
+
+
+class WhitespaceTokenizer:
+    """One token per word, standing in for tiktoken (whose encodings are downloaded)"""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split(" ")
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    """
+    Fake embeddings endpoint: every input containing BAD makes the whole
+    request fail with 400, like an input the API rejects
+    """
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        inputs = json.loads(request.content)["input"]
+        requests.append(inputs)
+        if any("BAD" in text for text in inputs):
+            return httpx.Response(400, json={"error": {"message": "Invalid input", "type": "invalid_request_error"}})
+        return httpx.Response(200, json={
+            "object": "list",
+            "model": settings.EMBEDDING_MODEL,
+            "data": [
+                {"object": "embedding", "index": index, "embedding": [float(len(text)), 1.0]}
+                for index, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}
+        })
+
+    monkeypatch.setattr(embedder, "client", AsyncOpenAI(
+        api_key="sk-test",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    ))
+    monkeypatch.setattr(embedder, "get_tokenizer", WhitespaceTokenizer)
+    monkeypatch.setattr(embedder, "embedding_cache", TieredCache(str(tmp_path / "cache.db"), 1 << 20, 1 << 20))
+    return requests
+
+
+def test_batches_are_packed_by_tokens_and_count(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_BATCH_SIZE", 3)
+    monkeypatch.setattr(settings, "EMBEDDING_MAX_BATCH_TOKENS", 10)
+    assert embedder._pack_batches([4, 4, 4, 1, 1, 1, 1, 12]) == [[0, 1], [2, 3, 4], [5, 6], [7]]
+
+
+def test_long_inputs_are_clamped_to_the_token_limit(api, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_MAX_INPUT_TOKENS", 3)
+    assert embedder._fit_inputs(["one two three four five", "six  seven"]) == [
+        ("one two three", 3),
+        ("six  seven", 3)
+    ]
+
+
+def test_a_rejected_input_fails_alone(api):
+    texts = ["alpha", "beta", "BAD input", "gamma", "delta"]
+    embeddings = asyncio.run(embedder.create_embeddings(texts))
+
+    assert embeddings[2] is None
+    assert [embedding[0] for i, embedding in enumerate(embeddings) if i != 2] == [5.0, 4.0, 5.0, 5.0]
+    # No zero vectors, and the failure is not cached
+    assert not any(embedding == [0.0] * len(embedding) for embedding in embeddings if embedding)
+    assert embedder.embedding_cache.get(embedder._cache_key("BAD input")) is None
+    # The batch was bisected down to the bad input
+    assert api[0] == texts
+    assert ["BAD input"] in api
+    assert len(api) < 2 * len(texts)
+
+
+def test_cached_inputs_skip_the_api(api):
+    asyncio.run(embedder.create_embeddings(["alpha", "beta"]))
+    assert asyncio.run(embedder.create_embeddings(["beta", "alpha", "alpha"])) == [[4.0, 1.0], [5.0, 1.0], [5.0, 1.0]]
+    assert len(api) == 1
+
+
+def test_create_embedding_raises_instead_of_returning_zeros(api):
+    with pytest.raises(RuntimeError):
+        asyncio.run(embedder.create_embedding("BAD query"))
+
+
+def test_cache_hits_do_not_wait_for_the_batch_window(api, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_BATCH_WINDOW_MS", 500.0)
+
+    async def run():
+        await embedder.create_embeddings(["cached query"])
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        embedding = await embedder.create_embedding("cached   query")
+        return embedding, loop.time() - started
+
+    embedding, elapsed = asyncio.run(run())
+    assert embedding == [12.0, 1.0]
+    assert elapsed < 0.1
+    assert len(api) == 1
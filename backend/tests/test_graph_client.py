@@ -0,0 +1,47 @@
+import asyncio
+
+import httpx
+
+from app.services.graph_client import GraphClient
+
+BASE_URL = "https://graph.test/v1.0"
+
+
+def mock_graph(handler) -> GraphClient:
+    """GraphClient whose pooled httpx client answers through handler"""
+    graph = GraphClient(base_url=BASE_URL)
+    graph._client = httpx.AsyncClient(base_url=BASE_URL, transport=httpx.MockTransport(handler))
+    return graph
+
+
+def test_requests_share_the_pooled_client():
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers["Authorization"])
+        return httpx.Response(200, json={"value": []})
+
+    async def run():
+        graph = mock_graph(handler)
+        client = graph.client
+        await graph.get_json("/me/messages", "token-a")
+        await graph.get_json("/me/messages", "token-b")
+        assert graph.client is client
+        await graph.close()
+        assert graph._client is None
+
+    asyncio.run(run())
+    assert seen == ["Bearer token-a", "Bearer token-b"]
+
+
+def test_client_is_rebuilt_after_close():
+    async def run():
+        graph = GraphClient(base_url=BASE_URL)
+        await graph.start()
+        first = graph.client
+        await graph.close()
+        assert first.is_closed
+        assert graph.client is not first
+        await graph.close()
+
+    asyncio.run(run())
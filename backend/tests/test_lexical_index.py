@@ -0,0 +1,38 @@
+from app.models.email import EmailVectorData
+from app.services.lexical_index import LexicalIndex
+
+
+def record(index: int, content: str) -> EmailVectorData:
+    return EmailVectorData(
+        id=f"v{index}",
+        email_id=f"e{index}",
+        content=content,
+        metadata={"chunk_index": 1},
+        embedding=None
+    )
+
+
+def index(tmp_path, **options) -> LexicalIndex:
+    index = LexicalIndex(str(tmp_path / "lexical.db"), **options)
+    index.add_sync([
+        record(0, "invoice overdue"),
+        record(1, "invoice overdue supplier supplier supplier"),
+        record(2, "invoice paid"),
+        record(3, "invoice sent"),
+        record(4, "quarterly report"),
+    ])
+    return index
+
+
+def test_common_terms_count_towards_scores_by_default(tmp_path):
+    # "invoice" is in 4 of 5 documents but still adds to every score
+    results = index(tmp_path).search_sync("invoice supplier", limit=5)
+    ids = [result["id"] for result in results]
+    assert ids[:2] == ["v1", "v0"] and set(ids[2:]) == {"v2", "v3"}
+
+
+def test_skipping_common_terms_is_opt_in(tmp_path):
+    results = index(tmp_path, skip_common_terms=True).search_sync("invoice supplier", limit=5)
+    assert [result["id"] for result in results] == ["v1"]
+    # A query made only of common terms is still answered
+    assert len(index(tmp_path, skip_common_terms=True).search_sync("invoice", limit=5)) == 4
@@ -0,0 +1,18 @@
+import importlib
+
+import msal
+
+
+class OfflineClientApplication:
+    """Stands in for MSAL, which discovers the tenant over the network on construction"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+def test_feature_routers_are_mounted(monkeypatch):
+    monkeypatch.setattr(msal, "ConfidentialClientApplication", OfflineClientApplication)
+    app = importlib.import_module("app.main").app
+    paths = {route.path for route in app.routes}
+    for path in ("/email/analyze", "/review/pending", "/review/bulk-approve", "/vector/search", "/vector/embed"):
+        assert path in paths
@@ -0,0 +1,187 @@
+import asyncio
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import openpyxl
+import pytest
+
+from app.config import settings
+from app.services import parser
+from app.services.parse_pool import ParseTimeoutError, ParsingEngine
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def slow_job(seconds: float) -> str:
+    time.sleep(seconds)
+    return "done"
+
+
+def workbook_bytes(rows: int, label: str) -> bytes:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for index in range(rows):
+        sheet.append([index, f"{label}-{index}"])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def engine():
+    """The shared parser pool, with every submitted source recorded"""
+    submitted = []
+    submit = parser.parsing_engine.submit
+
+    async def recording_submit(source, *args):
+        submitted.append(source if isinstance(source, str) else bytes)
+        if isinstance(source, str):
+            assert os.path.isfile(source)
+        return await submit(source, *args)
+
+    parser.parsing_engine.submit = recording_submit
+    yield submitted
+    del parser.parsing_engine.submit
+    asyncio.run(parser.parsing_engine.close())
+
+
+def test_jobs_run_in_worker_processes():
+    async def run():
+        engine = ParsingEngine(slow_job, workers=1, timeout=5)
+        try:
+            assert await engine.submit(0.01) == "done"
+        finally:
+            await engine.close()
+        assert engine.metrics()["completed"] == 1
+
+    asyncio.run(run())
+
+
+def test_jobs_are_interrupted_after_the_timeout():
+    async def run():
+        engine = ParsingEngine(slow_job, workers=1, timeout=0.2)
+        try:
+            with pytest.raises(ParseTimeoutError):
+                await engine.submit(5)
+        finally:
+            await engine.close()
+        assert engine.metrics()["timeouts"] == 1
+
+    asyncio.run(run())
+
+
+def test_files_on_disk_are_parsed_by_path_and_cached(engine):
+    content = workbook_bytes(50, "on-disk")
+
+    async def run():
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(content)
+            file.seek(0)
+            text = await parser.parse_attachment_file(file, XLSX_CONTENT_TYPE)
+            assert "on-disk-49" in text
+            assert engine == [file.name]
+
+            # Same bytes again: served from the cache without a parse job
+            assert await parser.parse_attachment_file(io.BytesIO(content), XLSX_CONTENT_TYPE) == text
+            assert len(engine) == 1
+
+    asyncio.run(run())
+
+
+def test_small_in_memory_files_are_sent_as_bytes(engine):
+    async def run():
+        text = await parser.parse_attachment_file(io.BytesIO(workbook_bytes(5, "small")), XLSX_CONTENT_TYPE)
+        assert "small-4" in text
+
+    asyncio.run(run())
+    assert engine == [bytes]
+
+
+def test_large_in_memory_files_are_staged_to_disk(engine, monkeypatch):
+    monkeypatch.setattr(settings, "ATTACHMENT_SPOOL_BYTES", 1024)
+    content = workbook_bytes(200, "staged")
+    assert len(content) > 1024
+
+    async def run():
+        with tempfile.SpooledTemporaryFile(max_size=1024) as file:
+            file.write(content)
+            text = await parser.parse_attachment_file(file, XLSX_CONTENT_TYPE)
+        assert "staged-199" in text
+
+    asyncio.run(run())
+    assert len(engine) == 1 and isinstance(engine[0], str)
+    # The staged copy is removed once parsed
+    assert not os.path.exists(engine[0])
+
+
+def test_text_attachments_are_read_up_to_the_bound():
+    async def run():
+        return await parser.parse_attachment_file(io.BytesIO(b"hello " * 100), "text/plain", max_chars=11)
+
+    assert asyncio.run(run()) == "hello hello"
+
+
+def crash_job() -> None:
+    os._exit(1)
+
+
+def test_a_broken_pool_does_not_take_down_its_replacement():
+    async def run():
+        engine = ParsingEngine(crash_job, workers=1, timeout=5)
+        broken = engine.pool
+        replacement = ProcessPoolExecutor(max_workers=1)
+        try:
+            job = asyncio.ensure_future(engine.submit())
+            await asyncio.sleep(0)
+            # Another failed job already swapped in a fresh pool
+            engine._pool = replacement
+            with pytest.raises(BrokenProcessPool):
+                await job
+            assert engine._pool is replacement
+        finally:
+            broken.shutdown(wait=False)
+            await engine.close()
+
+    asyncio.run(run())
+
+
+def pdf_bytes(pages: int, words_per_page: int = 200) -> bytes:
+    """A minimal PDF whose page i reads "p{i}" repeated"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for index in range(pages):
+        text = " ".join([f"p{index}"] * words_per_page).encode()
+        stream = b"BT /F1 4 Tf 10 700 Td (" + text + b") Tj ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 2000 800] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % pages
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def test_bounded_pdf_text_covers_the_whole_document():
+    text = parser.extract_text_bounded(pdf_bytes(30), parser.PDF_CONTENT_TYPE, max_chars=3000, sample_pages=10)
+    assert text.startswith("[Sampled every 3 pages of 30]")
+    # Every sampled page, through to the last one, gets a share of the budget
+    assert all(f"p{index} " in text for index in list(range(0, 30, 3)) + [29])
+    assert "p1 " not in text
+    assert len(text) <= 3000 + len("\n[Truncated]")
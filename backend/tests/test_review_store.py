@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.models.email import EmailAnalysis, EmailContent, EmailReview, ReviewStatus
+from app.services.review_store import ReviewStore
+
+
+def review(index: int, received_date: datetime, department: str = "finance", status: ReviewStatus = ReviewStatus.PENDING) -> EmailReview:
+    return EmailReview(
+        email_id=f"email-{index:03d}",
+        content=EmailContent(
+            id=f"email-{index:03d}",
+            internet_message_id=f"<{index}@example.com>",
+            subject=f"Subject {index}",
+            sender="Alice",
+            sender_email="alice@example.com",
+            recipients=["bob@example.com"],
+            received_date=received_date,
+            body="body",
+            folder_id="inbox",
+            folder_name="Inbox"
+        ),
+        analysis=EmailAnalysis(
+            sensitivity="low",
+            department=department,
+            tags=[],
+            is_private=False,
+            recommended_action="store",
+            summary=f"Summary {index}",
+            key_points=[]
+        ),
+        status=status
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReviewStore(str(tmp_path / "reviews.db"))
+    start = datetime(2024, 1, 1)
+    store.save_many([
+        review(
+            i,
+            # Pairs share a received date, so the email_id tie-break is exercised
+            start + timedelta(hours=i // 2),
+            department="finance" if i % 3 else "legal",
+            status=ReviewStatus.APPROVED if i % 5 == 0 else ReviewStatus.PENDING
+        )
+        for i in range(50)
+    ])
+    return store
+
+
+def all_pages(store: ReviewStore, limit: int, **filters) -> list:
+    pages, cursor = [], None
+    while True:
+        items, cursor = store.list_summaries(status=ReviewStatus.PENDING, limit=limit, cursor=cursor, **filters)
+        pages.append([item.email_id for item in items])
+        if cursor is None:
+            return pages
+
+
+def test_pages_walk_every_match_newest_first_exactly_once(store):
+    pages = all_pages(store, 7, department="finance")
+    expected = sorted(
+        (f"email-{i:03d}" for i in range(50) if i % 3 and i % 5),
+        key=lambda email_id: (int(email_id[6:]) // 2, email_id),
+        reverse=True
+    )
+    assert [email_id for page in pages for email_id in page] == expected
+    assert all(len(page) == 7 for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= 7
+
+
+def test_an_exact_last_page_has_no_next_cursor(store):
+    pending = sum(1 for i in range(50) if i % 5)
+    items, cursor = store.list_summaries(status=ReviewStatus.PENDING, limit=pending)
+    assert len(items) == pending and cursor is None
+
+
+def test_newer_reviews_do_not_shift_later_pages(store):
+    first, cursor = store.list_summaries(status=ReviewStatus.PENDING, limit=10)
+    store.save(review(99, datetime(2030, 1, 1, tzinfo=timezone.utc)))
+    second, _ = store.list_summaries(status=ReviewStatus.PENDING, limit=10, cursor=cursor)
+    assert not {item.email_id for item in first} & {item.email_id for item in second}
+    assert "email-099" not in {item.email_id for item in second}
+    assert max(item.received_date for item in second) <= min(item.received_date for item in first)
+
+
+def test_a_malformed_cursor_is_rejected(store):
+    with pytest.raises(ValueError):
+        store.list_summaries(status=ReviewStatus.PENDING, cursor="not-a-cursor")
+
+
+def test_delete_many_removes_only_known_reviews(store):
+    assert store.delete_many(["email-001", "email-002", "email-002", "unknown"]) == 2
+    assert store.statuses(["email-001", "email-002", "email-003"]).keys() == {"email-003"}
@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.models.email import EmailAnalysis, EmailContent, EmailReview
+from app.services import sync
+from app.services.analysis_jobs import analysis_queue
+from app.services.llm import _failed_analysis
+from app.services.review_store import review_store
+
+BODY = (
+    "Please find attached the quarterly budget review for the supplier contract, "
+    "including the revised deadline and the figures the finance team asked for last week."
+)
+
+
+def email(email_id: str, body: str = BODY) -> EmailContent:
+    return EmailContent(
+        id=email_id,
+        internet_message_id=f"<{email_id}@example.com>",
+        subject="Quarterly budget review",
+        sender="Alice",
+        sender_email="alice@example.com",
+        recipients=["bob@example.com"],
+        received_date=datetime(2024, 3, 1),
+        body=body,
+        folder_id="inbox",
+        folder_name="Inbox"
+    )
+
+
+def test_duplicates_only_match_the_same_users_mail():
+    assert sync.match_duplicates("alice", {"alice-1": email("alice-1")}) == {}
+    # The same message in another user's mailbox is analyzed on its own
+    assert sync.match_duplicates("bob", {"bob-1": email("bob-1")}) == {}
+    assert sync.match_duplicates("alice", {"alice-2": email("alice-2")}) == {"alice-2": "alice-1"}
+    assert sync.match_duplicates("bob", {"bob-2": email("bob-2")}) == {"bob-2": "bob-1"}
+
+
+def test_a_failed_original_analysis_is_not_reused(monkeypatch):
+    analysis = EmailAnalysis(
+        sensitivity="low",
+        department="finance",
+        tags=["budget"],
+        is_private=False,
+        recommended_action="store",
+        summary="Quarterly budget review",
+        key_points=["Revised deadline"]
+    )
+    calls = []
+
+    async def load_attachment_contents(access_token, content):
+        pass
+
+    async def analyze_email_content(content):
+        calls.append(content.id)
+        return analysis
+
+    monkeypatch.setattr(sync, "load_attachment_contents", load_attachment_contents)
+    monkeypatch.setattr(sync, "analyze_email_content", analyze_email_content)
+    review_store.save(EmailReview(email_id="failed-original", content=email("failed-original"), analysis=_failed_analysis()))
+
+    outcome = asyncio.run(sync.analyze_and_store("token", "copy", email("copy"), "failed-original"))
+
+    assert outcome == {"analyzed": 1}
+    assert calls == ["copy"]
+    review = review_store.get("copy")
+    assert review.duplicate_of is None
+    assert review.analysis.summary == "Quarterly budget review"
+
+
+def delta_round(message_ids, removed_ids=()):
+    async def iter_message_delta(access_token, folder_id, delta_link=None, start_date=None):
+        yield {
+            "value": [
+                {"id": message_id, "subject": "New mail", "receivedDateTime": "2024-03-01T09:00:00Z"}
+                for message_id in message_ids
+            ] + [{"id": message_id, "@removed": {"reason": "deleted"}} for message_id in removed_ids],
+            "@odata.deltaLink": "https://graph.test/delta?token=next"
+        }
+    return iter_message_delta
+
+
+def test_delta_link_is_kept_until_the_changes_are_recorded(monkeypatch):
+    monkeypatch.setattr(sync, "iter_message_delta", delta_round(["new-1"]))
+
+    async def failing_submit(user_id, access_token, email_ids):
+        raise RuntimeError("job store unavailable")
+
+    monkeypatch.setattr(analysis_queue, "submit", failing_submit)
+    with pytest.raises(RuntimeError):
+        asyncio.run(sync.sync_folder("token", "carol", "inbox"))
+    # The round is reported again on the next sync
+    assert sync.delta_store.get("carol", "inbox") is None
+
+
+def test_new_mail_is_queued_as_a_persistent_job_before_the_link_is_saved(monkeypatch):
+    review_store.save(EmailReview(email_id="seen", content=email("seen"), analysis=_failed_analysis()))
+    review_store.save(EmailReview(email_id="gone", content=email("gone"), analysis=_failed_analysis()))
+    monkeypatch.setattr(sync, "iter_message_delta", delta_round(["new-1", "seen", "new-2"], removed_ids=["gone"]))
+    removed = []
+
+    class VectorStore:
+        async def delete_by_email_ids(self, email_ids):
+            removed.extend(email_ids)
+
+    monkeypatch.setattr(sync, "get_vector_store", VectorStore)
+
+    changes = asyncio.run(sync.sync_folder("token", "dave", "inbox"))
+
+    job = analysis_queue.store.get_job(changes.analysis_job_id)
+    assert job["user_id"] == "dave" and job["total"] == 2
+    assert not review_store.exists("gone") and removed == ["gone"]
+    assert sync.delta_store.get("dave", "inbox") == "https://graph.test/delta?token=next"
@@ -0,0 +1,165 @@
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services.graph_client import GraphClient
+from app.services.throttle import AdaptiveConcurrencyLimiter, RateGovernor
+
+BASE_URL = "https://graph.test/v1.0"
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "GRAPH_BACKOFF_BASE", 0.001)
+
+
+def mock_graph(handler) -> GraphClient:
+    graph = GraphClient(base_url=BASE_URL)
+    graph._client = httpx.AsyncClient(base_url=BASE_URL, transport=httpx.MockTransport(handler))
+    return graph
+
+
+def access_token(**claims) -> str:
+    """Unsigned JWT-shaped token carrying the given claims"""
+    def segment(data) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii").rstrip("=")
+    return f"{segment({'alg': 'none'})}.{segment(claims)}.signature"
+
+
+def test_limiter_halves_on_throttle_and_grows_additively():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, minimum=1, maximum=32)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.limit == 2
+    for _ in range(3):
+        limiter.on_throttle()
+    assert limiter.limit == 1
+    limiter.on_success()
+    assert limiter.limit == 2
+    limiter.on_success()
+    assert limiter.limit == 2.5
+
+
+def test_429_with_retry_after_backs_off_then_recovers():
+    throttled = 2
+    calls = 0
+    in_flight = 0
+    peak_in_flight = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls, in_flight, peak_in_flight
+        calls += 1
+        if calls <= throttled:
+            return httpx.Response(429, headers={"Retry-After": "0.05"})
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        await asyncio.sleep(0.005)
+        in_flight -= 1
+        return httpx.Response(200, json={"id": "m1"})
+
+    async def run():
+        graph = mock_graph(handler)
+        governor = graph.governor
+        initial = governor.limiter.limit
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        response = await graph.get("/me/messages/m1", "token")
+        assert response.status_code == 200
+        # Both waits honoured Retry-After
+        assert loop.time() - started >= 2 * 0.05
+        assert governor.throttle_events == throttled
+        assert governor.retries == throttled
+        # Two halvings, then one additive step for the success
+        assert governor.limiter.limit < initial / 2
+
+        # Backed off: a burst runs well below the initial concurrency...
+        await asyncio.gather(*[graph.get("/me/messages/m1", "token") for _ in range(int(initial))])
+        assert peak_in_flight < initial
+
+        # ...and sustained success restores it
+        await asyncio.gather(*[graph.get("/me/messages/m1", "token") for _ in range(60)])
+        assert governor.limiter.limit >= initial
+        await graph.close()
+
+    asyncio.run(run())
+
+
+def test_retry_after_pauses_the_mailbox_bucket():
+    governor = RateGovernor()
+    key = governor.mailbox_key("token")
+    governor.record_throttle(key, 2.0)
+    assert governor.bucket_for(key).tokens < 0
+    assert governor.limiter.limit == settings.GRAPH_INITIAL_CONCURRENCY / 2
+
+
+def test_stream_retries_throttled_responses():
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, content=b"attachment bytes")
+
+    async def run():
+        graph = mock_graph(handler)
+        async with graph.stream("/me/messages/m1/attachments/a1/$value", "token") as response:
+            assert response.status_code == 200
+            body = b"".join([chunk async for chunk in response.aiter_bytes()])
+        assert body == b"attachment bytes"
+        assert graph.governor.throttle_events == 1
+        assert graph.governor.retries == 1
+        await graph.close()
+
+    asyncio.run(run())
+
+
+def test_stream_returns_last_response_when_retries_run_out(monkeypatch):
+    monkeypatch.setattr(settings, "GRAPH_MAX_RETRIES", 2)
+
+    async def run():
+        graph = mock_graph(lambda request: httpx.Response(503))
+        async with graph.stream("/me/messages/m1/attachments/a1/$value", "token") as response:
+            assert response.status_code == 503
+        assert graph.governor.retries == 2
+        await graph.close()
+
+    asyncio.run(run())
+
+
+def test_batch_resends_only_throttled_sub_requests():
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        ids = [item["id"] for item in json.loads(request.content)["requests"]]
+        sent.append(ids)
+        return httpx.Response(200, json={"responses": [
+            {"id": item_id, "status": 429 if item_id == "1" and len(sent) == 1 else 200, "headers": {"Retry-After": "0"}}
+            for item_id in ids
+        ]})
+
+    async def run():
+        graph = mock_graph(handler)
+        results = await graph.batch([{"id": str(i), "method": "GET", "url": f"/me/messages/m{i}"} for i in range(3)], "token")
+        assert {item_id: result["status"] for item_id, result in results.items()} == {"0": 200, "1": 200, "2": 200}
+        await graph.close()
+
+    asyncio.run(run())
+    assert sent == [["0", "1", "2"], ["1"]]
+
+
+def test_mailbox_key_follows_the_user_not_the_token():
+    first = access_token(tid="tenant", oid="user-1", uti="a")
+    refreshed = access_token(tid="tenant", oid="user-1", uti="b")
+    other = access_token(tid="tenant", oid="user-2", uti="a")
+    assert RateGovernor.mailbox_key(first) == RateGovernor.mailbox_key(refreshed) == "tenant:user-1"
+    assert RateGovernor.mailbox_key(other) != RateGovernor.mailbox_key(first)
+    # Opaque tokens are still keyed, without keeping the token itself
+    opaque = RateGovernor.mailbox_key("EwBwA8l6BAAU")
+    assert opaque.startswith("token:") and "EwBwA8l6BAAU" not in opaque
@@ -64,6 +64,54 @@ export const getEmailPreviews = async (filterParams: EmailFilter) => {
   }
 };
 
+/**
+ * Stream email previews (NDJSON) while the backend crawls the mailbox.
+ * onPreview is called for every preview as soon as its page arrives.
+ */
+export const streamEmailPreviews = async (
+  filterParams: EmailFilter,
+  onPreview: (preview: EmailPreview) => void,
+  signal?: AbortSignal
+) => {
+  const token = localStorage.getItem('token');
+  const response = await fetch(`${API_BASE_URL}/email/preview/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+    body: JSON.stringify(filterParams),
+    signal,
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Failed to stream email previews: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  const handleLine = (line: string) => {
+    if (!line.trim()) return;
+    const item = JSON.parse(line);
+    if (item.error) {
+      throw new Error(item.error);
+    }
+    onPreview(item as EmailPreview);
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() || '';
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer);
+};
+
 /**
  * Get full content of a specific email
  */
@@ -105,3 +153,29 @@ export const analyzeEmails = async (emailIds: string[]) => {
     throw error;
   }
 };
+
+/**
+ * Forecast tokens, cost and duration of analyzing emails before submitting them
+ */
+export const estimateAnalysis = async (emailIds: string[]) => {
+  try {
+    const response = await api.post('/email/analyze/estimate', emailIds);
+    return response.data;
+  } catch (error) {
+    console.error('Error estimating email analysis:', error);
+    throw error;
+  }
+};
+
+/**
+ * Get progress of an analysis job returned by analyzeEmails
+ */
+export const getAnalysisJob = async (jobId: string) => {
+  try {
+    const response = await api.get(`/email/analyze/jobs/${jobId}`);
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching analysis job:', error);
+    throw error;
+  }
+};
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { EmailReview, EmailApproval } from '../types/email';
+import { EmailApproval, EmailReviewItem, ReviewPage } from '../types/email';
 
 // API base URL from environment variables
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
@@ -25,11 +25,13 @@ api.interceptors.request.use(
 );
 
 /**
- * Get pending email reviews
+ * Get a page of pending review summaries; pass the returned next_cursor as
+ * `cursor` to load the next page. Unchanged pages are revalidated by the
+ * browser with If-None-Match and served from its cache on 304.
  */
-export const getPendingReviews = async (filters: any = {}) => {
+export const getPendingReviews = async (filters: any = {}, cursor?: string): Promise<ReviewPage> => {
   try {
-    const response = await api.get('/review/pending', { params: filters });
+    const response = await api.get('/review/pending', { params: { ...filters, cursor } });
     return response.data;
   } catch (error) {
     console.error('Error getting pending reviews:', error);
@@ -37,6 +39,19 @@ export const getPendingReviews = async (filters: any = {}) => {
   }
 };
 
+/**
+ * Get the full review (email content and analysis) for one email
+ */
+export const getReview = async (emailId: string): Promise<EmailReviewItem> => {
+  try {
+    const response = await api.get(`/review/${emailId}`);
+    return response.data;
+  } catch (error) {
+    console.error('Error getting review:', error);
+    throw error;
+  }
+};
+
 /**
  * Approve or reject an email review
  */
@@ -51,13 +66,15 @@ export const submitReviewDecision = async (emailId: string, approval: EmailAppro
 };
 
 /**
- * Bulk approve or reject email reviews
+ * Bulk approve or reject email reviews in one request. Approved emails are
+ * indexed in the background; poll getIndexingJob with the returned
+ * indexing_job.job_id for progress.
  */
 export const submitBulkReviewDecision = async (emailIds: string[], approval: EmailApproval) => {
   try {
-    const response = await api.post('/review/bulk-decision', {
+    const response = await api.post('/review/bulk-approve', {
       email_ids: emailIds,
-      ...approval
+      approval
     });
     return response.data;
   } catch (error) {
@@ -66,6 +83,19 @@ export const submitBulkReviewDecision = async (emailIds: string[], approval: Ema
   }
 };
 
+/**
+ * Get progress of a background indexing job started by an approval
+ */
+export const getIndexingJob = async (jobId: string) => {
+  try {
+    const response = await api.get(`/review/indexing/${jobId}`);
+    return response.data;
+  } catch (error) {
+    console.error('Error getting indexing job:', error);
+    throw error;
+  }
+};
+
 /**
  * Get review history
  */
@@ -48,6 +48,7 @@ export interface EmailPreview {
 
 export interface EmailFilter {
   folder_id?: string;
+  folder_ids?: string[];
   start_date?: string;
   end_date?: string;
   keywords?: string[];
@@ -100,6 +101,23 @@ export interface EmailReviewItem {
   review_notes?: string;
 }
 
+export interface ReviewSummary {
+  email_id: string;
+  subject: string;
+  sender: string;
+  received_date: string;
+  sensitivity: SensitivityLevel;
+  department: Department;
+  is_private: boolean;
+  summary: string;
+  duplicate_of?: string;
+}
+
+export interface ReviewPage {
+  items: ReviewSummary[];
+  next_cursor?: string;
+}
+
 export interface EmailApproval {
   approved: boolean;
   notes?: string;